@@ -10,12 +10,15 @@ bl_info = {
 	"category": "Import-Export",
 }
 
+from .blender_to_unity_fbx_exporter import auto_export
 from .blender_to_unity_fbx_exporter import properties
 
 def register():
     properties.register()
+    auto_export.register()
 
 def unregister():
+    auto_export.unregister()
     properties.unregister()
 
 if __name__ == "__main__":
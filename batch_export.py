@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Command-line batch exporter.
+#
+# Run with a regular Python interpreter to export many .blend files in parallel:
+#
+#   python batch_export.py tests/ --output exported/ --config options.json --jobs 8
+#
+# Each .blend file is exported by its own `blender --background` worker process, which
+# runs this same script inside Blender. The config file is a JSON object with the options
+# of the Export Unity FBX operator (see blender_to_unity_fbx_exporter/headless.py).
+# Per-file results, timings and failures are collected into a single JSON report.
+
+def find_blend_files(paths):
+    # Returns (blend file, path relative to the input folder) pairs. Files given directly
+    # are relative to their own folder.
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, filenames in os.walk(path):
+                dirs.sort()
+                files.extend((os.path.join(root, filename), os.path.relpath(os.path.join(root, filename), path)) for filename in sorted(filenames) if filename.endswith(".blend"))
+        else:
+            files.append((path, os.path.basename(path)))
+    return files
+
+def get_output_path(relative_path, output):
+    # The folder structure of the inputs is mirrored in the output folder
+    return os.path.join(output, os.path.splitext(relative_path)[0] + ".fbx")
+
+def get_output_paths(files, output):
+    # Output path of each blend file. Fails when two inputs would write the same file.
+    output_paths = dict()
+    for blend_file, relative_path in files:
+        output_path = get_output_path(relative_path, output)
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in output_paths:
+            raise ValueError(f"{blend_file} and {output_paths[key][0]} would both be exported to {output_path}")
+        output_paths[key] = (blend_file, output_path)
+    return list(output_paths.values())
+
+def run_worker(blender, blend_file, output_path, config, timeout):
+    result_path = output_path + ".result.json"
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    command = [blender, "--background", "--factory-startup", blend_file,
+               "--python", os.path.realpath(__file__), "--",
+               "--worker", "--output", output_path, "--result", result_path]
+    if config:
+        command += ["--config", config]
+
+    start = time.perf_counter()
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        log = process.stdout.decode(errors="replace")
+        returncode = process.returncode
+    except subprocess.TimeoutExpired:
+        log = ""
+        returncode = None
+
+    result = dict(blend_file=blend_file, filepath=output_path, status="failed", error=None)
+    try:
+        with open(result_path, "r", encoding="utf-8") as f:
+            result.update(json.load(f))
+        os.remove(result_path)
+    except (OSError, ValueError):
+        if returncode is None:
+            result["error"] = "Timed out after %s seconds" % timeout
+        else:
+            result["error"] = "Blender exited with code %s" % returncode
+            result["log"] = log[-4000:]
+
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+def run_driver(args):
+    try:
+        files = get_output_paths(find_blend_files(args.inputs), args.output)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    print(f"Exporting {len(files)} files with {args.jobs} workers...")
+    start = time.perf_counter()
+
+    results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(run_worker, args.blender, blend_file, output_path, args.config, args.timeout) for blend_file, output_path in files]
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            print(f"[{result['status']}] {result['blend_file']} ({result['process_seconds']:.2f}s)" + (f": {result['error']}" if result["error"] else ""))
+
+    failed = [result for result in results if result["status"] != "ok"]
+    report = dict(
+        files=len(results),
+        failed=len(failed),
+        jobs=args.jobs,
+        seconds=time.perf_counter() - start,
+        results=results,
+    )
+
+    report_path = args.report or os.path.join(args.output, "batch_export_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+
+    print(f"Exported {len(results) - len(failed)} of {len(results)} files in {report['seconds']:.2f}s. Report: {report_path}")
+    return 1 if failed else 0
+
+def run_worker_in_blender(args):
+    # Running inside Blender: export the loaded .blend file
+    sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+    from blender_to_unity_fbx_exporter import headless
+
+    options = dict()
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            options = json.load(f)
+
+    try:
+        result = headless.export_file(args.output, options)
+    except Exception as e:
+        result = dict(filepath=args.output, status="failed", error=str(e))
+
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Export .blend files to Unity FBX in parallel headless Blender processes.")
+    parser.add_argument("inputs", nargs="*", help=".blend files or folders containing them")
+    parser.add_argument("--output", required=True, help="Output folder (worker: output FBX file)")
+    parser.add_argument("--config", help="JSON file with the export options")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of parallel Blender processes")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable")
+    parser.add_argument("--timeout", type=float, default=None, help="Maximum seconds per file")
+    parser.add_argument("--report", help="Report file. Default: batch_export_report.json in the output folder")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    # Inside Blender the script arguments come after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.worker:
+        run_worker_in_blender(args)
+    else:
+        sys.exit(run_driver(args))
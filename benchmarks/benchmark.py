@@ -0,0 +1,380 @@
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+# Export benchmark suite.
+#
+# Run with a regular Python interpreter:
+#
+#   python benchmarks/benchmark.py --repeat 3
+#
+# Each scenario of scenarios.json is a scene generated procedurally inside its own
+# `blender --background` process, which runs this same script and exports the scene with
+# the add-on. Wall time, peak memory and FBX size are appended to a JSON history file and
+# compared with the previous runs. Scenarios of the same series are compared with each other
+# to detect exports whose time grows faster than the number of objects.
+#
+# Scenario keys (all optional except name):
+#   objects          Number of mesh objects
+#   depth            Length of the parent chains the objects are arranged in (1: no hierarchy)
+#   linked_ratio     Fraction of the objects sharing the same mesh (linked duplicates)
+#   modifiers        Number of modifiers in each object
+#   collections      Number of nested collections the objects are distributed into
+#   armatures        Number of armatures, each one with its own skinned mesh
+#   mesh_resolution  Subdivisions of the grid used as mesh
+#   series           Scenarios of the same series are checked for their scaling
+#   options          Export options (see blender_to_unity_fbx_exporter/headless.py)
+
+BENCHMARKS_PATH = os.path.dirname(os.path.realpath(__file__))
+REPOSITORY_PATH = os.path.dirname(BENCHMARKS_PATH)
+
+MODIFIER_TYPES = ('SOLIDIFY', 'BEVEL', 'DISPLACE', 'TRIANGULATE')
+BONES_PER_ARMATURE = 4
+
+# Scene generation (inside Blender)
+
+def create_grid_mesh(name, resolution, size=1.0):
+    import bpy
+
+    step = size / resolution
+    vertices = [(x * step - size / 2, y * step - size / 2, 0.0) for y in range(resolution + 1) for x in range(resolution + 1)]
+    faces = []
+    for y in range(resolution):
+        for x in range(resolution):
+            i = y * (resolution + 1) + x
+            faces.append((i, i + 1, i + resolution + 2, i + resolution + 1))
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(vertices, [], faces)
+    mesh.update()
+    return mesh
+
+def create_collections(count):
+    import bpy
+
+    collections = []
+    for i in range(count):
+        collection = bpy.data.collections.new("Collection_%04d" % i)
+        # Binary tree of nested collections
+        parent = collections[(i - 1) // 2] if i > 0 else bpy.context.scene.collection
+        parent.children.link(collection)
+        collections.append(collection)
+    return collections
+
+def set_random_transform(ob, rng):
+    ob.location = (rng.uniform(-50, 50), rng.uniform(-50, 50), rng.uniform(-50, 50))
+    ob.rotation_euler = (rng.uniform(-math.pi, math.pi), rng.uniform(-math.pi, math.pi), rng.uniform(-math.pi, math.pi))
+    ob.scale = (rng.uniform(0.5, 2),) * 3
+
+def create_armature(index, collection, resolution, rng):
+    import bpy
+
+    armature = bpy.data.armatures.new("Armature_%04d" % index)
+    armature_object = bpy.data.objects.new("Armature_%04d" % index, armature)
+    collection.objects.link(armature_object)
+    set_random_transform(armature_object, rng)
+
+    # Bones can only be created in edit mode
+    bpy.context.view_layer.objects.active = armature_object
+    bpy.ops.object.mode_set(mode='EDIT')
+    parent = None
+    for i in range(BONES_PER_ARMATURE):
+        bone = armature.edit_bones.new("Bone_%d" % i)
+        bone.head = (0, 0, i / BONES_PER_ARMATURE)
+        bone.tail = (0, 0, (i + 1) / BONES_PER_ARMATURE)
+        bone.parent = parent
+        bone.use_connect = parent is not None
+        parent = bone
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    # Skinned mesh: a vertical grid with each row weighted to the nearest bone
+    mesh = create_grid_mesh("Skin_%04d" % index, resolution)
+    mesh.transform(((1, 0, 0, 0), (0, 0, -1, 0), (0, 1, 0, 0.5), (0, 0, 0, 1)))
+    skin = bpy.data.objects.new("Skin_%04d" % index, mesh)
+    collection.objects.link(skin)
+    skin.parent = armature_object
+
+    rows = resolution + 1
+    for i in range(BONES_PER_ARMATURE):
+        group = skin.vertex_groups.new(name="Bone_%d" % i)
+        for row in range(rows):
+            if min(row * BONES_PER_ARMATURE // rows, BONES_PER_ARMATURE - 1) == i:
+                group.add(list(range(row * rows, (row + 1) * rows)), 1.0, 'REPLACE')
+
+    modifier = skin.modifiers.new("Armature", 'ARMATURE')
+    modifier.object = armature_object
+
+    # Give the pose some rotation so the deformation isn't trivial
+    for bone in armature_object.pose.bones:
+        bone.rotation_mode = 'XYZ'
+        bone.rotation_euler = (rng.uniform(-0.5, 0.5), 0, 0)
+
+def generate_scene(scenario):
+    import bpy
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    rng = random.Random(scenario.get("seed", 0))
+
+    count = scenario.get("objects", 100)
+    depth = max(1, scenario.get("depth", 1))
+    linked_ratio = scenario.get("linked_ratio", 0.0)
+    modifiers = scenario.get("modifiers", 0)
+    resolution = scenario.get("mesh_resolution", 8)
+
+    collections = create_collections(scenario.get("collections", 0)) or [bpy.context.scene.collection]
+    shared_mesh = create_grid_mesh("Shared", resolution)
+
+    parent = None
+    for i in range(count):
+        mesh = shared_mesh if rng.random() < linked_ratio else create_grid_mesh("Mesh_%05d" % i, resolution)
+        ob = bpy.data.objects.new("Object_%05d" % i, mesh)
+        collections[i % len(collections)].objects.link(ob)
+        set_random_transform(ob, rng)
+
+        # Objects are arranged in parent chains of the given depth
+        ob.parent = parent if i % depth else None
+        parent = ob
+
+        for j in range(modifiers):
+            modifier_type = MODIFIER_TYPES[j % len(MODIFIER_TYPES)]
+            modifier = ob.modifiers.new(modifier_type.title(), modifier_type)
+            if modifier_type == 'SOLIDIFY':
+                modifier.thickness = 0.05
+            elif modifier_type == 'BEVEL':
+                modifier.width = 0.01
+
+    for i in range(scenario.get("armatures", 0)):
+        create_armature(i, collections[i % len(collections)], resolution, rng)
+
+    bpy.context.view_layer.update()
+
+def get_peak_memory():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_worker_in_blender(args):
+    import bpy
+
+    sys.path.append(REPOSITORY_PATH)
+    from blender_to_unity_fbx_exporter import headless
+
+    scenario = json.loads(args.scenario_json)
+
+    start = time.perf_counter()
+    generate_scene(scenario)
+    generation_seconds = time.perf_counter() - start
+    generation_memory = get_peak_memory()
+
+    result = headless.export_file(args.output, scenario.get("options", dict()))
+    result.update(
+        generation_seconds=generation_seconds,
+        generation_peak_memory_mb=generation_memory,
+        peak_memory_mb=get_peak_memory(),
+        size_bytes=os.path.getsize(args.output) if os.path.exists(args.output) else None,
+        blender_version=bpy.app.version_string,
+    )
+
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+# Driver (regular Python)
+
+def run_scenario(blender, scenario, output, timeout):
+    output_path = os.path.join(output, scenario["name"] + ".fbx")
+    result_path = output_path + ".result.json"
+    command = [blender, "--background", "--factory-startup",
+               "--python", os.path.realpath(__file__), "--",
+               "--worker", "--scenario-json", json.dumps(scenario), "--output", output_path, "--result", result_path]
+
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        log = process.stdout.decode(errors="replace")
+        returncode = process.returncode
+    except subprocess.TimeoutExpired:
+        log = ""
+        returncode = None
+
+    result = dict(status="failed", error=None)
+    try:
+        with open(result_path, "r", encoding="utf-8") as f:
+            result.update(json.load(f))
+        os.remove(result_path)
+    except (OSError, ValueError):
+        if returncode is None:
+            result["error"] = "Timed out after %s seconds" % timeout
+        else:
+            result["error"] = "Blender exited with code %s" % returncode
+            result["log"] = log[-4000:]
+    return result
+
+def get_phase_seconds(report):
+    phases = dict()
+    for phase in (report or dict()).get("phases", []):
+        phases[phase["name"]] = phases.get(phase["name"], 0.0) + phase["seconds"]
+    return phases
+
+def summarize(scenario, results):
+    # The fastest repetition is the least noisy measure of the export time
+    ok = [result for result in results if result["status"] == "ok"]
+    if not ok:
+        return dict(status="failed", error=results[-1]["error"], log=results[-1].get("log"))
+
+    best = min(ok, key=lambda result: result["seconds"])
+    return dict(
+        status="ok",
+        objects=scenario.get("objects", 100) + 2 * scenario.get("armatures", 0),
+        seconds=best["seconds"],
+        peak_memory_mb=max((result["peak_memory_mb"] or 0) for result in ok) or None,
+        export_memory_mb=max(((result["peak_memory_mb"] or 0) - (result["generation_peak_memory_mb"] or 0)) for result in ok),
+        size_bytes=best["size_bytes"],
+        phases=get_phase_seconds(best.get("report")),
+        counters=(best.get("report") or dict()).get("counters", dict()),
+        blender_version=best.get("blender_version"),
+    )
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_PATH, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip() or None
+    except OSError:
+        return None
+
+def load_history(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict(runs=[])
+
+def get_baseline(history, name, window):
+    # Median of the last successful runs of the scenario
+    previous = [run["results"][name] for run in history["runs"] if run["results"].get(name, dict()).get("status") == "ok"][-window:]
+    if not previous:
+        return None
+    baseline = dict()
+    for metric in ("seconds", "peak_memory_mb", "size_bytes"):
+        values = [result[metric] for result in previous if result.get(metric) is not None]
+        if values:
+            baseline[metric] = statistics.median(values)
+    return baseline
+
+def find_regressions(history, results, thresholds, window):
+    regressions = []
+    for name, result in results.items():
+        if result["status"] != "ok":
+            regressions.append("%s: %s" % (name, result["error"]))
+            continue
+        baseline = get_baseline(history, name, window)
+        if baseline is None:
+            continue
+        for metric, threshold in thresholds.items():
+            if result.get(metric) is None or not baseline.get(metric):
+                continue
+            change = result[metric] / baseline[metric] - 1
+            if change > threshold:
+                regressions.append("%s: %s %.4g -> %.4g (+%.0f%%, threshold %.0f%%)" % (name, metric, baseline[metric], result[metric], change * 100, threshold * 100))
+    return regressions
+
+def get_scaling_exponents(scenarios, results):
+    # Least squares slope of log(seconds) over log(objects) for each series.
+    # Linear exports have an exponent of about 1, quadratic ones about 2.
+    series = dict()
+    for scenario in scenarios:
+        result = results.get(scenario["name"])
+        if scenario.get("series") and result and result["status"] == "ok" and result["seconds"] > 0:
+            series.setdefault(scenario["series"], []).append((math.log(result["objects"]), math.log(result["seconds"])))
+
+    exponents = dict()
+    for name, points in series.items():
+        if len(points) < 2:
+            continue
+        mean_x = statistics.mean(x for x, y in points)
+        mean_y = statistics.mean(y for x, y in points)
+        variance = sum((x - mean_x) ** 2 for x, y in points)
+        if variance:
+            exponents[name] = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    return exponents
+
+def run_driver(args):
+    with open(args.scenarios, "r", encoding="utf-8") as f:
+        scenarios = json.load(f)["scenarios"]
+    if args.scenario:
+        scenarios = [scenario for scenario in scenarios if scenario["name"] in args.scenario]
+
+    os.makedirs(args.output, exist_ok=True)
+    history = load_history(args.history)
+
+    results = dict()
+    for scenario in scenarios:
+        runs = [run_scenario(args.blender, scenario, args.output, args.timeout) for i in range(args.repeat)]
+        result = results[scenario["name"]] = summarize(scenario, runs)
+        if result["status"] == "ok":
+            print(f"{scenario['name']}: {result['seconds']:.3f}s, {result['peak_memory_mb'] or 0:.0f} MB, {result['size_bytes'] or 0} bytes")
+        else:
+            print(f"{scenario['name']}: failed: {result['error']}")
+
+    thresholds = dict(seconds=args.time_threshold, peak_memory_mb=args.memory_threshold, size_bytes=args.size_threshold)
+    regressions = find_regressions(history, results, thresholds, args.window)
+
+    exponents = get_scaling_exponents(scenarios, results)
+    for name, exponent in sorted(exponents.items()):
+        print(f"Series {name}: time grows as objects^{exponent:.2f}")
+        if exponent > args.max_exponent:
+            regressions.append("series %s: scaling exponent %.2f (threshold %.2f)" % (name, exponent, args.max_exponent))
+
+    run = dict(
+        date=datetime.datetime.now().isoformat(timespec="seconds"),
+        commit=get_commit(),
+        repeat=args.repeat,
+        results=results,
+        scaling_exponents=exponents,
+        regressions=regressions,
+    )
+    if not args.no_save:
+        history["runs"].append(run)
+        with open(args.history, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=1)
+
+    for regression in regressions:
+        print("REGRESSION", regression)
+    return 1 if regressions else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the Unity FBX export of procedurally generated scenes.")
+    parser.add_argument("--scenarios", default=os.path.join(BENCHMARKS_PATH, "scenarios.json"), help="JSON file with the scenarios")
+    parser.add_argument("--scenario", action="append", help="Only run the scenarios with this name (can be repeated)")
+    parser.add_argument("--history", default=os.path.join(BENCHMARKS_PATH, "history.json"), help="JSON file the results are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Don't append the results to the history")
+    parser.add_argument("--output", default=os.path.join(BENCHMARKS_PATH, "output"), help="Folder for the exported FBX files (worker: output FBX file)")
+    parser.add_argument("--repeat", type=int, default=1, help="Exports per scenario. The fastest one is recorded")
+    parser.add_argument("--window", type=int, default=5, help="Number of previous runs the baseline is the median of")
+    parser.add_argument("--time-threshold", type=float, default=0.2, help="Maximum relative increase of the export time")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="Maximum relative increase of the peak memory")
+    parser.add_argument("--size-threshold", type=float, default=0.05, help="Maximum relative increase of the FBX size")
+    parser.add_argument("--max-exponent", type=float, default=1.5, help="Maximum scaling exponent of the export time in a series")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable")
+    parser.add_argument("--timeout", type=float, default=None, help="Maximum seconds per export")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario-json", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    # Inside Blender the script arguments come after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.worker:
+        run_worker_in_blender(args)
+    else:
+        sys.exit(run_driver(args))
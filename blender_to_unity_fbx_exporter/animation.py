@@ -0,0 +1,140 @@
+import bpy
+import math
+import numpy as np
+
+from . import instrumentation
+from . import journal
+from .instrumentation import logger
+
+# Keyframe reduction.
+# The actions of the exported objects are replaced with reduced copies before writing the
+# FBX file. Each transform channel is sampled on every frame and only the keys needed to
+# stay within the position, rotation or scale tolerance are kept, with linear interpolation
+# between them. The FBX exporter then drops the baked samples lying on those straight
+# segments. Channels are local transforms (object or pose bone), so the X-90 conversion of
+# the root objects and rest data doesn't change their values nor the tolerances.
+
+# Result of the last keyframe reduction, available to scripts
+last_result = dict(kept=0, removed=0)
+
+
+def get_tolerance(data_path, tolerances):
+	position_tolerance, rotation_tolerance, scale_tolerance = tolerances
+	channel = data_path.rpartition(".")[2]
+
+	if channel in {"location", "delta_location"}:
+		return position_tolerance
+	if channel in {"rotation_euler", "delta_rotation_euler"}:
+		return rotation_tolerance
+	if channel in {"rotation_quaternion", "delta_rotation_quaternion", "rotation_axis_angle"}:
+		# Quaternion components change about half the rotation angle
+		return rotation_tolerance / 2
+	if channel in {"scale", "delta_scale"}:
+		return scale_tolerance
+	return None
+
+
+def sample_fcurve(fcurve):
+	# Value of the curve on every frame of its range. Dense curves (a key per frame,
+	# like mocap) are read in bulk. Sparse ones are evaluated frame by frame.
+	points = fcurve.keyframe_points
+	keys = np.empty(len(points) * 2, dtype=np.float64)
+	points.foreach_get("co", keys)
+	keys = keys.reshape(-1, 2)
+
+	start, end = fcurve.range()
+	frames = np.arange(math.ceil(start), math.floor(end) + 1, dtype=np.float64)
+
+	if len(keys) == len(frames) and np.array_equal(keys[:, 0], frames):
+		return frames, keys[:, 1]
+	return frames, np.array([fcurve.evaluate(frame) for frame in frames], dtype=np.float64)
+
+
+def get_reduced_keys(frames, values, tolerance):
+	# Ramer-Douglas-Peucker over the samples. The error of each sample is its difference with
+	# the straight line between the kept keys around it. Returns a mask of the kept samples.
+	keep = np.zeros(len(values), dtype=bool)
+	keep[0] = keep[-1] = True
+	pending = [(0, len(values) - 1)]
+
+	while pending:
+		first, last = pending.pop()
+		if last - first < 2:
+			continue
+
+		t = (frames[first + 1:last] - frames[first]) / (frames[last] - frames[first])
+		errors = np.abs(values[first + 1:last] - (values[first] + t * (values[last] - values[first])))
+		i = int(np.argmax(errors))
+		if errors[i] > tolerance:
+			i += first + 1
+			keep[i] = True
+			pending.append((first, i))
+			pending.append((i, last))
+
+	return keep
+
+
+def reduce_fcurve(fcurve, tolerance):
+	# Returns the number of keys before and after the reduction
+	count = len(fcurve.keyframe_points)
+	frames, values = sample_fcurve(fcurve)
+	if len(frames) < 3:
+		return count, count
+
+	keep = get_reduced_keys(frames, values, tolerance)
+	kept = int(np.count_nonzero(keep))
+	if kept >= count:
+		return count, count
+
+	co = np.empty(kept * 2, dtype=np.float64)
+	co[0::2] = frames[keep]
+	co[1::2] = values[keep]
+	linear = bpy.types.Keyframe.bl_rna.properties["interpolation"].enum_items["LINEAR"].value
+
+	points = fcurve.keyframe_points
+	points.clear()
+	points.add(kept)
+	points.foreach_set("co", co)
+	points.foreach_set("interpolation", np.full(kept, linear, dtype=np.int32))
+	fcurve.update()
+
+	return count, kept
+
+
+def reduce_keyframes(objects, position_tolerance, rotation_tolerance, scale_tolerance):
+	# Replace the action of each object with a reduced copy. Actions shared by several
+	# objects are reduced once. The original actions are restored by the journal.
+	global last_result
+
+	tolerances = (position_tolerance, rotation_tolerance, scale_tolerance)
+	reduced_actions = dict()
+	total = 0
+	kept = 0
+
+	for ob in objects:
+		if not ob.animation_data or not ob.animation_data.action:
+			continue
+
+		action = ob.animation_data.action
+		if action not in reduced_actions:
+			reduced = reduced_actions[action] = journal.add_created(action.copy())
+
+			for fcurve in reduced.fcurves:
+				tolerance = get_tolerance(fcurve.data_path, tolerances)
+				# Curves with modifiers (noise, cycles...) are left as they are
+				if tolerance is None or fcurve.modifiers:
+					count = len(fcurve.keyframe_points)
+					total += count
+					kept += count
+					continue
+
+				before, after = reduce_fcurve(fcurve, tolerance)
+				total += before
+				kept += after
+
+		journal.set_attribute(ob.animation_data, "action", reduced_actions[action])
+
+	last_result = dict(kept=kept, removed=total - kept)
+	instrumentation.count("keys_kept", kept)
+	instrumentation.count("keys_removed", total - kept)
+	logger.info("Keyframe reduction: %d keys kept, %d removed", kept, total - kept)
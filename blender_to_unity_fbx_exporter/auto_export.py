@@ -0,0 +1,235 @@
+import bpy
+import os
+from bpy.app.handlers import persistent # type: ignore
+from bpy.props import StringProperty, BoolProperty, EnumProperty, PointerProperty # type: ignore
+from bpy.types import Panel, PropertyGroup # type: ignore
+
+from . import export
+from . import manifest
+from .instrumentation import logger
+
+# Auto export on save.
+# Changes made to the scene are tracked by ID while the option is enabled. When the file is
+# saved, the export units (root objects or collections) depending on changed IDs are exported
+# again in a deferred step, so saving isn't blocked. Units whose file doesn't exist yet are
+# exported too.
+
+# IDs changed since the last export, as (type name, name)
+dirty_ids = set()
+
+# Changes made by the export itself are not tracked
+exporting = False
+
+# These IDs are updated all the time (frame changes, selection...) and don't affect the units
+IGNORED_ID_TYPES = (bpy.types.Scene, bpy.types.WorkSpace, bpy.types.Screen, bpy.types.WindowManager)
+
+
+class UnityFbxAutoExportSettings(PropertyGroup):
+	enabled: BoolProperty(
+		name="Auto Export",
+		description="Export the changed units to Unity FBX files when the file is saved",
+		default=False,
+	) # type: ignore
+
+	directory: StringProperty(
+		name="Folder",
+		description="Folder the FBX files are written to",
+		default="//",
+		subtype='DIR_PATH',
+	) # type: ignore
+
+	unit_mode: EnumProperty(
+		name="Units",
+		description="Objects exported to each FBX file",
+		items=(('ROOT_OBJECT', "By Root Object", "One FBX file per root object and its children, named after the object"),
+				('COLLECTION', "By Collection", "One FBX file per top-level collection, named after the collection"),
+		),
+		default='ROOT_OBJECT',
+	) # type: ignore
+
+	export_collections_as_empties: BoolProperty(
+		name="Export Collections as Empties",
+		default=False,
+	) # type: ignore
+
+	include_custom_properties: BoolProperty(
+		name="Include Custom Properties",
+		default=False,
+	) # type: ignore
+
+	tangent_space: BoolProperty(
+		name="Export tangents",
+		default=False,
+	) # type: ignore
+
+	triangulate_faces: BoolProperty(
+		name="Triangulate Faces",
+		default=False,
+	) # type: ignore
+
+	keep_shared_data: BoolProperty(
+		name="Keep Shared Data",
+		default=False,
+	) # type: ignore
+
+
+class UNITYFBX_PT_auto_export(Panel):
+	bl_label = "Unity FBX Auto Export"
+	bl_space_type = 'PROPERTIES'
+	bl_region_type = 'WINDOW'
+	bl_context = "scene"
+	bl_options = {'DEFAULT_CLOSED'}
+
+	def draw_header(self, context):
+		self.layout.prop(context.scene.unity_fbx_auto_export, "enabled", text="")
+
+	def draw(self, context):
+		settings = context.scene.unity_fbx_auto_export
+		layout = self.layout
+		layout.active = settings.enabled
+
+		layout.prop(settings, "directory")
+		layout.prop(settings, "unit_mode")
+		layout.prop(settings, "export_collections_as_empties", text="Export Collections", icon='EMPTY_AXIS')
+		layout.prop(settings, "include_custom_properties", text="Custom Properties", icon='SCRIPT')
+		layout.prop(settings, "tangent_space", text="Use Tangent Space", icon='NORMALS_VERTEX')
+		layout.prop(settings, "triangulate_faces", text="Triangulate Faces", icon='MESH_ICOSPHERE')
+		layout.prop(settings, "keep_shared_data", text="Keep Shared Data", icon='LINKED')
+
+		if settings.enabled:
+			layout.label(text="%d changes pending" % len(dirty_ids), icon='FILE_REFRESH')
+
+
+def get_key(id_data):
+	return (type(id_data).__name__, id_data.name)
+
+
+def get_unit_dependencies(objects):
+	# IDs whose changes affect the exported file. Instanced collections and modifier targets
+	# are followed like in the incremental export fingerprint.
+	keys = set()
+	for ob in manifest.with_dependencies(objects):
+		keys.add(get_key(ob))
+		if ob.data:
+			keys.add(get_key(ob.data))
+		for slot in ob.material_slots:
+			if slot.material:
+				keys.add(get_key(slot.material))
+		for col in ob.users_collection:
+			keys.add(get_key(col))
+		if ob.instance_type == 'COLLECTION' and ob.instance_collection:
+			keys.add(get_key(ob.instance_collection))
+	return keys
+
+
+def get_context_override(context):
+	# Timers run without a window in the context, which the export needs for the selection.
+	# The first window is used, with its 3D viewport if any.
+	window = next(iter(context.window_manager.windows), None)
+	if window is None:
+		return dict()
+	area = next((area for area in window.screen.areas if area.type == 'VIEW_3D'), window.screen.areas[0] if window.screen.areas else None)
+	return dict(window=window, screen=window.screen, area=area)
+
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+	if exporting or export.running or not scene.unity_fbx_auto_export.enabled:
+		return
+
+	for update in depsgraph.updates:
+		id_data = update.id.original
+		if not isinstance(id_data, IGNORED_ID_TYPES):
+			dirty_ids.add(get_key(id_data))
+
+
+@persistent
+def on_save_post(filepath):
+	if bpy.context.scene.unity_fbx_auto_export.enabled and not bpy.app.timers.is_registered(run_auto_export):
+		bpy.app.timers.register(run_auto_export, first_interval=0.1)
+
+
+@persistent
+def on_load_post(filepath):
+	dirty_ids.clear()
+
+
+def run_auto_export():
+	# Deferred after saving. Returns None so the timer runs only once, or the seconds until
+	# the next attempt.
+	global exporting
+
+	context = bpy.context
+	settings = context.scene.unity_fbx_auto_export
+	if not settings.enabled:
+		return None
+
+	# Try again later while a modal export is in progress
+	if export.running:
+		return 1.0
+
+	directory = bpy.path.abspath(settings.directory)
+	objects = export.get_export_objects(context, False, False)
+	units = export.get_batch_units(context, objects, settings.unit_mode, "")
+
+	names = set()
+	for name, unit_objects in units:
+		if not os.path.exists(os.path.join(directory, bpy.path.clean_name(name) + ".fbx")) or not dirty_ids.isdisjoint(get_unit_dependencies(unit_objects)):
+			names.add(name)
+
+	if names:
+		logger.info("Auto export: %d of %d units changed", len(names), len(units))
+		os.makedirs(directory, exist_ok=True)
+
+		exporting = True
+		try:
+			with context.temp_override(**get_context_override(context)):
+				export.export_unity_fbx(context,
+					os.path.join(directory, bpy.path.clean_name(context.scene.name) + ".fbx"),
+					False,
+					False,
+					settings.export_collections_as_empties,
+					settings.include_custom_properties,
+					settings.tangent_space,
+					settings.triangulate_faces,
+					False,
+					False,
+					'Y',
+					'X',
+					keep_shared_data=settings.keep_shared_data,
+					batch_mode=settings.unit_mode,
+					only_units=names
+				)
+			# Evaluate the changes made while exporting, so they're not tracked
+			context.view_layer.update()
+		finally:
+			exporting = False
+
+		if export.last_error:
+			logger.error("Auto export failed: %s", export.last_error)
+			return None
+
+	dirty_ids.clear()
+	return None
+
+
+def register():
+	bpy.utils.register_class(UnityFbxAutoExportSettings)
+	bpy.utils.register_class(UNITYFBX_PT_auto_export)
+	bpy.types.Scene.unity_fbx_auto_export = PointerProperty(type=UnityFbxAutoExportSettings)
+
+	bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+	bpy.app.handlers.save_post.append(on_save_post)
+	bpy.app.handlers.load_post.append(on_load_post)
+
+
+def unregister():
+	for handlers, handler in ((bpy.app.handlers.depsgraph_update_post, on_depsgraph_update), (bpy.app.handlers.save_post, on_save_post), (bpy.app.handlers.load_post, on_load_post)):
+		if handler in handlers:
+			handlers.remove(handler)
+	if bpy.app.timers.is_registered(run_auto_export):
+		bpy.app.timers.unregister(run_auto_export)
+
+	del bpy.types.Scene.unity_fbx_auto_export
+	bpy.utils.unregister_class(UNITYFBX_PT_auto_export)
+	bpy.utils.unregister_class(UnityFbxAutoExportSettings)
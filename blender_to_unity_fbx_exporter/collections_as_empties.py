@@ -1,93 +1,75 @@
 import bpy
 
-def create_empties_as_collection_proxy(use_selection=False):
-    def create_empty_for_collection(collection):
-        print(f"Creating empty for collection: {collection.name}")
-        # Create an empty object for the collection
-        empty = bpy.data.objects.new(f"Collection: {collection.name}", None)
-        bpy.context.scene.collection.objects.link(empty)
-        return empty
+from . import journal
+from .instrumentation import logger
 
-    def parent_selected_objects_to_empty(collection, empty):
-        # Parent only selected objects in the collection to the empty
-        print(f"Parenting selected object to {collection.name}")
-        for obj in collection.objects:
-            if obj.select_get():
-                obj.parent = empty
+def get_collection_parents(layer_collection):
+    # Parent of each collection included in the view layer, gathered in a single walk.
+    # Excluded collections and their children aren't exported.
+    parents = {}
+    pending = [layer_collection]
 
-    def parent_collection_objects_to_empty(collection, empty):
-        # Parent all objects in the collection to the empty (used when not using selection)
-        print(f"Parenting all objects to {collection.name}")
-        for obj in collection.objects:
-            obj.parent = empty
+    while pending:
+        layer_col = pending.pop()
+        for child in layer_col.children:
+            if not child.exclude:
+                parents[child.collection] = layer_col.collection
+                pending.append(child)
 
-    def get_collections_with_selected_objects():
-        # Collect the collections that contain at least one selected object
-        selected_collections = set()
-        for obj in bpy.context.selected_objects:
-            for col in obj.users_collection:
-                selected_collections.add(col)
-        return selected_collections
-    
-    def add_empty_to_collection(collection, empty):
-        # Add the empty to the collection
-        collection.objects.link(empty)
+    return parents
 
+def create_empties_as_collection_proxy(use_selection=False):
+    # Each collection is represented by an empty, parented to the empty of its parent collection.
+    # Root objects in the collection are parented to its empty.
+    # The whole proxy hierarchy is built in a single pass over the collections and their objects.
+    scene_collection = bpy.context.scene.collection
+    parents = get_collection_parents(bpy.context.view_layer.layer_collection)
 
-    # Get a list of our collections to process.
+    # Get the collections to process.
     if use_selection:
-        collections_to_process = get_collections_with_selected_objects()
+        # Only the collections that contain at least one selected object
+        selected_objects = set(bpy.context.selected_objects)
+        collections_to_process = {}
+        for obj in selected_objects:
+            for col in obj.users_collection:
+                if col in parents:
+                    collections_to_process[col] = None
     else:
-        collections_to_process = bpy.context.scene.collection.children_recursive
-    
+        selected_objects = None
+        collections_to_process = parents
+
+    # Create an empty object for each collection
     collection_proxy_dict = {}
-    empties = []
-    
     for collection in collections_to_process:
-        # Create an empty for the collection
-        empty = create_empty_for_collection(collection)
-        empties.append(empty)
-        collection_proxy_dict[collection] = empty
-        
-        if use_selection:
-            # Parent only selected objects in the collection to the empty
-            parent_selected_objects_to_empty(collection, empty)
-        else:
-            # Parent all objects in the collection to the empty (used when not using selection)
-            parent_collection_objects_to_empty(collection, empty)
-        
-    # iterate the dictionary to parent the empties to the collection
-    for collection, empty in collection_proxy_dict.items():
-        collection_children = collection.children
-        
-        for child in collection_children:
-            # check if it exists in teh dict
-            if child in collection_proxy_dict:
-                # parent the empty to the collection
-                child_empty = collection_proxy_dict[child]
-                print(f"Found {child_empty.name} is a child of {empty.name}")
-                child_empty.parent = empty
-                
-        # add the empty to the collection
-        add_empty_to_collection(collection, empty) if empty else None
-                
-    if use_selection:
-         # Select the empties
-            for empty in collection_proxy_dict.values():
-                empty.select_set(True)
-        
+        collection_proxy_dict[collection] = bpy.data.objects.new(f"Collection: {collection.name}", None)
 
-    # Return the created empties for reference
-    return empties
+    # Created empties are removed all at once when the journal restores the scene
+    empties = list(collection_proxy_dict.values())
+    journal.add_created_list(empties)
+    logger.debug("Created %d collection empties", len(empties))
+
+    parented_objects = set()
+
+    for collection, empty in collection_proxy_dict.items():
+        scene_collection.objects.link(empty)
+        collection.objects.link(empty)
 
-def remove_empties(empties):
-    print("Removing empties")
-    for empty in list(empties):  # Create a copy of the list to iterate over
-        if empty.name in bpy.data.objects:  # Check by object name
-            bpy.data.objects.remove(empty, do_unlink=True)
-            
-            
-    
+        # Parent the empty to the empty of the parent collection, if any
+        parent_empty = collection_proxy_dict.get(parents[collection])
+        if parent_empty:
+            empty.parent = parent_empty
 
+        # Parent the root objects in the collection to the empty (only the selected ones when
+        # using selection). Children keep their parent, objects in several collections are
+        # parented to the first one.
+        for obj in collection.objects:
+            if obj.parent is None and obj is not empty and obj not in parented_objects:
+                if selected_objects is None or obj in selected_objects:
+                    journal.set_attribute(obj, "parent", empty)
+                    parented_objects.add(obj)
 
+        if use_selection:
+            empty.select_set(True)
 
+    # Return the created empties for reference
+    return empties
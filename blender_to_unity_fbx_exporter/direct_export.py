@@ -0,0 +1,521 @@
+import bpy
+import mathutils
+import array
+import math
+import numpy as np
+
+from . import export
+from . import instrumentation
+from .instrumentation import logger
+
+# Non-destructive export engine.
+# Instead of modifying the scene and restoring it afterwards, the converted transforms and
+# geometry are computed in memory out of the evaluated depsgraph and written straight to
+# the FBX file. The scene is never modified, so read-only and linked library files are safe.
+#
+# The file is written with the binary encoder of Blender's built-in FBX exporter. Only
+# static hierarchies of empties and meshes are supported. Anything else falls back to the
+# default engine, see get_unsupported_reason.
+
+# Fixed values used by Blender's FBX exporter, so the output matches the default engine
+FBX_VERSION = 7400
+FBX_HEADER_VERSION = 1003
+FBX_SCENEINFO_VERSION = 100
+FBX_GEOMETRY_VERSION = 124
+FBX_GEOMETRY_NORMAL_VERSION = 101
+FBX_GEOMETRY_UV_VERSION = 101
+FBX_GEOMETRY_MATERIAL_VERSION = 101
+FBX_GEOMETRY_LAYER_VERSION = 100
+FBX_MODELS_VERSION = 232
+FBX_MATERIAL_VERSION = 102
+FBX_FILE_ID = b'\x28\xb3\x2a\xeb\xb6\x24\xcc\xc2\xbf\xc8\xb0\x2a\xa9\x2b\xfc\xf1'
+FBX_CREATION_TIME = "1970-01-01 10:00:00:000"
+
+# Blender Z-up to FBX Y-up (-Z forward) conversion, applied to root objects only
+MATRIX_AXIS_CONVERSION = mathutils.Matrix(((1, 0, 0, 0), (0, 0, 1, 0), (0, -1, 0, 0), (0, 0, 0, 1)))
+
+# Object types converted to meshes by the default engine
+GEOMETRY_TYPES = {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}
+
+
+def get_unsupported_reason(objects, export_collections_as_empties, tangent_space):
+	# Returns why the given export can't be written by this engine, or None if it can
+	if export_collections_as_empties:
+		return "collections as empties"
+	if tangent_space:
+		return "tangent space"
+
+	for ob in objects:
+		if ob.type == 'ARMATURE' or any(mod.type == 'ARMATURE' for mod in ob.modifiers):
+			return f"armature in {ob.name}"
+		if ob.animation_data and (ob.animation_data.action or ob.animation_data.nla_tracks):
+			return f"animation in {ob.name}"
+		if ob.instance_type != 'NONE':
+			return f"instancing in {ob.name}"
+		if ob.parent_type != 'OBJECT':
+			return f"{ob.parent_type.lower()} parenting in {ob.name}"
+		if ob.type == 'MESH' and (ob.data.shape_keys or ob.data.color_attributes):
+			return f"shape keys or color attributes in {ob.name}"
+
+	return None
+
+
+def rotate_vectors(vectors):
+	# Bake the pure X-90 rotation into a flat array of 3D vectors: (x, y, z) -> (x, z, -y)
+	vectors = vectors.reshape(-1, 3)
+	rotated = np.empty_like(vectors)
+	rotated[:, 0] = vectors[:, 0]
+	rotated[:, 1] = vectors[:, 2]
+	rotated[:, 2] = -vectors[:, 1]
+	return rotated
+
+
+def to_float64_array(values):
+	return array.array('d', np.ascontiguousarray(values, dtype=np.float64).tobytes())
+
+
+def to_int32_array(values):
+	return array.array('i', np.ascontiguousarray(values, dtype=np.int32).tobytes())
+
+
+def read_mesh_buffers(mesh, triangulate):
+	# Read the mesh in bulk with foreach_get, already converted to the X-90 space
+	vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+	mesh.vertices.foreach_get("co", vertices)
+
+	loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+	mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+	# Blender 4.1+ exposes corner normals directly
+	loop_normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+	if hasattr(mesh, "corner_normals"):
+		mesh.corner_normals.foreach_get("vector", loop_normals)
+	else:
+		mesh.calc_normals_split()
+		mesh.loops.foreach_get("normal", loop_normals)
+
+	polygon_materials = np.empty(len(mesh.polygons), dtype=np.int32)
+	mesh.polygons.foreach_get("material_index", polygon_materials)
+
+	if triangulate:
+		mesh.calc_loop_triangles()
+		loops = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+		mesh.loop_triangles.foreach_get("loops", loops)
+		triangle_polygons = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+		mesh.loop_triangles.foreach_get("polygon_index", triangle_polygons)
+		polygon_ends = np.arange(2, len(loops), 3)
+		polygon_materials = polygon_materials[triangle_polygons]
+	else:
+		loops = np.arange(len(mesh.loops), dtype=np.int32)
+		loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+		mesh.polygons.foreach_get("loop_total", loop_totals)
+		polygon_ends = np.cumsum(loop_totals) - 1
+
+	# Last vertex of each polygon is stored as a negative index (bitwise not)
+	polygon_vertices = loop_vertices[loops]
+	polygon_vertices[polygon_ends] = ~polygon_vertices[polygon_ends]
+
+	uv_layers = []
+	for uv_layer in mesh.uv_layers:
+		uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+		uv_layer.data.foreach_get("uv", uvs)
+		unique_uvs, uv_indices = np.unique(uvs.reshape(-1, 2)[loops], axis=0, return_inverse=True)
+		uv_layers.append((uv_layer.name, unique_uvs, uv_indices.reshape(-1)))
+
+	return dict(
+		vertices=rotate_vectors(vertices),
+		polygon_vertices=polygon_vertices,
+		normals=rotate_vectors(loop_normals)[loops],
+		materials=polygon_materials,
+		uv_layers=uv_layers,
+	)
+
+
+def get_converted_world_matrices(objects, depsgraph):
+	# Converted world matrix of each object: the geometry receives an X-90 rotation,
+	# so the object receives an X+90 rotation to preserve its visual pose.
+	return {ob: ob.evaluated_get(depsgraph).matrix_world @ export.MATRIX_X_PLUS_90 for ob in objects}
+
+
+def get_fbx_matrix(ob, world_matrices):
+	# Root objects get the global axis conversion, children are relative to their parent.
+	# Objects whose parent isn't exported become root objects.
+	if ob.parent in world_matrices:
+		return world_matrices[ob.parent].inverted_safe() @ world_matrices[ob]
+	return MATRIX_AXIS_CONVERSION @ world_matrices[ob]
+
+
+def get_unit_scale(scene):
+	# FBX_SCALE_UNITS: FBX units are centimeters, scenes without units aren't scaled
+	units = scene.unit_settings
+	if units.system == 'NONE':
+		return 1.0
+	return 100.0 * units.scale_length
+
+
+class FbxWriter:
+	def __init__(self, fbx_utils, encode_bin):
+		self.fbx_utils = fbx_utils
+		self.encode_bin = encode_bin
+		self.root = encode_bin.FBXElem(b"")
+		self.objects = None
+		self.connections = []
+		self.counts = dict()
+		self.videos = dict()
+
+	def uid(self, key):
+		return self.fbx_utils.get_fbx_uuid_from_key(key)
+
+	def name_class(self, name, cls):
+		return self.fbx_utils.fbx_name_class(name.encode(), cls)
+
+	def add_object(self, element_type, key, name, cls, subtype):
+		uid = self.uid(key)
+		elem = self.fbx_utils.elem_data_single_int64(self.objects, element_type, uid)
+		elem.add_string(self.name_class(name, cls))
+		elem.add_string(subtype)
+		self.counts[element_type] = self.counts.get(element_type, 0) + 1
+		return uid, elem
+
+	def connect(self, child_uid, parent_uid, prop=None):
+		self.connections.append((child_uid, parent_uid, prop))
+
+	def write_header(self, scene, filepath):
+		fu = self.fbx_utils
+		header_ext = fu.elem_empty(self.root, b"FBXHeaderExtension")
+		fu.elem_data_single_int32(header_ext, b"FBXHeaderVersion", FBX_HEADER_VERSION)
+		fu.elem_data_single_int32(header_ext, b"FBXVersion", FBX_VERSION)
+		fu.elem_data_single_int32(header_ext, b"EncryptionType", 0)
+
+		elem = fu.elem_empty(header_ext, b"CreationTimeStamp")
+		for name, value in ((b"Version", 1000), (b"Year", 1970), (b"Month", 1), (b"Day", 1), (b"Hour", 10), (b"Minute", 0), (b"Second", 0), (b"Millisecond", 0)):
+			fu.elem_data_single_int32(elem, name, value)
+
+		creator = "Blender (stable FBX IO) - %s - Unity FBX" % bpy.app.version_string
+		fu.elem_data_single_string_unicode(header_ext, b"Creator", creator)
+
+		# 'SceneInfo' seems mandatory to get a valid FBX file
+		scene_info = fu.elem_data_single_string(header_ext, b"SceneInfo", fu.fbx_name_class(b"GlobalInfo", b"SceneInfo"))
+		scene_info.add_string(b"UserData")
+		fu.elem_data_single_string(scene_info, b"Type", b"UserData")
+		fu.elem_data_single_int32(scene_info, b"Version", FBX_SCENEINFO_VERSION)
+		meta_data = fu.elem_empty(scene_info, b"MetaData")
+		fu.elem_data_single_int32(meta_data, b"Version", FBX_SCENEINFO_VERSION)
+		for name in (b"Title", b"Subject", b"Author", b"Keywords", b"Revision", b"Comment"):
+			fu.elem_data_single_string(meta_data, name, b"")
+		props = fu.elem_properties(scene_info)
+		fu.elem_props_set(props, "p_string_url", b"DocumentUrl", filepath)
+		fu.elem_props_set(props, "p_string_url", b"SrcDocumentUrl", filepath)
+
+		fu.elem_data_single_bytes(self.root, b"FileId", FBX_FILE_ID)
+		fu.elem_data_single_string(self.root, b"CreationTime", FBX_CREATION_TIME)
+		fu.elem_data_single_string_unicode(self.root, b"Creator", creator)
+
+		# Global settings: Y-up, -Z forward, scene units in centimeters
+		settings = fu.elem_empty(self.root, b"GlobalSettings")
+		fu.elem_data_single_int32(settings, b"Version", 1000)
+		props = fu.elem_properties(settings)
+		unit_scale = get_unit_scale(scene)
+		fu.elem_props_set(props, "p_integer", b"UpAxis", 1)
+		fu.elem_props_set(props, "p_integer", b"UpAxisSign", 1)
+		fu.elem_props_set(props, "p_integer", b"FrontAxis", 2)
+		fu.elem_props_set(props, "p_integer", b"FrontAxisSign", 1)
+		fu.elem_props_set(props, "p_integer", b"CoordAxis", 0)
+		fu.elem_props_set(props, "p_integer", b"CoordAxisSign", 1)
+		fu.elem_props_set(props, "p_integer", b"OriginalUpAxis", -1)
+		fu.elem_props_set(props, "p_integer", b"OriginalUpAxisSign", 1)
+		fu.elem_props_set(props, "p_double", b"UnitScaleFactor", unit_scale)
+		fu.elem_props_set(props, "p_double", b"OriginalUnitScaleFactor", unit_scale)
+		fu.elem_props_set(props, "p_color_rgb", b"AmbientColor", (0.0, 0.0, 0.0))
+		fu.elem_props_set(props, "p_string", b"DefaultCamera", "Producer Perspective")
+
+		documents = fu.elem_empty(self.root, b"Documents")
+		fu.elem_data_single_int32(documents, b"Count", 1)
+		doc_uid = self.uid("__FBX_Document__" + scene.name)
+		doc = fu.elem_data_single_int64(documents, b"Document", doc_uid)
+		doc.add_string_unicode(scene.name)
+		doc.add_string_unicode(scene.name)
+		props = fu.elem_properties(doc)
+		fu.elem_props_set(props, "p_object", b"SourceObject")
+		fu.elem_props_set(props, "p_string", b"ActiveAnimStackName", "")
+		fu.elem_data_single_int64(doc, b"RootNode", 0)
+
+		fu.elem_empty(self.root, b"References")
+
+		# Definitions are written once all the objects are known
+		self.definitions = fu.elem_empty(self.root, b"Definitions")
+		self.objects = fu.elem_empty(self.root, b"Objects")
+
+	def write_model(self, ob, matrix, subtype, custom_props):
+		fu = self.fbx_utils
+		uid, model = self.add_object(b"Model", "Model" + ob.name_full, ob.name, b"Model", subtype)
+		fu.elem_data_single_int32(model, b"Version", FBX_MODELS_VERSION)
+
+		loc, rot, scale = matrix.decompose()
+		rot = tuple(math.degrees(angle) for angle in rot.to_euler('XYZ'))
+
+		props = fu.elem_properties(model)
+		fu.elem_props_set(props, "p_lcl_translation", b"Lcl Translation", loc, animatable=True)
+		fu.elem_props_set(props, "p_lcl_rotation", b"Lcl Rotation", rot, animatable=True)
+		fu.elem_props_set(props, "p_lcl_scaling", b"Lcl Scaling", scale, animatable=True)
+		fu.elem_props_set(props, "p_visibility", b"Visibility", float(not ob.hide_viewport), animatable=True)
+		if subtype == b"Mesh":
+			fu.elem_props_set(props, "p_integer", b"DefaultAttributeIndex", 0)
+			fu.elem_props_set(props, "p_enum", b"InheritType", 1)
+
+		if custom_props:
+			for key, value in ob.items():
+				if isinstance(value, bool):
+					fu.elem_props_set(props, "p_bool", key.encode(), value, custom=True)
+				elif isinstance(value, int):
+					fu.elem_props_set(props, "p_integer", key.encode(), value, custom=True)
+				elif isinstance(value, float):
+					fu.elem_props_set(props, "p_double", key.encode(), value, custom=True)
+				elif isinstance(value, str):
+					fu.elem_props_set(props, "p_string", key.encode(), value, custom=True)
+
+		fu.elem_data_single_int32(model, b"MultiLayer", 0)
+		fu.elem_data_single_int32(model, b"MultiTake", 0)
+		fu.elem_data_single_bool(model, b"Shading", True)
+		fu.elem_data_single_string(model, b"Culling", b"CullingOff")
+		return uid
+
+	def write_null(self, ob):
+		fu = self.fbx_utils
+		uid, null = self.add_object(b"NodeAttribute", "NodeAttribute" + ob.name_full, ob.name, b"NodeAttribute", b"Null")
+		fu.elem_data_single_string(null, b"TypeFlags", b"Null")
+		props = fu.elem_properties(null)
+		fu.elem_props_set(props, "p_double", b"Size", ob.empty_display_size * 100.0)
+		return uid
+
+	def write_geometry(self, key, name, buffers):
+		fu = self.fbx_utils
+		uid, geom = self.add_object(b"Geometry", "Geometry" + key, name, b"Geometry", b"Mesh")
+		fu.elem_properties(geom)
+		fu.elem_data_single_int32(geom, b"GeometryVersion", FBX_GEOMETRY_VERSION)
+		fu.elem_data_single_float64_array(geom, b"Vertices", to_float64_array(buffers["vertices"]))
+		fu.elem_data_single_int32_array(geom, b"PolygonVertexIndex", to_int32_array(buffers["polygon_vertices"]))
+
+		layer_elements = []
+
+		normals = fu.elem_data_single_int32(geom, b"LayerElementNormal", 0)
+		fu.elem_data_single_int32(normals, b"Version", FBX_GEOMETRY_NORMAL_VERSION)
+		fu.elem_data_single_string(normals, b"Name", b"")
+		fu.elem_data_single_string(normals, b"MappingInformationType", b"ByPolygonVertex")
+		fu.elem_data_single_string(normals, b"ReferenceInformationType", b"Direct")
+		fu.elem_data_single_float64_array(normals, b"Normals", to_float64_array(buffers["normals"]))
+		layer_elements.append((b"LayerElementNormal", 0))
+
+		for index, (uv_name, uvs, uv_indices) in enumerate(buffers["uv_layers"]):
+			uv = fu.elem_data_single_int32(geom, b"LayerElementUV", index)
+			fu.elem_data_single_int32(uv, b"Version", FBX_GEOMETRY_UV_VERSION)
+			fu.elem_data_single_string_unicode(uv, b"Name", uv_name)
+			fu.elem_data_single_string(uv, b"MappingInformationType", b"ByPolygonVertex")
+			fu.elem_data_single_string(uv, b"ReferenceInformationType", b"IndexToDirect")
+			fu.elem_data_single_float64_array(uv, b"UV", to_float64_array(uvs))
+			fu.elem_data_single_int32_array(uv, b"UVIndex", to_int32_array(uv_indices))
+			layer_elements.append((b"LayerElementUV", index))
+
+		materials = fu.elem_data_single_int32(geom, b"LayerElementMaterial", 0)
+		fu.elem_data_single_int32(materials, b"Version", FBX_GEOMETRY_MATERIAL_VERSION)
+		fu.elem_data_single_string(materials, b"Name", b"")
+		if len(buffers["materials"]) and np.all(buffers["materials"] == buffers["materials"][0]):
+			fu.elem_data_single_string(materials, b"MappingInformationType", b"AllSame")
+			material_indices = buffers["materials"][:1]
+		else:
+			fu.elem_data_single_string(materials, b"MappingInformationType", b"ByPolygon")
+			material_indices = buffers["materials"]
+		fu.elem_data_single_string(materials, b"ReferenceInformationType", b"IndexToDirect")
+		fu.elem_data_single_int32_array(materials, b"Materials", to_int32_array(material_indices))
+		layer_elements.append((b"LayerElementMaterial", 0))
+
+		# Every UV layer after the first one goes to its own layer
+		layer = fu.elem_data_single_int32(geom, b"Layer", 0)
+		fu.elem_data_single_int32(layer, b"Version", FBX_GEOMETRY_LAYER_VERSION)
+		for element_type, index in layer_elements:
+			if element_type == b"LayerElementUV" and index > 0:
+				extra_layer = fu.elem_data_single_int32(geom, b"Layer", index)
+				fu.elem_data_single_int32(extra_layer, b"Version", FBX_GEOMETRY_LAYER_VERSION)
+				target = extra_layer
+			else:
+				target = layer
+			lay = fu.elem_empty(target, b"LayerElement")
+			fu.elem_data_single_string(lay, b"Type", element_type)
+			fu.elem_data_single_int32(lay, b"TypedIndex", index)
+
+		return uid
+
+	def write_material(self, material):
+		fu = self.fbx_utils
+		from bpy_extras import node_shader_utils
+
+		uid, mat = self.add_object(b"Material", "Material" + material.name_full, material.name, b"Material", b"")
+		fu.elem_data_single_int32(mat, b"Version", FBX_MATERIAL_VERSION)
+		fu.elem_data_single_string(mat, b"ShadingModel", b"Phong")
+		fu.elem_data_single_int32(mat, b"MultiLayer", 0)
+
+		wrapper = node_shader_utils.PrincipledBSDFWrapper(material, is_readonly=True)
+		props = fu.elem_properties(mat)
+		fu.elem_props_set(props, "p_string", b"ShadingModel", "Phong")
+		fu.elem_props_set(props, "p_color", b"DiffuseColor", tuple(wrapper.base_color)[:3])
+		fu.elem_props_set(props, "p_number", b"DiffuseFactor", 1.0)
+		fu.elem_props_set(props, "p_color", b"EmissiveColor", tuple(wrapper.emission_color)[:3])
+		fu.elem_props_set(props, "p_number", b"EmissiveFactor", wrapper.emission_strength)
+		fu.elem_props_set(props, "p_number", b"TransparencyFactor", 1.0 - wrapper.alpha)
+		fu.elem_props_set(props, "p_number", b"Opacity", wrapper.alpha)
+		fu.elem_props_set(props, "p_number", b"Shininess", (1.0 - wrapper.roughness) * 10.0)
+
+		# Base color texture, referenced by path (not embedded)
+		texture = wrapper.base_color_texture
+		if texture and texture.image:
+			image = texture.image
+			path = bpy.path.abspath(image.filepath, library=image.library)
+			tex_uid, tex = self.add_object(b"Texture", "Texture" + material.name_full, image.name, b"Texture", b"")
+			fu.elem_data_single_string(tex, b"Type", b"TextureVideoClip")
+			fu.elem_data_single_int32(tex, b"Version", 202)
+			fu.elem_data_single_string(tex, b"TextureName", self.name_class(image.name, b"Texture"))
+			fu.elem_data_single_string(tex, b"Media", self.name_class(image.name, b"Video"))
+			fu.elem_data_single_string_unicode(tex, b"FileName", path)
+			fu.elem_data_single_string_unicode(tex, b"RelativeFilename", bpy.path.basename(path))
+
+			# Images used by several materials are written once
+			if image not in self.videos:
+				video_uid, video = self.add_object(b"Video", "Video" + image.name_full, image.name, b"Video", b"Clip")
+				fu.elem_data_single_string(video, b"Type", b"Clip")
+				fu.elem_data_single_string_unicode(video, b"FileName", path)
+				fu.elem_data_single_string_unicode(video, b"RelativeFilename", bpy.path.basename(path))
+				self.videos[image] = video_uid
+
+			self.connect(self.videos[image], tex_uid)
+			self.connect(tex_uid, uid, b"DiffuseColor")
+
+		return uid
+
+	def write_placeholder_material(self):
+		fu = self.fbx_utils
+		uid, mat = self.add_object(b"Material", "Material Placeholder", "None", b"Material", b"")
+		fu.elem_data_single_int32(mat, b"Version", FBX_MATERIAL_VERSION)
+		fu.elem_data_single_string(mat, b"ShadingModel", b"Phong")
+		fu.elem_data_single_int32(mat, b"MultiLayer", 0)
+		props = fu.elem_properties(mat)
+		fu.elem_props_set(props, "p_string", b"ShadingModel", "Phong")
+		return uid
+
+	def write_footer(self):
+		fu = self.fbx_utils
+
+		fu.elem_data_single_int32(self.definitions, b"Version", 100)
+		fu.elem_data_single_int32(self.definitions, b"Count", sum(self.counts.values()) + 1)
+		object_type = fu.elem_data_single_string(self.definitions, b"ObjectType", b"GlobalSettings")
+		fu.elem_data_single_int32(object_type, b"Count", 1)
+		for element_type, count in self.counts.items():
+			object_type = fu.elem_data_single_string(self.definitions, b"ObjectType", element_type)
+			fu.elem_data_single_int32(object_type, b"Count", count)
+
+		connections = fu.elem_empty(self.root, b"Connections")
+		for child_uid, parent_uid, prop in self.connections:
+			if prop is None:
+				conn = fu.elem_data_single_string(connections, b"C", b"OO")
+			else:
+				conn = fu.elem_data_single_string(connections, b"C", b"OP")
+			conn.add_int64(child_uid)
+			conn.add_int64(parent_uid)
+			if prop is not None:
+				conn.add_string(prop)
+
+		takes = fu.elem_empty(self.root, b"Takes")
+		fu.elem_data_single_string(takes, b"Current", b"")
+
+	def save(self, filepath):
+		self.encode_bin.write(filepath, self.root, FBX_VERSION)
+
+
+def write_fbx(context, filepath, objects, use_custom_properites, triangulate_faces):
+	from io_scene_fbx import encode_bin, fbx_utils
+
+	depsgraph = context.evaluated_depsgraph_get()
+	objects = [ob for ob in objects if ob.type == 'EMPTY' or ob.type in GEOMETRY_TYPES]
+	world_matrices = get_converted_world_matrices(objects, depsgraph)
+
+	writer = FbxWriter(fbx_utils, encode_bin)
+	writer.write_header(context.scene, filepath)
+
+	# Evaluated meshes are shared by objects with the same data and no modifiers,
+	# exactly like the built-in exporter does.
+	geometries = dict()
+	materials = dict()
+
+	for ob in objects:
+		matrix = get_fbx_matrix(ob, world_matrices)
+
+		if ob.type == 'EMPTY':
+			model_uid = writer.write_model(ob, matrix, b"Null", use_custom_properites)
+			writer.connect(writer.write_null(ob), model_uid)
+		else:
+			ob_eval = ob.evaluated_get(depsgraph)
+			shared = ob.type == 'MESH' and not any(mod.show_viewport for mod in ob.modifiers)
+			# Mesh and object names can be the same, so they are kept apart
+			key = ("DATA", ob.data) if shared else ("OBJECT", ob)
+			name = ob.data.name if shared else ob.name
+
+			if key not in geometries:
+				geometries[key] = None
+				mesh = ob_eval.to_mesh()
+				if mesh is not None:
+					try:
+						buffers = read_mesh_buffers(mesh, triangulate_faces)
+						instrumentation.count("datablocks")
+						instrumentation.count("vertices", len(mesh.vertices))
+					finally:
+						ob_eval.to_mesh_clear()
+					geometries[key] = writer.write_geometry(key[0] + (ob.data.name_full if shared else ob.name_full), name, buffers)
+
+			if geometries[key] is None:
+				# Objects without geometry (empty curves or texts...) are written as empties, so
+				# their children stay connected
+				model_uid = writer.write_model(ob, matrix, b"Null", use_custom_properites)
+				writer.connect(writer.write_null(ob), model_uid)
+			else:
+				model_uid = writer.write_model(ob, matrix, b"Mesh", use_custom_properites)
+				writer.connect(geometries[key], model_uid)
+
+				# Empty slots get a placeholder material, so the following slots keep their index
+				for slot in ob.material_slots:
+					if slot.material not in materials:
+						materials[slot.material] = writer.write_material(slot.material) if slot.material else writer.write_placeholder_material()
+					writer.connect(materials[slot.material], model_uid)
+
+		parent_uid = writer.uid("Model" + ob.parent.name_full) if ob.parent in world_matrices else 0
+		writer.connect(model_uid, parent_uid)
+
+	writer.write_footer()
+	writer.save(filepath)
+
+
+def export_unity_fbx_direct(context, filepath, active_collection, selected_objects, export_collections_as_empties, use_custom_properites, tangent_space, triangulate_faces, write_report=False, write_if_changed=False):
+	# Returns None when the export isn't supported by this engine,
+	# so the caller can fall back to the default engine.
+	objects = export.get_export_objects(context, active_collection, selected_objects)
+
+	reason = get_unsupported_reason(objects, export_collections_as_empties, tangent_space)
+	if reason:
+		logger.info("Non-destructive export not available (%s). Using the default engine.", reason)
+		return None
+
+	logger.info("Writing FBX for Unity without modifying the scene...")
+	export.last_error = None
+	instrumentation.begin(filepath)
+	instrumentation.count("objects", len(objects))
+
+	try:
+		with instrumentation.phase("fbx_write"):
+			export.write_file(filepath, lambda path: write_fbx(context, path, objects, use_custom_properites, triangulate_faces), write_if_changed)
+	except Exception as e:
+		export.last_error = str(e)
+		logger.error("File not saved: %s", e)
+		export.finish_report(filepath, write_report)
+		return {'FINISHED'}
+
+	logger.info("FBX file for Unity saved.")
+	export.finish_report(filepath, write_report)
+	return {'FINISHED'}
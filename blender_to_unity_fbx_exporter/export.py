@@ -1,220 +1,866 @@
 import bpy
 import mathutils
-import math
+import numpy as np
+import os
+import re
 
+from . import animation
 from . import collections_as_empties
+from . import fbx_reader
+from . import hierarchy
+from . import instrumentation
+from . import journal
+from . import manifest
+from . import lod
+from . import merge
+from . import mesh_optimization
+from . import textures
+from .instrumentation import logger
 
 # Multi-user datablocks are preserved here. Unique copies are made for applying the rotation.
 # Eventually multi-user datablocks become single-user and gets processed.
 # Therefore restoring the multi-user data assigns a shared but already processed datablock.
 shared_data = dict()
 
-# All objects and collections in this view layer must be visible while being processed.
-# apply_rotation and matrix changes don't have effect otherwise.
+# All objects to be exported and their collections must be visible while being processed.
+# Matrix changes don't have effect otherwise.
 # Visibility will be restored right before saving the FBX.
+# Every change is also recorded in the journal, which restores the scene after exporting.
 hidden_collections = []
 hidden_objects = []
 disabled_collections = []
 disabled_objects = []
 
+# Error of the last export, if it failed. The operator always finishes, so scripts check this.
+last_error = None
 
-def unhide_collections(col):
+# An export is in progress. Exports spread over time (ExportUnityFbxModal) can't overlap others.
+running = False
+
+
+def get_export_objects(context, active_collection, selected_objects):
+	# Resolve the objects the FBX exporter is going to write, the same way it does:
+	# active collection and/or selection, restricted to the current view layer.
+	# Objects in excluded collections aren't part of the view layer.
+	view_layer = context.view_layer
+
+	if active_collection:
+		view_layer_objects = set(view_layer.objects)
+		objects = [ob for ob in view_layer.active_layer_collection.collection.all_objects if ob in view_layer_objects]
+	else:
+		objects = list(view_layer.objects)
+
+	if selected_objects:
+		selection = set(context.selected_objects)
+		objects = [ob for ob in objects if ob in selection]
+
+	return objects
+
+
+def get_required_objects(export_objects):
+	# Objects to be exported plus the ones they depend on: their ancestors (needed to compute
+	# the converted local matrices) and the armatures deforming them.
+	required = set(export_objects)
+	pending = list(export_objects)
+
+	while pending:
+		ob = pending.pop()
+		dependencies = [mod.object for mod in ob.modifiers if mod.type == 'ARMATURE' and mod.object]
+		if ob.parent:
+			dependencies.append(ob.parent)
+		for item in dependencies:
+			if item not in required:
+				required.add(item)
+				pending.append(item)
+
+	return required
+
+
+def get_shared_instance_collections(export_objects, required_objects):
+	# Instanced collections whose contents can be written once and shared by all the instances.
+	# The FBX exporter writes each instance as a child of its instancer referencing the same
+	# geometry, so the collection's objects are fixed in place instead of being copied.
+	# Collections with objects exported on their own, armatures, bone parenting, non-mesh
+	# objects or nested instances are realized instead.
+	collections = set(ob.instance_collection for ob in export_objects if ob.instance_type == 'COLLECTION' and ob.instance_collection)
+	shared = set()
+
+	for collection in collections:
+		objects = collection.all_objects
+		if all(ob.type in {'MESH', 'EMPTY'}
+			and ob.parent_type == 'OBJECT'
+			and ob.instance_type != 'COLLECTION'
+			and ob not in required_objects
+			and not uses_armature_modifier(ob)
+			for ob in objects):
+			shared.add(collection)
+
+	return shared
+
+
+def realize_instanced_collections(objects, shared_collections=()):
+	# Objects instancing a collection receive a copy of the collection's objects as children.
+	# The copies are exported as regular objects and receive the same rotation fix as the rest.
+	# Otherwise the FBX exporter writes the instances with their original rotation.
+	# Returns the copies made for each instancer, including nested instances.
+	realized = dict()
+	pending = [ob for ob in objects if ob.instance_type == 'COLLECTION' and ob.instance_collection]
+
+	while pending:
+		instancer = pending.pop()
+		collection = instancer.instance_collection
+		if collection in shared_collections:
+			continue
+		offset = mathutils.Matrix.Translation(-collection.instance_offset)
+
+		# Copies share the data of the original objects. They're removed on restore.
+		copies = {ob: ob.copy() for ob in collection.all_objects}
+		journal.add_created_list(list(copies.values()))
+
+		for ob, copy in copies.items():
+			for col in instancer.users_collection:
+				col.objects.link(copy)
+
+			# Hierarchies inside the collection are preserved. Root objects become children
+			# of the instancer, placed as the instance shows them.
+			if ob.parent in copies:
+				copy.parent = copies[ob.parent]
+			else:
+				copy.parent = instancer
+				copy.parent_type = 'OBJECT'
+				copy.matrix_parent_inverse = mathutils.Matrix.Identity(4)
+				copy.matrix_basis = offset @ ob.matrix_world
+
+			# Modifiers referencing objects in the collection (armatures...) use their copies
+			for mod in copy.modifiers:
+				if getattr(mod, "object", None) in copies:
+					mod.object = copies[mod.object]
+
+			if copy.instance_type == 'COLLECTION' and copy.instance_collection:
+				pending.append(copy)
+
+		realized[instancer] = list(copies.values())
+		journal.set_attribute(instancer, "instance_type", 'NONE')
+
+	if realized:
+		logger.debug("Realized instanced collections: %s", [ob.name for ob in realized])
+
+	return realized
+
+
+def with_instances(objects, realized):
+	# The given objects plus the copies realized out of their instanced collections
+	objects = list(objects)
+	pending = list(objects)
+	while pending:
+		copies = realized.get(pending.pop(), ())
+		objects.extend(copies)
+		pending.extend(copies)
+	return objects
+
+
+def get_layer_collection_parents(layer_collection):
+	# Parent of each layer collection in the view layer tree, gathered in a single walk
+	parents = dict()
+	pending = [layer_collection]
+
+	while pending:
+		col = pending.pop()
+		for item in col.children:
+			parents[item] = col
+			pending.append(item)
+
+	return parents
+
+
+def unhide_collections(layer_collection, objects):
 	global hidden_collections
 	global disabled_collections
 
-	# No need to unhide excluded collections. Their objects aren't included in current view layer.
-	if col.exclude:
-		return
+	# Only the collections containing the given objects and their parent collections are
+	# unhidden. Excluded collections are left alone, their objects aren't included in
+	# current view layer.
+	collections = set()
+	for ob in objects:
+		collections.update(ob.users_collection)
 
-	# Find hidden child collections and unhide them
-	hidden = [item for item in col.children if not item.exclude and item.hide_viewport]
-	for item in hidden:
-		item.hide_viewport = False
+	parents = get_layer_collection_parents(layer_collection)
+	pending = [col for col in parents if col.collection in collections]
+	visited = set()
 
-	# Add them to the list so they could be restored later
-	hidden_collections.extend(hidden)
+	while pending:
+		col = pending.pop()
+		if col in visited or col.exclude:
+			continue
+		visited.add(col)
 
-	# Same with the disabled collections
-	disabled = [item for item in col.children if not item.exclude and item.collection.hide_viewport]
-	for item in disabled:
-		item.collection.hide_viewport = False
+		# Unhide them and add them to the list so they could be restored later
+		if col.hide_viewport:
+			journal.set_attribute(col, "hide_viewport", False)
+			hidden_collections.append(col)
 
-	disabled_collections.extend(disabled)
+		# Same with the disabled collections
+		if col.collection.hide_viewport:
+			journal.set_attribute(col.collection, "hide_viewport", False)
+			disabled_collections.append(col)
 
-	# Recursively unhide child collections
-	for item in col.children:
-		unhide_collections(item)
+		if parents.get(col) in parents:
+			pending.append(parents[col])
 
 
-def unhide_objects():
+def unhide_objects(objects):
 	global hidden_objects
 	global disabled_objects
 
-	view_layer_objects = [ob for ob in bpy.data.objects if ob.name in bpy.context.view_layer.objects]
+	view_layer_objects = bpy.context.view_layer.objects
 
-	for ob in view_layer_objects:
+	for ob in objects:
+		# Objects whose collection is excluded can't be unhidden
+		if ob.name not in view_layer_objects:
+			continue
 		if ob.hide_get():
 			hidden_objects.append(ob)
-			ob.hide_set(False)
+			journal.set_hidden(ob, False)
 		if ob.hide_viewport:
 			disabled_objects.append(ob)
-			ob.hide_viewport = False
+			journal.set_attribute(ob, "hide_viewport", False)
+
+
+def uses_armature_modifier(ob):
+	return any(mod.type == 'ARMATURE' for mod in ob.modifiers)
 
 
-def make_single_user_data():
+def has_active_modifiers(ob):
+	return any(mod.show_viewport for mod in ob.modifiers)
+
+
+def make_single_user_data(objects):
 	global shared_data
 
-	for ob in bpy.data.objects:
-		if ob.data and ob.data.users > 1:
-			# Figure out actual users of this datablock (not counting fake users)
-			users = [user for user in bpy.data.objects if user.data == ob.data]
-			if len(users) > 1:
-				# Store shared mesh data (MESH objects only).
-				# Other shared datablocks (CURVE, FONT, etc) are always exported as separate meshes
-				# by the built-in FBX exporter.
-				if ob.type == 'MESH':
-					# Shared mesh data will be restored if users have no active modifiers
-					modifiers = 0
-					for user in users:
-						modifiers += len([mod for mod in user.modifiers if mod.show_viewport])
-					if modifiers == 0:
-						shared_data[ob.name] = ob.data
-
-				# Single-user data is mandatory in all object types, otherwise we can't apply the rotation.
-				ob.data = ob.data.copy()
-
-
-def apply_object_modifiers():
-	# Select objects in current view layer not using an armature modifier
-	bpy.ops.object.select_all(action='DESELECT')
-	for ob in bpy.data.objects:
-		if ob.name in bpy.context.view_layer.objects:
-			bypass_modifiers = False
-			for mod in ob.modifiers:
-				if mod.type == 'ARMATURE':
-					bypass_modifiers = True
-			if not bypass_modifiers:
-				ob.select_set(True)
+	# Figure out actual users of each datablock among the exported objects in a single pass.
+	# Users outside the export set don't matter, they aren't written to the FBX.
+	data_users = dict()
+	for ob in objects:
+		if ob.data:
+			data_users.setdefault(ob.data, []).append(ob)
 
-	# Conversion to mesh may not be available depending on the remaining objects
-	if bpy.ops.object.convert.poll():
-		print("Converting to meshes:", bpy.context.selected_objects)
-		bpy.ops.object.convert(target='MESH')
+	for data, users in data_users.items():
+		if len(users) < 2:
+			continue
 
+		# The last user keeps the original datablock
+		copied_users = users[:-1]
 
-def reset_parent_inverse(ob):
-	if (ob.parent):
-		mat_world = ob.matrix_world.copy()
-		ob.matrix_parent_inverse.identity()
-		ob.matrix_basis = ob.parent.matrix_world.inverted() @ mat_world
+		# Store shared mesh data (MESH objects only).
+		# Other shared datablocks (CURVE, FONT, etc) are always exported as separate meshes
+		# by the built-in FBX exporter.
+		# Shared mesh data will be restored if users have no active modifiers
+		if isinstance(data, bpy.types.Mesh) and not any(has_active_modifiers(user) for user in users):
+			for ob in copied_users:
+				shared_data[ob.name] = data
 
+		# Single-user data is mandatory in all object types, otherwise we can't apply the rotation.
+		for ob in copied_users:
+			journal.set_attribute(ob, "data", journal.add_created(data.copy()))
 
-def apply_rotation(ob):
-	bpy.ops.object.select_all(action='DESELECT')
-	ob.select_set(True)
-	bpy.ops.object.transform_apply(location = False, rotation = True, scale = False)
 
+def convert_to_mesh_object(ob, mesh):
+	# Object types can't be changed without operators, so non-mesh objects are replaced
+	# with a new mesh object taking their name, transform, collections and children.
+	name = ob.name
+	journal.rename(ob, name + " (Unity FBX source)")
 
-def fix_object(ob):
-	# Only fix objects in current view layer
-	if ob.name in bpy.context.view_layer.objects:
+	mesh_ob = journal.add_created(bpy.data.objects.new(name, mesh))
+	for col in ob.users_collection:
+		col.objects.link(mesh_ob)
 
-		# Reset parent's inverse so we can work with local transform directly
-		reset_parent_inverse(ob)
+	mesh_ob.parent = ob.parent
+	mesh_ob.parent_type = ob.parent_type
+	mesh_ob.parent_bone = ob.parent_bone
+	mesh_ob.matrix_parent_inverse = ob.matrix_parent_inverse
+	mesh_ob.matrix_basis = ob.matrix_basis
+	mesh_ob.hide_viewport = ob.hide_viewport
 
-		# Create a copy of the local matrix and set a pure X-90 matrix
-		mat_original = ob.matrix_local.copy()
-		ob.matrix_local = mathutils.Matrix.Rotation(math.radians(-90.0), 4, 'X')
+	for key in ob.keys():
+		mesh_ob[key] = ob[key]
 
-		# Apply the rotation to the object
-		apply_rotation(ob)
+	for slot, mesh_slot in zip(ob.material_slots, mesh_ob.material_slots):
+		if slot.link == 'OBJECT':
+			mesh_slot.link = 'OBJECT'
+			mesh_slot.material = slot.material
 
-		# Reapply the previous local transform with an X+90 rotation
-		ob.matrix_local = mat_original @ mathutils.Matrix.Rotation(math.radians(90.0), 4, 'X')
+	if ob.animation_data and ob.animation_data.action:
+		mesh_ob.animation_data_create().action = ob.animation_data.action
 
-	# Recursively fix child objects in current view layer.
-	# Children may be in the current view layer even if their parent isn't.
 	for child in ob.children:
-		fix_object(child)
+		journal.set_attribute(child, "parent", mesh_ob)
+
+	return mesh_ob
+
+
+# Modifiers whose result depends on the object itself (simulations, particles, node trees
+# that may read the object's transform). Objects using them never share evaluated meshes.
+UNIQUE_MODIFIER_TYPES = {'NODES', 'PARTICLE_SYSTEM', 'PARTICLE_INSTANCE', 'EXPLODE', 'CLOTH', 'SOFT_BODY', 'COLLISION', 'DYNAMIC_PAINT', 'FLUID', 'SURFACE'}
+
+# Modifier properties not affecting the evaluated geometry
+IGNORED_MODIFIER_PROPERTIES = {"rna_type", "name", "show_expanded", "is_active", "persistent_uid", "show_in_editmode", "show_on_cage", "show_render"}
+
+
+def get_evaluated_mesh_key(ob):
+	# Objects with the same data and an identical modifier stack evaluate to the same mesh.
+	# Returns the object itself when its evaluated mesh can't be shared: modifiers
+	# referencing other objects or world space depend on the object's transform.
+	if ob.type == 'META':
+		return ob
+
+	key = [ob.data, ob.show_only_shape_key, ob.active_shape_key_index, tuple(group.name for group in ob.vertex_groups)]
+
+	for mod in ob.modifiers:
+		if not mod.show_viewport:
+			continue
+		if mod.type in UNIQUE_MODIFIER_TYPES or getattr(mod, "texture_coords", None) in {'GLOBAL', 'OBJECT'}:
+			return ob
 
+		values = [mod.type]
+		for prop in mod.bl_rna.properties:
+			if prop.identifier in IGNORED_MODIFIER_PROPERTIES or prop.type == 'COLLECTION':
+				continue
+			value = getattr(mod, prop.identifier)
+			if prop.type == 'POINTER':
+				if isinstance(value, bpy.types.Object):
+					return ob
+				if value is not None and not isinstance(value, bpy.types.ID):
+					continue
+			elif getattr(prop, "is_array", False):
+				value = tuple(value)
+			elif isinstance(value, set):
+				value = frozenset(value)
+			values.append((prop.identifier, value))
+		key.append(tuple(values))
 
-def export_unity_fbx(context, filepath, active_collection, selected_objects, export_collections_as_empties, use_custom_properites, tangent_space, triangulate_faces, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis):
+	return tuple(key)
+
+
+def apply_object_modifiers(objects):
+	# Replace the geometry of exported objects not using an armature modifier with their
+	# evaluated mesh, so modifiers are applied and curves, surfaces, texts and metaballs
+	# become meshes. Returns the objects that were replaced with a new mesh object.
+	# Evaluated meshes are cached by source data and modifier stack, so linked duplicates
+	# with identical modifiers are evaluated once and share the resulting mesh.
+	depsgraph = bpy.context.evaluated_depsgraph_get()
+	converted = dict()
+	evaluated_meshes = dict()
+
+	for ob in objects:
+		if uses_armature_modifier(ob):
+			continue
+
+		if ob.type == 'MESH':
+			if not has_active_modifiers(ob):
+				continue
+		elif ob.type not in {'CURVE', 'SURFACE', 'FONT', 'META'}:
+			continue
+
+		key = get_evaluated_mesh_key(ob)
+		mesh = evaluated_meshes.get(key)
+		if mesh is None:
+			ob_eval = ob.evaluated_get(depsgraph)
+			mesh = journal.add_created(bpy.data.meshes.new_from_object(ob_eval, preserve_all_data_layers=True, depsgraph=depsgraph))
+			evaluated_meshes[key] = mesh
+
+		if ob.type == 'MESH':
+			journal.set_attribute(ob, "data", mesh)
+			for mod in ob.modifiers:
+				if mod.show_viewport:
+					journal.set_attribute(mod, "show_viewport", False)
+		else:
+			converted[ob] = convert_to_mesh_object(ob, mesh)
+
+	instrumentation.count("evaluated_meshes", len(evaluated_meshes))
+	if converted:
+		logger.debug("Converting to meshes: %s", [ob.name for ob in converted])
+
+	return converted
+
+
+# Exact X-90 / X+90 rotations. Built from integer components so baking the rotation into
+# the geometry is lossless and the converted vertices don't pick up float noise.
+MATRIX_X_MINUS_90 = mathutils.Matrix(((1, 0, 0, 0), (0, 0, 1, 0), (0, -1, 0, 0), (0, 0, 0, 1)))
+MATRIX_X_PLUS_90 = mathutils.Matrix(((1, 0, 0, 0), (0, 0, -1, 0), (0, 1, 0, 0), (0, 0, 0, 1)))
+
+# Parent types placing the object relative to a bone or vertices of the parent
+FRAME_PARENT_TYPES = {'BONE', 'VERTEX', 'VERTEX_3'}
+
+
+def apply_rotation_to_data(datablocks):
+	# Bake the pure X-90 rotation into each datablock exactly once, no matter how many
+	# objects use it. Mesh.transform and friends work directly on the data arrays, so
+	# no selection changes or operator calls are involved.
+	# Yields after each datablock (see prepare_scene_steps).
+	for i, data in enumerate(datablocks):
+		journal.transform_data(data, MATRIX_X_MINUS_90)
+		if isinstance(data, bpy.types.Mesh):
+			instrumentation.count("vertices", len(data.vertices))
+		yield "Fixing rotations (%d/%d)" % (i + 1, len(datablocks))
+
+	instrumentation.count("datablocks", len(datablocks))
+
+
+def fix_instanced_collection(collection, datablocks):
+	# Each instance is evaluated as instancer @ T(-offset) @ object, with the instancer
+	# already rotated X+90. Objects are moved so the instances end up in their converted
+	# pose (original world matrix @ X+90) in every instancer, while their data receives the
+	# X-90 rotation once like any other datablock.
+	offset = mathutils.Matrix.Translation(collection.instance_offset)
+	correction = offset @ MATRIX_X_MINUS_90 @ offset.inverted()
+
+	objects = collection.all_objects
+	matrices = {ob: correction @ ob.matrix_world @ MATRIX_X_PLUS_90 for ob in objects}
+
+	for ob in objects:
+		if ob.parent:
+			if ob.parent_type in FRAME_PARENT_TYPES:
+				# Relative to the bone or vertex frame, which moves with the instance
+				parent_world = correction @ ob.matrix_world @ (ob.matrix_parent_inverse @ ob.matrix_basis).inverted_safe()
+			elif ob.parent in matrices:
+				parent_world = matrices[ob.parent]
+			else:
+				parent_world = ob.parent.matrix_world
+			journal.set_attribute(ob, "matrix_parent_inverse", mathutils.Matrix.Identity(4))
+			journal.set_attribute(ob, "matrix_basis", parent_world.inverted() @ matrices[ob])
+		else:
+			journal.set_attribute(ob, "matrix_basis", matrices[ob])
+
+		if ob.data is not None and hasattr(ob.data, "transform"):
+			datablocks.add(ob.data)
+
+
+def fix_objects(objects, export_objects, shared_collections=()):
+	# The converted local matrices of the whole hierarchy are computed at once out of the
+	# world matrices and written in bulk. Ancestors of every exported object must be included,
+	# as the local matrices are relative to their world matrix. Yields while baking the rotation
+	# into the data.
+	objects = list(dict.fromkeys(objects))
+	index = {ob: i for i, ob in enumerate(objects)}
+	parents = np.array([index.get(ob.parent, -1) for ob in objects], dtype=np.int64)
+	converted = np.array([ob in export_objects for ob in objects], dtype=bool)
+	framed = np.array([ob.parent is not None and ob.parent_type in FRAME_PARENT_TYPES for ob in objects], dtype=bool)
+
+	# Object matrices must be up to date before computing the converted ones
+	bpy.context.view_layer.update()
+
+	# The geometry receives an X-90 rotation (baked later, once per datablock), so exported
+	# objects receive an X+90 rotation to preserve their visual pose. Ancestors that aren't
+	# exported are used for their world matrix only.
+	world = hierarchy.from_flat(journal.foreach_matrices(objects, "matrix_world"))
+	frames = None
+	if framed.any():
+		# Bone and vertex frames, which keep their world matrix through the conversion
+		framed_objects = [ob for ob, is_framed in zip(objects, framed) if is_framed]
+		frames = np.empty_like(world)
+		frames[framed] = hierarchy.get_parent_frames(world[framed],
+			hierarchy.from_flat(journal.foreach_matrices(framed_objects, "matrix_parent_inverse")),
+			hierarchy.from_flat(journal.foreach_matrices(framed_objects, "matrix_basis")))
+	local = hierarchy.get_converted_matrices(world, parents, converted, MATRIX_X_PLUS_90, frames, framed)
+
+	# Parent inverses are reset so the local matrices can be used directly
+	fixed = [ob for ob, is_converted in zip(objects, converted) if is_converted]
+	if fixed:
+		journal.set_matrices(fixed, "matrix_parent_inverse", hierarchy.to_flat(np.broadcast_to(np.identity(4), (len(fixed), 4, 4))))
+		journal.set_matrices(fixed, "matrix_basis", hierarchy.to_flat(local[converted]))
+		logger.debug("Fixed hierarchy of %d objects", len(fixed))
+
+	datablocks = set(ob.data for ob in fixed if ob.data is not None and hasattr(ob.data, "transform"))
+
+	# Contents of the instanced collections written once for all their instances
+	for collection in shared_collections:
+		fix_instanced_collection(collection, datablocks)
+
+	yield from apply_rotation_to_data(datablocks)
+
+
+def run_steps(steps):
+	# Run a generator of steps to completion, returning its result
+	while True:
+		try:
+			next(steps)
+		except StopIteration as result:
+			return result.value
+
+
+def prepare_scene_steps(context, export_objects, keep_shared_data, instanced_collections='REALIZE', keyframe_tolerances=None, mesh_optimization_options=None, lod_ratios=None, merge_options=None, partition=None, texture_options=None):
+	# Modify the scene so the given objects can be exported with the built-in FBX exporter.
+	# Every preparation step only touches these objects and the objects they depend on.
+	# Yields a description of the next step between steps, so the preparation can be spread
+	# over time (see ExportUnityFbxModal).
+	# All changes are recorded in the journal. Returns the objects to be exported, the
+	# objects that were replaced with a new mesh object (None when merged) and the objects
+	# added for each object (copies realized out of instanced collections, LOD objects and
+	# merged objects). Objects are only merged with objects in the same partition.
 	global shared_data
 	global hidden_collections
 	global hidden_objects
 	global disabled_collections
 	global disabled_objects
 
-	print("Preparing 3D model for Unity...")
-
-	# Root objects: Empty, Mesh, Curve, Surface, Font or Armature without parent
-	root_objects = [item for item in bpy.data.objects if (item.type == "EMPTY" or item.type == "MESH" or item.type == "ARMATURE" or item.type == "FONT" or item.type == "CURVE" or item.type == "SURFACE") and not item.parent]
-
-	# Preserve current scene
-	# undo_push examples, including exporters' execute:
-	# https://programtalk.com/python-examples/bpy.ops.ed.undo_push  (Examples 4, 5 and 6)
-	# https://sourcecodequery.com/example-method/bpy.ops.ed.undo  (Examples 1 and 2)
-
-	bpy.ops.ed.undo_push(message="Prepare Unity FBX")
-
 	shared_data = dict()
 	hidden_collections = []
 	hidden_objects = []
 	disabled_collections = []
 	disabled_objects = []
 
-	selection = bpy.context.selected_objects
-
 	# Object mode
 	if bpy.ops.object.mode_set.poll():
 		bpy.ops.object.mode_set(mode="OBJECT")
+		instrumentation.count("operator_calls")
+
+	# Instanced collections are either shared by all their instances or exported as copies
+	# of their objects
+	with instrumentation.phase("instances"):
+		shared_collections = set()
+		if instanced_collections == 'SHARED':
+			shared_collections = get_shared_instance_collections(export_objects, get_required_objects(export_objects))
+		realized = realize_instanced_collections(export_objects, shared_collections)
+		export_objects = with_instances(export_objects, realized)
+		selection = with_instances(context.selected_objects, realized)
+
+	# Objects in the shared collections are processed like exported objects, but they're
+	# written by the FBX exporter through their instances only
+	instance_sources = [ob for collection in shared_collections for ob in collection.all_objects]
+	instrumentation.count("shared_collections", len(shared_collections))
+
+	required_objects = get_required_objects(export_objects)
+
+	instrumentation.count("objects", len(export_objects))
 
-	# Ensure all the collections and objects in this view layer are visible
-	unhide_collections(bpy.context.view_layer.layer_collection)
-	unhide_objects()
+	# Ensure all the collections and objects to be processed are visible
+	yield "Unhiding objects"
+	with instrumentation.phase("unhide"):
+		unhide_collections(context.view_layer.layer_collection, required_objects)
+		unhide_objects(required_objects)
+
+	# Apply modifiers to objects (except those affected by an armature).
+	# Objects converted to a new mesh object are exported instead of the original ones.
+	yield "Applying modifiers"
+	with instrumentation.phase("modifiers"):
+		converted = apply_object_modifiers(export_objects + instance_sources)
+	export_objects = [converted.get(ob, ob) for ob in export_objects]
+	required_objects = [converted.get(ob, ob) for ob in required_objects]
+	selection = [converted.get(ob, ob) for ob in selection]
+	hidden_objects = [converted.get(ob, ob) for ob in hidden_objects]
+	disabled_objects = [converted.get(ob, ob) for ob in disabled_objects]
+
+	# Generate the LOD chains of the final meshes. The added objects are exported along with
+	# the object they were generated for.
+	if lod_ratios:
+		yield "Generating LODs"
+		with instrumentation.phase("lods"):
+			lods = lod.generate_lods(export_objects, lod_ratios)
+		export_objects = with_instances(export_objects, lods)
+		required_objects = with_instances(required_objects, lods)
+		selection = with_instances(selection, lods)
+
+		# Batch units are resolved from the objects before conversion
+		sources = {new: ob for ob, new in converted.items()}
+		for ob, added in lods.items():
+			realized.setdefault(sources.get(ob, ob), []).extend(added)
+
+	# Optimize the final meshes: (weld distance, triangulate)
+	if mesh_optimization_options:
+		yield "Optimizing meshes"
+		with instrumentation.phase("mesh_optimization"):
+			mesh_optimization.optimize_meshes(export_objects, *mesh_optimization_options)
 
 	# Create a single copy in multi-user datablocks. Will be restored after fixing rotations.
-	make_single_user_data()
+	# When keeping shared data the datablocks stay shared and get converted only once.
+	if not keep_shared_data:
+		yield "Copying shared data"
+		with instrumentation.phase("single_user"):
+			make_single_user_data(export_objects)
 
-	# Apply modifiers to objects (except those affected by an armature)
-	apply_object_modifiers()
+	# Reduce keyframes within the (position, rotation, scale) tolerances
+	if keyframe_tolerances:
+		yield "Reducing keyframes"
+		with instrumentation.phase("animation"):
+			animation.reduce_keyframes(export_objects, *keyframe_tolerances)
 
-	try:
-		# Fix rotations
-		for ob in root_objects:
-			print(ob.name, ob.type)
-			fix_object(ob)
+	# Fix rotations
+	yield "Fixing rotations"
+	with instrumentation.phase("rotation_fix"):
+		yield from fix_objects(required_objects, set(export_objects), shared_collections)
 
 		# Restore multi-user meshes
 		for item in shared_data:
-			bpy.data.objects[item].data = shared_data[item]
+			journal.set_attribute(bpy.data.objects[item], "data", shared_data[item])
 
 		# Recompute the transforms out of the changed matrices
-		bpy.context.view_layer.update()
-
-		# Restore hidden and disabled objects
-		for ob in hidden_objects:
-			ob.hide_set(True)
-		for ob in disabled_objects:
-			ob.hide_viewport = True
-
-		# Restore hidden and disabled collections
-		for col in hidden_collections:
-			col.hide_viewport = True
-		for col in disabled_collections:
-			col.collection.hide_viewport = True
-
-		# Restore selection
-		bpy.ops.object.select_all(action='DESELECT')
-		for ob in selection:
-			ob.select_set(True)
-   
-		if export_collections_as_empties:
-			empties = collections_as_empties.create_empties_as_collection_proxy(use_selection=selected_objects)
-			
-
-		# Export FBX file
-		params = dict(filepath=filepath,
+		context.view_layer.update()
+
+	# Merge static meshes in each collection: (split by material, vertex cap, exclusion property)
+	if merge_options:
+		yield "Merging static meshes"
+		with instrumentation.phase("merge"):
+			# Realized copies are in the partition of their instancer
+			unit_of = dict(partition or ())
+			pending = list(unit_of)
+			while pending:
+				ob = pending.pop()
+				for copy in realized.get(ob, ()):
+					unit_of[copy] = unit_of[ob]
+					pending.append(copy)
+
+			merged = merge.merge_static_meshes(context, export_objects, MATRIX_X_PLUS_90, *merge_options, {converted.get(ob, ob): unit for ob, unit in unit_of.items()})
+
+		merged_objects = list(dict.fromkeys(merged_ob for obs in merged.values() for merged_ob in obs))
+		export_objects = [ob for ob in export_objects if ob not in merged] + merged_objects
+		selection = [ob for ob in selection if ob not in merged] + list(dict.fromkeys(merged_ob for ob in selection for merged_ob in merged.get(ob, ())))
+		hidden_objects = [ob for ob in hidden_objects if ob not in merged]
+		disabled_objects = [ob for ob in disabled_objects if ob not in merged]
+
+		# Batch units are resolved from the objects before conversion. Merged objects replace
+		# their members.
+		sources = {new: ob for ob, new in converted.items()}
+		for ob, obs in merged.items():
+			converted[sources.get(ob, ob)] = None
+			realized.setdefault(sources.get(ob, ob), []).extend(obs)
+
+	# Write the textures of the exported objects to a shared folder: (folder, resolution cap)
+	if texture_options:
+		yield "Exporting textures"
+		with instrumentation.phase("textures"):
+			textures.export_textures(export_objects, *texture_options)
+
+	# Restore hidden and disabled objects
+	for ob in hidden_objects:
+		journal.set_hidden(ob, True)
+	for ob in disabled_objects:
+		journal.set_attribute(ob, "hide_viewport", True)
+
+	# Restore hidden and disabled collections
+	for col in hidden_collections:
+		journal.set_attribute(col, "hide_viewport", True)
+	for col in disabled_collections:
+		journal.set_attribute(col.collection, "hide_viewport", True)
+
+	# Restore selection
+	select_objects(context, selection)
+
+	return export_objects, converted, realized
+
+
+def select_objects(context, objects):
+	for ob in context.selected_objects:
+		journal.set_selected(ob, False)
+	for ob in objects:
+		journal.set_selected(ob, True)
+
+
+def get_batch_units(context, export_objects, batch_mode, batch_pattern):
+	# Split the export set into units written to separate FBX files.
+	# Returns a list of (name, objects) with each unit's objects and their descendants.
+	export_set = set(export_objects)
+	children = dict()
+	for ob in export_objects:
+		children.setdefault(ob.parent if ob.parent in export_set else None, []).append(ob)
+
+	def with_descendants(roots):
+		objects = []
+		pending = list(roots)
+		while pending:
+			ob = pending.pop()
+			objects.append(ob)
+			pending.extend(children.get(ob, ()))
+		return objects
+
+	root_objects = children.get(None, [])
+
+	if batch_mode == 'COLLECTION':
+		# One unit per top-level collection. Objects linked directly to the scene collection aren't exported.
+		units = []
+		for collection in context.scene.collection.children:
+			objects = [ob for ob in collection.all_objects if ob in export_set]
+			if objects:
+				units.append((collection.name, objects))
+		return units
+
+	if batch_mode == 'ROOT_OBJECT':
+		return [(ob.name, with_descendants([ob])) for ob in root_objects]
+
+	if batch_mode == 'PATTERN':
+		# Root objects are grouped by the first group captured by the pattern (or the whole match).
+		# Root objects not matching the pattern aren't exported.
+		pattern = re.compile(batch_pattern)
+		groups = dict()
+		for ob in root_objects:
+			match = pattern.search(ob.name)
+			if match:
+				name = match.group(1) if pattern.groups else match.group(0)
+				groups.setdefault(name, []).append(ob)
+		return [(name, with_descendants(roots)) for name, roots in groups.items()]
+
+	return []
+
+
+def get_vertex_count(ob):
+	# Estimated from the source mesh. Modifiers aren't evaluated to keep the memory low.
+	if ob.type == 'MESH':
+		return len(ob.data.vertices)
+	return 0
+
+
+def get_chunks(export_objects, chunk_mode, vertex_budget):
+	# Split the export set into chunks of at most vertex_budget vertices, written to separate
+	# FBX files. Hierarchies are kept together unless they exceed the budget on their own.
+	# Objects whose parent goes to a different chunk are written with their world transform,
+	# so the chunks are placed correctly when reassembled.
+	export_set = set(export_objects)
+	children = dict()
+	for ob in export_objects:
+		children.setdefault(ob.parent if ob.parent in export_set else None, []).append(ob)
+
+	# Vertices of each subtree, children first
+	subtree_vertices = dict()
+	order = []
+	pending = list(children.get(None, ()))
+	while pending:
+		ob = pending.pop()
+		order.append(ob)
+		pending.extend(children.get(ob, ()))
+	for ob in reversed(order):
+		subtree_vertices[ob] = get_vertex_count(ob) + sum(subtree_vertices[child] for child in children.get(ob, ()))
+
+	def get_subtree(root):
+		objects = []
+		pending = [root]
+		while pending:
+			ob = pending.pop()
+			objects.append(ob)
+			pending.extend(children.get(ob, ()))
+		return objects
+
+	# Items are (objects, vertices). Subtrees over the budget are split into their root
+	# object and the subtrees of its children. Armatures are never split from their meshes.
+	items = []
+	pending = list(reversed(children.get(None, ())))
+	while pending:
+		ob = pending.pop()
+		if subtree_vertices[ob] <= vertex_budget or not children.get(ob) or ob.type == 'ARMATURE':
+			items.append((get_subtree(ob), subtree_vertices[ob]))
+		else:
+			items.append(([ob], get_vertex_count(ob)))
+			pending.extend(reversed(children[ob]))
+
+	items = group_deformed_items(items)
+
+	if chunk_mode == 'GRID':
+		groups = split_grid([(item, item[0][0].matrix_world.translation) for item in items], vertex_budget)
+	else:
+		groups = [[item for item in items]]
+
+	# Pack the items of each group in order into chunks that fit the budget
+	chunks = []
+	for group in groups:
+		objects = []
+		vertices = 0
+		for item_objects, item_vertices in group:
+			if objects and vertices + item_vertices > vertex_budget:
+				chunks.append(objects)
+				objects = []
+				vertices = 0
+			objects.extend(item_objects)
+			vertices += item_vertices
+		if objects:
+			chunks.append(objects)
+
+	return chunks
+
+
+def group_deformed_items(items):
+	# Join the items of meshes deformed by an armature they aren't parented to with the
+	# item of the armature, so they are written to the same chunk and keep their skin.
+	# Items are (objects, vertices).
+	item_of = {ob: i for i, (objects, vertices) in enumerate(items) for ob in objects}
+	groups = list(range(len(items)))
+
+	def find(i):
+		while groups[i] != i:
+			groups[i] = groups[groups[i]]
+			i = groups[i]
+		return i
+
+	for ob, i in item_of.items():
+		for mod in ob.modifiers:
+			if mod.type == 'ARMATURE' and mod.object in item_of:
+				groups[find(i)] = find(item_of[mod.object])
+
+	# Joined items are placed where the first of them was
+	joined_objects = dict()
+	joined_vertices = dict()
+	for i, (objects, vertices) in enumerate(items):
+		root = find(i)
+		joined_objects.setdefault(root, []).extend(objects)
+		joined_vertices[root] = joined_vertices.get(root, 0) + vertices
+	return [(objects, joined_vertices[root]) for root, objects in joined_objects.items()]
+
+
+def split_grid(items, vertex_budget):
+	# Split the XY bounds of the items in four cells recursively until each cell fits the
+	# budget. Items are (item, position). Returns the items of each cell.
+	cells = []
+	pending = [items]
+
+	while pending:
+		cell = pending.pop()
+		if len(cell) < 2 or sum(item[1] for item, position in cell) <= vertex_budget:
+			cells.append([item for item, position in cell])
+			continue
+
+		min_x = min(position.x for item, position in cell)
+		max_x = max(position.x for item, position in cell)
+		min_y = min(position.y for item, position in cell)
+		max_y = max(position.y for item, position in cell)
+		mid_x = (min_x + max_x) / 2
+		mid_y = (min_y + max_y) / 2
+
+		quadrants = [[], [], [], []]
+		for item, position in cell:
+			quadrants[(position.x > mid_x) + 2 * (position.y > mid_y)].append((item, position))
+
+		# Items in the same position can't be split spatially
+		if max_x == min_x and max_y == min_y:
+			cells.append([item for item, position in cell])
+			continue
+
+		pending.extend(quadrant for quadrant in reversed(quadrants) if quadrant)
+
+	return cells
+
+
+# Options the non-destructive engine doesn't implement, with the value disabling them
+DIRECT_UNSUPPORTED_OPTIONS = dict(
+	batch_mode='OFF',
+	chunk_mode='OFF',
+	incremental=False,
+	instanced_collections='REALIZE',
+	optimize_meshes=False,
+	generate_lods=False,
+	merge_meshes=False,
+	reduce_keyframes=False,
+	export_textures=False,
+)
+
+
+def get_direct_fallback_reason(options):
+	# Returns why an export with the non-destructive engine must use the default engine
+	# instead, or None. Options use the names of the operator properties.
+	enabled = [name for name, value in DIRECT_UNSUPPORTED_OPTIONS.items() if options[name] != value]
+	if enabled:
+		return "not supported with %s" % ", ".join(enabled)
+	return None
+
+
+def get_fbx_params(filepath, active_collection, selected_objects, use_custom_properites, tangent_space, triangulate_faces, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, path_mode='AUTO'):
+	return dict(filepath=filepath,
                 apply_scale_options='FBX_SCALE_UNITS',
                 object_types={'EMPTY', 'MESH', 'ARMATURE'},
                 use_active_collection=active_collection,
@@ -225,33 +871,204 @@ def export_unity_fbx(context, filepath, active_collection, selected_objects, exp
                 use_armature_deform_only=deform_bones,
                 add_leaf_bones=leaf_bones,
                 primary_bone_axis=primary_bone_axis,
-                secondary_bone_axis=secondary_bone_axis
-		)
+                secondary_bone_axis=secondary_bone_axis,
+                path_mode=path_mode
+	)
+
+
+def write_file(filepath, write, write_if_changed):
+	# Write the file with write(filepath). When only writing changes, an existing file is
+	# replaced only if the new one is different, ignoring timestamps and ids. Its modification
+	# time is kept otherwise, so Unity doesn't import it again.
+	if not write_if_changed or not os.path.exists(filepath):
+		write(filepath)
+		instrumentation.count("files_written")
+		return
+
+	# Files starting with a dot are ignored by Unity
+	temp_filepath = os.path.join(os.path.dirname(filepath), "." + os.path.basename(filepath))
+	try:
+		write(temp_filepath)
+		with instrumentation.phase("compare"):
+			changed = not fbx_reader.files_equal(temp_filepath, filepath)
+		if changed:
+			os.replace(temp_filepath, filepath)
+	finally:
+		if os.path.exists(temp_filepath):
+			os.remove(temp_filepath)
+
+	instrumentation.count("files_written" if changed else "files_unchanged")
+	logger.debug("%s: %s", filepath, "changed" if changed else "unchanged")
+
 
-		print("Invoking default FBX Exporter:", params)
+def call_fbx_exporter(params):
+	logger.debug("Invoking default FBX Exporter: %s", params)
+	with instrumentation.phase("fbx_write"):
 		bpy.ops.export_scene.fbx(**params)
+	instrumentation.count("operator_calls")
+
+
+def write_fbx_file(context, filepath, objects, export_collections_as_empties, fbx_options, write_if_changed=False):
+	# Write the given objects of the prepared scene to their own FBX file by selecting them
+	select_objects(context, objects)
+
+	if export_collections_as_empties:
+		with instrumentation.phase("empties"):
+			collections_as_empties.create_empties_as_collection_proxy(use_selection=True)
+
+	params = get_fbx_params(filepath, False, True, *fbx_options)
+	write_file(filepath, lambda path: call_fbx_exporter(dict(params, filepath=path)), write_if_changed)
+
+
+def export_unity_fbx(*args, **kwargs):
+	# Export in a single call. See export_unity_fbx_steps for the arguments.
+	return run_steps(export_unity_fbx_steps(*args, **kwargs))
+
+
+def export_unity_fbx_steps(context, filepath, active_collection, selected_objects, export_collections_as_empties, use_custom_properites, tangent_space, triangulate_faces, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, keep_shared_data=False, batch_mode='OFF', batch_pattern="", incremental=False, write_report=False, instanced_collections='REALIZE', chunk_mode='OFF', chunk_vertex_budget=1000000, reduce_keyframes=False, position_tolerance=0.001, rotation_tolerance=0.0017453, scale_tolerance=0.001, only_units=None, optimize_meshes=False, weld_distance=0.0001, generate_lods=False, lod_ratios="0.5, 0.25", merge_meshes=False, merge_by_material=False, merge_vertex_cap=65535, merge_exclude_property="unity_keep_separate", write_if_changed=False, export_textures=False, texture_folder="Textures", texture_max_size=2048):
+	# Generator yielding a description of the next step between steps. Closing it before it
+	# finishes cancels the export and restores the scene.
+	global last_error
+	global running
+
+	logger.info("Preparing 3D model for Unity...")
+	last_error = None
+	instrumentation.begin(filepath)
+
+	keyframe_tolerances = (position_tolerance, rotation_tolerance, scale_tolerance) if reduce_keyframes else None
+	mesh_optimization_options = (weld_distance, triangulate_faces) if optimize_meshes else None
+	lod_ratios = lod.parse_ratios(lod_ratios) if generate_lods else None
+	merge_options = (merge_by_material, merge_vertex_cap, merge_exclude_property) if merge_meshes else None
+	directory = os.path.dirname(filepath)
+	texture_options = (os.path.join(directory, bpy.path.abspath(texture_folder)), texture_max_size) if export_textures else None
+	# Textures written to the shared folder are referenced with paths relative to the FBX files
+	fbx_options = (use_custom_properites, tangent_space, triangulate_faces, deform_bones, leaf_bones, primary_bone_axis, secondary_bone_axis, 'RELATIVE' if export_textures else 'AUTO')
+
+	# Resolve the export set once
+	export_objects = get_export_objects(bpy.context, active_collection, selected_objects)
+
+	# Units written to separate FBX files: (file name, objects)
+	if batch_mode == 'OFF':
+		units = [(os.path.basename(filepath), export_objects)]
+	else:
+		# Batch units can be restricted to the given unit names
+		units = [(bpy.path.clean_name(name) + ".fbx", objects) for name, objects in get_batch_units(bpy.context, export_objects, batch_mode, batch_pattern) if only_units is None or name in only_units]
+
+	# Chunked export: each unit is split into chunks that fit the vertex budget
+	if chunk_mode != 'OFF':
+		units = [(os.path.splitext(filename)[0] + "_chunk_%d.fbx" % i, chunk) for filename, objects in units for i, chunk in enumerate(get_chunks(objects, chunk_mode, chunk_vertex_budget))]
+		instrumentation.count("chunks", len(units))
+
+	# Incremental export: skip the files whose contents wouldn't change
+	if incremental:
+		with instrumentation.phase("fingerprint"):
+			options = (export_collections_as_empties, keep_shared_data, instanced_collections, keyframe_tolerances, mesh_optimization_options, lod_ratios, merge_options, texture_options, batch_mode == 'OFF' and chunk_mode == 'OFF' and (active_collection, selected_objects)) + fbx_options
+			files = manifest.load(directory)
+			fingerprints = {filename: manifest.get_fingerprint(objects, options) for filename, objects in units}
+			skipped = [filename for filename, objects in units if files.get(filename) == fingerprints[filename] and os.path.exists(os.path.join(directory, filename))]
+			units = [unit for unit in units if unit[0] not in skipped]
+
+		manifest.last_result = dict(written=[filename for filename, objects in units], skipped=skipped)
+		instrumentation.count("files_skipped", len(skipped))
+		logger.info("Unchanged FBX files skipped: %s", skipped)
+
+		if not units:
+			logger.info("All FBX files for Unity are up to date.")
+			finish_report(filepath, write_report)
+			return {'FINISHED'}
+
+	# Every change from now on is recorded so the scene can be restored after exporting
+	journal.begin()
+	textures.begin()
+	running = True
+
+	try:
+		if chunk_mode != 'OFF':
+			# Chunked export: each chunk is prepared, written and restored in turn, so the
+			# copies and evaluated meshes of a single chunk are in memory at a time.
+			for i, (filename, objects) in enumerate(units):
+				yield "Preparing %s (%d/%d)" % (filename, i + 1, len(units))
+				objects, converted, realized = yield from prepare_scene_steps(bpy.context, objects, keep_shared_data, instanced_collections, keyframe_tolerances, mesh_optimization_options, lod_ratios, merge_options, texture_options=texture_options)
+				yield "Writing %s (%d/%d)" % (filename, i + 1, len(units))
+				write_fbx_file(bpy.context, os.path.join(directory, filename), objects, export_collections_as_empties, fbx_options, write_if_changed)
+
+				with instrumentation.phase("restore"):
+					journal.restore()
+
+			logger.info("Exported %d FBX chunks to %s", len(units), directory)
+
+		elif batch_mode == 'OFF':
+			export_objects, converted, realized = yield from prepare_scene_steps(bpy.context, export_objects, keep_shared_data, instanced_collections, keyframe_tolerances, mesh_optimization_options, lod_ratios, merge_options, texture_options=texture_options)
+			yield "Writing %s" % os.path.basename(filepath)
+
+			if export_collections_as_empties:
+				with instrumentation.phase("empties"):
+					collections_as_empties.create_empties_as_collection_proxy(use_selection=selected_objects)
+
+			# Export FBX file
+			params = get_fbx_params(filepath, active_collection, selected_objects, *fbx_options)
+			write_file(filepath, lambda path: call_fbx_exporter(dict(params, filepath=path)), write_if_changed)
+
+		else:
+			# Batch export: the scene is prepared once, then each unit is written to its own
+			# FBX file in the destination folder by selecting its objects.
+			# Objects are only merged with objects written to the same file
+			partition = {ob: i for i, (filename, objects) in enumerate(units) for ob in objects}
+			export_objects, converted, realized = yield from prepare_scene_steps(bpy.context, export_objects, keep_shared_data, instanced_collections, keyframe_tolerances, mesh_optimization_options, lod_ratios, merge_options, partition, texture_options)
+
+			for i, (filename, objects) in enumerate(units):
+				yield "Writing %s (%d/%d)" % (filename, i + 1, len(units))
+				# Changes made for this unit only are reverted before the next one
+				position = journal.mark()
+				objects = [converted.get(ob, ob) for ob in with_instances(objects, realized)]
+				objects = [ob for ob in objects if ob is not None]
+				write_fbx_file(bpy.context, os.path.join(directory, filename), objects, export_collections_as_empties, fbx_options, write_if_changed)
+				journal.restore(position)
+
+			logger.info("Exported %d FBX files to %s", len(units), directory)
+
+	except GeneratorExit:
+		# Cancelled. Files already written are kept.
+		with instrumentation.phase("restore"):
+			journal.restore()
+		running = False
+
+		last_error = "Export cancelled"
+		logger.warning("Export cancelled")
+		finish_report(filepath, write_report)
+		raise
 
 	except Exception as e:
-		if export_collections_as_empties:
-			collections_as_empties.remove_empties(empties=empties)
-     
-		bpy.ops.ed.undo_push(message="")
-		bpy.ops.ed.undo()
-		bpy.ops.ed.undo_push(message="Export Unity FBX")
-  
-		print(e)
-		print("File not saved.")
+		# Restore scene, including the proxy Empties that were created
+		with instrumentation.phase("restore"):
+			journal.restore()
+		running = False
+
+		last_error = str(e)
+		logger.error("File not saved: %s", e)
+		finish_report(filepath, write_report)
 		# Always finish with 'FINISHED' so Undo is handled properly
 		return {'FINISHED'}
 
-	# Restore scene and finish
+	# Restore scene and finish, including the proxy Empties that were created
+	with instrumentation.phase("restore"):
+		journal.restore()
+	running = False
+
+	# Files are recorded in the manifest only once they've been written
+	if incremental:
+		files.update((filename, fingerprints[filename]) for filename, objects in units)
+		manifest.save(directory, files)
+
+	logger.info("FBX file for Unity saved.")
+	finish_report(filepath, write_report)
+	return {'FINISHED'}
 
-	# Remove proxy Empties that were created.
-	if export_collections_as_empties:
-		collections_as_empties.remove_empties(empties=empties)
 
-	bpy.ops.ed.undo_push(message="")
-	bpy.ops.ed.undo()
-	bpy.ops.ed.undo_push(message="Export Unity FBX")
-	print("FBX file for Unity saved.")
-	return {'FINISHED'}
\ No newline at end of file
+def finish_report(filepath, write_report):
+	# The report is always available in instrumentation.last_report. It's also saved
+	# next to the FBX file when requested.
+	report = instrumentation.end()
+	report["error"] = last_error
+	if write_report:
+		instrumentation.write(report, os.path.splitext(filepath)[0] + ".report.json")
@@ -0,0 +1,191 @@
+import numpy as np
+import struct
+import zlib
+
+# Binary FBX reader.
+# Parses binary FBX files into a tree of nodes. Array properties (vertices, indices,
+# normals, UVs...) are read as NumPy arrays. Doesn't depend on bpy, so FBX files can be
+# inspected and compared outside Blender too.
+
+MAGIC = b"Kaydara FBX Binary  \x00"
+
+SCALAR_TYPES = {b"Y": "<h", b"C": "<?", b"I": "<i", b"F": "<f", b"D": "<d", b"L": "<q"}
+ARRAY_TYPES = {b"f": np.dtype("<f4"), b"d": np.dtype("<f8"), b"l": np.dtype("<i8"), b"i": np.dtype("<i4"), b"b": np.dtype("<?")}
+
+# Top-level nodes that change on every export: creation time, creator, file id, and the
+# scene info with the file path and dates
+VOLATILE_NODES = {"FBXHeaderExtension", "FileId", "CreationTime", "Creator"}
+
+# Nodes whose children are the objects referenced by id in the connections
+ID_NODES = {"Objects", "Documents"}
+
+
+class Node:
+	def __init__(self, name, properties, children):
+		self.name = name
+		self.properties = properties
+		self.children = children
+
+	def find(self, name):
+		return next((child for child in self.children if child.name == name), None)
+
+	def find_all(self, name):
+		return [child for child in self.children if child.name == name]
+
+	def __repr__(self):
+		return "Node(%s, %d properties, %d children)" % (self.name, len(self.properties), len(self.children))
+
+
+def read_node(data, offset, wide):
+	# Returns the node at the offset and the offset after it. The node is None for the null
+	# record closing a list of nodes.
+	if wide:
+		end, count, length = struct.unpack_from("<QQQ", data, offset)
+		offset += 24
+	else:
+		end, count, length = struct.unpack_from("<III", data, offset)
+		offset += 12
+
+	name_length = data[offset]
+	offset += 1
+	if end == 0:
+		return None, offset
+
+	name = data[offset:offset + name_length].decode()
+	offset += name_length
+
+	properties = []
+	for i in range(count):
+		code = data[offset:offset + 1]
+		offset += 1
+		if code in SCALAR_TYPES:
+			value = struct.unpack_from(SCALAR_TYPES[code], data, offset)[0]
+			offset += struct.calcsize(SCALAR_TYPES[code])
+		elif code in ARRAY_TYPES:
+			array_length, encoding, size = struct.unpack_from("<III", data, offset)
+			offset += 12
+			buffer = data[offset:offset + size]
+			offset += size
+			if encoding == 1:
+				buffer = zlib.decompress(buffer)
+			value = np.frombuffer(buffer, ARRAY_TYPES[code], count=array_length)
+		elif code in (b"S", b"R"):
+			size = struct.unpack_from("<I", data, offset)[0]
+			offset += 4
+			value = bytes(data[offset:offset + size])
+			offset += size
+		else:
+			raise ValueError("Unknown FBX property type %r in %s" % (code, name))
+		properties.append(value)
+
+	children = []
+	while offset < end:
+		child, offset = read_node(data, offset, wide)
+		if child is None:
+			break
+		children.append(child)
+
+	return Node(name, properties, children), end
+
+
+def parse(data):
+	# Returns the FBX version and the top-level nodes
+	if data[:len(MAGIC)] != MAGIC:
+		raise ValueError("Not a binary FBX file")
+
+	version = struct.unpack_from("<I", data, 23)[0]
+	offset = 27
+	nodes = []
+	while offset < len(data):
+		node, offset = read_node(data, offset, version >= 7500)
+		if node is None:
+			break
+		nodes.append(node)
+	return version, nodes
+
+
+def read(filepath):
+	with open(filepath, "rb") as f:
+		return parse(f.read())
+
+
+def split_name(value):
+	# FBX names are stored as b"Name\x00\x01Class"
+	return value.split(b"\x00\x01")[0].decode(errors="replace")
+
+
+def get_properties70(node):
+	# Values of the P nodes in the Properties70 of a node, by name
+	properties = node.find("Properties70")
+	if properties is None:
+		return dict()
+	return {p.properties[0].decode(errors="replace"): p.properties[4:] for p in properties.find_all("P")}
+
+
+def get_models(nodes):
+	# Models (objects) by name, with their Properties70 (Lcl Translation, Lcl Rotation...)
+	objects = next((node for node in nodes if node.name == "Objects"), None)
+	if objects is None:
+		return dict()
+	return {split_name(model.properties[1]): get_properties70(model) for model in objects.find_all("Model")}
+
+
+def get_geometry_vertices(nodes):
+	# Vertex positions of each geometry by name, as N x 3 arrays
+	objects = next((node for node in nodes if node.name == "Objects"), None)
+	if objects is None:
+		return dict()
+	return {split_name(geometry.properties[1]): geometry.find("Vertices").properties[0].reshape(-1, 3)
+		for geometry in objects.find_all("Geometry") if geometry.find("Vertices") is not None}
+
+
+def get_ids(nodes):
+	# Ids of the objects, replaced in comparisons by their node name, name and class (and
+	# order among objects with the same ones)
+	ids = dict()
+	seen = dict()
+	for node in nodes:
+		if node.name not in ID_NODES:
+			continue
+		for child in node.children:
+			if child.properties and type(child.properties[0]) is int:
+				key = (child.name,) + tuple(p for p in child.properties[1:] if isinstance(p, bytes))
+				seen[key] = seen.get(key, 0) + 1
+				ids[child.properties[0]] = key + (seen[key],)
+	return ids
+
+
+def nodes_equal(a, b, ids_a, ids_b):
+	if a.name != b.name or len(a.properties) != len(b.properties) or len(a.children) != len(b.children):
+		return False
+
+	for value_a, value_b in zip(a.properties, b.properties):
+		if isinstance(value_a, np.ndarray) or isinstance(value_b, np.ndarray):
+			if not (isinstance(value_a, np.ndarray) and isinstance(value_b, np.ndarray) and value_a.dtype == value_b.dtype and np.array_equal(value_a, value_b)):
+				return False
+		elif type(value_a) is int and type(value_b) is int:
+			if ids_a.get(value_a, value_a) != ids_b.get(value_b, value_b):
+				return False
+		elif value_a != value_b:
+			return False
+
+	return all(nodes_equal(child_a, child_b, ids_a, ids_b) for child_a, child_b in zip(a.children, b.children))
+
+
+def files_equal(filepath_a, filepath_b):
+	# Semantic comparison: timestamps, file paths in the header and object ids are ignored.
+	# Files that can't be read are different.
+	try:
+		version_a, nodes_a = read(filepath_a)
+		version_b, nodes_b = read(filepath_b)
+	except (OSError, ValueError, struct.error, zlib.error):
+		return False
+
+	nodes_a = [node for node in nodes_a if node.name not in VOLATILE_NODES]
+	nodes_b = [node for node in nodes_b if node.name not in VOLATILE_NODES]
+	if version_a != version_b or len(nodes_a) != len(nodes_b):
+		return False
+
+	ids_a = get_ids(nodes_a)
+	ids_b = get_ids(nodes_b)
+	return all(nodes_equal(a, b, ids_a, ids_b) for a, b in zip(nodes_a, nodes_b))
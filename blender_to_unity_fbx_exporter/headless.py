@@ -0,0 +1,133 @@
+import bpy
+import time
+
+from . import export
+from . import instrumentation
+from .instrumentation import logger
+from .direct_export import export_unity_fbx_direct
+
+# Export entry point for scripts and headless Blender sessions (blender --background).
+# Options use the same names as the properties of the Export Unity FBX operator.
+
+DEFAULT_OPTIONS = dict(
+	export_engine='SCENE',
+	active_collection=False,
+	selected_objects=False,
+	batch_mode='OFF',
+	batch_pattern=r"^([^._]+)",
+	incremental=False,
+	write_if_changed=False,
+	chunk_mode='OFF',
+	chunk_vertex_budget=1000000,
+	export_collections_as_empties=False,
+	instanced_collections='REALIZE',
+	include_custom_properties=False,
+	tangent_space=False,
+	triangulate_faces=False,
+	keep_shared_data=False,
+	optimize_meshes=False,
+	weld_distance=0.0001,
+	generate_lods=False,
+	lod_ratios="0.5, 0.25",
+	merge_meshes=False,
+	merge_by_material=False,
+	merge_vertex_cap=65535,
+	merge_exclude_property="unity_keep_separate",
+	export_textures=False,
+	texture_folder="Textures",
+	texture_max_size=2048,
+	reduce_keyframes=False,
+	position_tolerance=0.001,
+	rotation_tolerance=0.0017453,
+	scale_tolerance=0.001,
+	deform_bones=False,
+	leaf_bones=False,
+	primary_bone_axis='Y',
+	secondary_bone_axis='X',
+	write_report=False,
+)
+
+
+def get_options(options):
+	unknown = set(options) - set(DEFAULT_OPTIONS)
+	if unknown:
+		raise ValueError("Unknown export options: %s" % ", ".join(sorted(unknown)))
+	return dict(DEFAULT_OPTIONS, **options)
+
+
+def export_file(filepath, options=None):
+	# Export the currently loaded scene to filepath.
+	# Returns a result dictionary with the elapsed time, the error, if any, and the
+	# per-phase report of the export.
+	options = get_options(options or dict())
+	start = time.perf_counter()
+	instrumentation.last_report = None
+
+	try:
+		result = None
+		reason = export.get_direct_fallback_reason(options) if options["export_engine"] == 'DIRECT' else None
+		if reason:
+			logger.warning("Non-destructive export %s. Using the default engine.", reason)
+		elif options["export_engine"] == 'DIRECT':
+			result = export_unity_fbx_direct(bpy.context,
+				filepath,
+				options["active_collection"],
+				options["selected_objects"],
+				options["export_collections_as_empties"],
+				options["include_custom_properties"],
+				options["tangent_space"],
+				options["triangulate_faces"],
+				write_report=options["write_report"],
+				write_if_changed=options["write_if_changed"]
+			)
+
+		if result is None:
+			export.export_unity_fbx(bpy.context,
+				filepath,
+				options["active_collection"],
+				options["selected_objects"],
+				options["export_collections_as_empties"],
+				options["include_custom_properties"],
+				options["tangent_space"],
+				options["triangulate_faces"],
+				options["deform_bones"],
+				options["leaf_bones"],
+				options["primary_bone_axis"],
+				options["secondary_bone_axis"],
+				keep_shared_data=options["keep_shared_data"],
+				batch_mode=options["batch_mode"],
+				batch_pattern=options["batch_pattern"],
+				incremental=options["incremental"],
+				write_report=options["write_report"],
+				instanced_collections=options["instanced_collections"],
+				chunk_mode=options["chunk_mode"],
+				chunk_vertex_budget=options["chunk_vertex_budget"],
+				reduce_keyframes=options["reduce_keyframes"],
+				position_tolerance=options["position_tolerance"],
+				rotation_tolerance=options["rotation_tolerance"],
+				scale_tolerance=options["scale_tolerance"],
+				optimize_meshes=options["optimize_meshes"],
+				weld_distance=options["weld_distance"],
+				generate_lods=options["generate_lods"],
+				lod_ratios=options["lod_ratios"],
+				merge_meshes=options["merge_meshes"],
+				merge_by_material=options["merge_by_material"],
+				merge_vertex_cap=options["merge_vertex_cap"],
+				merge_exclude_property=options["merge_exclude_property"],
+				write_if_changed=options["write_if_changed"],
+				export_textures=options["export_textures"],
+				texture_folder=options["texture_folder"],
+				texture_max_size=options["texture_max_size"]
+			)
+
+		error = export.last_error
+	except Exception as e:
+		error = str(e)
+
+	return dict(
+		filepath=filepath,
+		status="failed" if error else "ok",
+		error=error,
+		seconds=time.perf_counter() - start,
+		report=instrumentation.last_report,
+	)
@@ -0,0 +1,56 @@
+import numpy as np
+
+# Hierarchy transforms in bulk.
+# Matrices are packed in N x 4 x 4 arrays (row-major, like mathutils) and parents are given
+# as indices into the same arrays (-1 for no parent). Doesn't depend on bpy.
+#
+# Objects parented to a bone or to vertices are placed relative to the bone or vertex frame,
+# not to the parent's world matrix. These frames are passed separately (framed objects).
+#
+# Blender's foreach_get / foreach_set read and write matrices column by column: use
+# from_flat / to_flat to convert.
+
+
+def from_flat(values):
+	# Flat column-major matrices -> N x 4 x 4 row-major
+	return np.asarray(values, dtype=np.float64).reshape(-1, 4, 4).transpose(0, 2, 1)
+
+
+def to_flat(matrices, dtype=np.float32):
+	# N x 4 x 4 row-major -> flat column-major matrices
+	return np.ascontiguousarray(matrices.transpose(0, 2, 1), dtype=dtype).reshape(-1)
+
+
+def get_parent_matrices(matrices, parents):
+	# Matrix of each parent, identity for objects without one
+	result = np.broadcast_to(np.identity(4), matrices.shape).copy()
+	has_parent = parents >= 0
+	result[has_parent] = matrices[parents[has_parent]]
+	return result
+
+
+def get_parent_frames(world, parent_inverse, basis):
+	# World matrix of the frame an object is parented to (its parent's world matrix, or the
+	# bone or vertex frame): world = frame @ parent_inverse @ basis
+	return world @ np.linalg.pinv(parent_inverse @ basis)
+
+
+def get_local_matrices(world, parents, frames=None, framed=None):
+	# Local matrices relative to the parent's world matrix, or to the given frame for the
+	# framed objects, with an identity parent inverse: parent_world @ local = world
+	parent_world = get_parent_matrices(world, parents)
+	if frames is not None:
+		parent_world[framed] = frames[framed]
+	return np.linalg.solve(parent_world, world)
+
+
+def get_converted_matrices(world, parents, converted, conversion, frames=None, framed=None):
+	# Converted local matrices of a hierarchy. The geometry of the converted objects receives
+	# the inverse conversion, so they receive the conversion to preserve their visual pose:
+	# their world matrix becomes world @ conversion. Other objects keep their world matrix.
+	# Every world matrix only depends on the original one, so the whole hierarchy is converted
+	# at once instead of walking it from the roots.
+	# Bone and vertex frames keep their world matrix, as the armature or mesh data receives
+	# the inverse conversion too.
+	world = np.where(converted[:, None, None], world @ np.asarray(conversion, dtype=np.float64), world)
+	return get_local_matrices(world, parents, frames, framed)
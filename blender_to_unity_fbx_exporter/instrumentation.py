@@ -0,0 +1,139 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+# Logging and per-phase export statistics.
+#
+# All the add-on messages go through this logger, which is silent by default. Enable them with:
+#   logging.getLogger("blender_to_unity_fbx_exporter").setLevel(logging.DEBUG)
+#   logging.getLogger("blender_to_unity_fbx_exporter").addHandler(logging.StreamHandler())
+logger = logging.getLogger("blender_to_unity_fbx_exporter")
+logger.addHandler(logging.NullHandler())
+
+# Statistics of the export in progress and of the last finished export (available to scripts):
+# wall time and peak memory of each phase, plus counters (objects, datablocks, vertices...)
+current = None
+last_report = None
+
+# Seconds between memory samples while a phase runs
+SAMPLE_INTERVAL = 0.02
+
+
+def get_current_memory():
+	# Current resident memory of the process in MB, where the platform exposes it (Linux)
+	try:
+		with open("/proc/self/statm", "r") as f:
+			pages = int(f.read().split()[1])
+		return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+	except (OSError, ValueError, IndexError, AttributeError):
+		return None
+
+
+def get_peak_memory():
+	# Peak resident memory of the process in MB since it started, if the platform exposes it
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Kilobytes in Linux, bytes in macOS
+	return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def begin(filepath):
+	global current
+	current = dict(filepath=filepath, phases=[], counters=dict(), start=time.perf_counter())
+
+
+class MemorySampler:
+	# Samples the resident memory from a background thread, to find the peak of a phase.
+	# The thread only runs while Blender isn't holding the GIL, so the process peak is
+	# used too when it was raised during the phase.
+	def __init__(self):
+		self.start = get_current_memory()
+		self.peak = self.start
+		self.process_peak = get_peak_memory()
+		self.stopped = threading.Event()
+		self.thread = None
+		if self.start is not None:
+			self.thread = threading.Thread(target=self.run, daemon=True)
+			self.thread.start()
+
+	def run(self):
+		while not self.stopped.wait(SAMPLE_INTERVAL):
+			self.sample()
+
+	def sample(self):
+		memory = get_current_memory()
+		if memory is not None and memory > self.peak:
+			self.peak = memory
+
+	def stop(self):
+		# Returns the memory at the start of the phase and its peak, in MB
+		self.stopped.set()
+		if self.thread:
+			self.thread.join()
+			self.sample()
+		process_peak = get_peak_memory()
+		if process_peak is not None and self.process_peak is not None and process_peak > self.process_peak:
+			self.peak = max(self.peak or 0.0, process_peak)
+		return self.start, self.peak
+
+
+@contextlib.contextmanager
+def phase(name):
+	start = time.perf_counter()
+	sampler = MemorySampler() if current is not None else None
+	try:
+		yield
+	finally:
+		seconds = time.perf_counter() - start
+		if current is not None and sampler is not None:
+			memory_start, memory_peak = sampler.stop()
+			current["phases"].append(dict(
+				name=name,
+				seconds=seconds,
+				memory_start_mb=memory_start,
+				peak_memory_mb=memory_peak,
+				memory_delta_mb=memory_peak - memory_start if memory_peak is not None and memory_start is not None else None,
+				process_peak_memory_mb=get_peak_memory(),
+			))
+		logger.debug("%s: %.3fs", name, seconds)
+
+
+def count(name, value=1):
+	if current is not None:
+		current["counters"][name] = current["counters"].get(name, 0) + value
+
+
+def end():
+	global current
+	global last_report
+
+	if current is None:
+		return None
+
+	report = dict(
+		filepath=current["filepath"],
+		seconds=time.perf_counter() - current["start"],
+		process_peak_memory_mb=get_peak_memory(),
+		phases=current["phases"],
+		counters=current["counters"],
+	)
+	current = None
+	last_report = report
+
+	logger.info("Export finished in %.3fs", report["seconds"])
+	return report
+
+
+def write(report, path):
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump(report, f, indent=1)
@@ -0,0 +1,185 @@
+import bpy
+import mathutils
+import numpy as np
+
+from .instrumentation import logger
+
+# Every change made to the scene while preparing the export is recorded here as a
+# (function, arguments) pair that reverts it. restore() runs them in reverse order,
+# so the scene is restored by touching only what was actually changed.
+entries = []
+
+
+def begin():
+	global entries
+	entries = []
+
+
+def set_attribute(owner, name, value):
+	previous = getattr(owner, name)
+	# Matrices and vectors are views into the owner's memory
+	if isinstance(previous, (mathutils.Matrix, mathutils.Vector)):
+		previous = previous.copy()
+
+	entries.append((setattr, (owner, name, previous)))
+	setattr(owner, name, value)
+
+
+def set_hidden(ob, state):
+	entries.append((ob.hide_set, (ob.hide_get(),)))
+	ob.hide_set(state)
+
+
+def set_selected(ob, state):
+	entries.append((ob.select_set, (ob.select_get(),)))
+	ob.select_set(state)
+
+
+def set_matrices(objects, name, values):
+	# Bulk write of a matrix property of many objects, given as flat column-major arrays
+	previous = foreach_matrices(objects, name, values)
+	entries.append((foreach_matrices, (objects, name, previous)))
+
+
+def foreach_matrices(objects, name, values=None):
+	# Returns the matrix property of the objects as a flat column-major array, and writes the
+	# given values if any. foreach_get / foreach_set only work on collections, so the objects
+	# are gathered in a temporary one.
+	collection = bpy.data.collections.new("Unity FBX matrices")
+	try:
+		for ob in objects:
+			collection.objects.link(ob)
+		previous = np.empty(len(objects) * 16, dtype=np.float32)
+		collection.objects.foreach_get(name, previous)
+		if values is not None:
+			collection.objects.foreach_set(name, values)
+	finally:
+		bpy.data.collections.remove(collection)
+
+	# foreach_set doesn't tag the objects for update
+	if values is not None:
+		for ob in objects:
+			ob.update_tag(refresh={'OBJECT'})
+	return previous
+
+
+def rename(id_data, name):
+	set_attribute(id_data, "name", name)
+
+
+def link_object(collection, ob):
+	collection.objects.link(ob)
+	entries.append((collection.objects.unlink, (ob,)))
+
+
+def unlink_object(collection, ob):
+	collection.objects.unlink(ob)
+	entries.append((collection.objects.link, (ob,)))
+
+
+def add_created(id_data):
+	# Datablocks created during preparation are removed on restore
+	entries.append((remove_created, (id_data,)))
+	return id_data
+
+
+def remove_created(id_data):
+	bpy.data.batch_remove((id_data,))
+
+
+def add_created_list(ids):
+	# Many datablocks created at once are removed in a single call
+	entries.append((remove_created_list, (tuple(ids),)))
+	return ids
+
+
+def remove_created_list(ids):
+	bpy.data.batch_remove(ids)
+
+
+def get_created():
+	# Datablocks created since the journal began, which can be modified freely
+	created = set()
+	for function, args in entries:
+		if function is remove_created:
+			created.add(args[0])
+		elif function is remove_created_list:
+			created.update(args[0])
+	return created
+
+
+def transform_data(data, matrix):
+	# Transforms are reverted by applying the inverse matrix.
+	# Exact with the integer rotation matrices used for the axis conversion.
+	if isinstance(data, bpy.types.Armature):
+		# Armature.transform recomputes the bone rolls, so the inverse transform may not give
+		# the original rolls back. The bone matrices are saved to be checked on restore.
+		bones = (tuple(bone.name for bone in data.bones), get_bone_matrices(data))
+		transform(data, matrix)
+		entries.append((restore_armature, (data, matrix.inverted(), bones)))
+		return
+
+	transform(data, matrix)
+	entries.append((transform, (data, matrix.inverted())))
+
+
+def transform(data, matrix):
+	if isinstance(data, (bpy.types.Mesh, bpy.types.Curve, bpy.types.Lattice)):
+		data.transform(matrix, shape_keys=True)
+	else:
+		data.transform(matrix)
+
+
+def get_bone_matrices(armature):
+	matrices = np.empty(len(armature.bones) * 16, dtype=np.float32)
+	armature.bones.foreach_get("matrix_local", matrices)
+	return matrices
+
+
+def restore_armature(armature, matrix, bones):
+	transform(armature, matrix)
+
+	names, matrices = bones
+	if np.allclose(get_bone_matrices(armature), matrices, atol=1e-5):
+		return
+
+	# Bones can only be edited in edit mode: the saved matrices are set back through an
+	# object using the armature
+	ob = next((ob for ob in bpy.context.view_layer.objects if ob.data == armature), None)
+	if ob is None:
+		logger.warning("Couldn't restore the bone rolls of %s", armature.name)
+		return
+
+	logger.debug("Restoring the bone rolls of %s", armature.name)
+	with bpy.context.temp_override(active_object=ob, object=ob, selected_objects=[ob], selected_editable_objects=[ob]):
+		bpy.ops.object.mode_set(mode='EDIT')
+		try:
+			# foreach_get reads matrices column by column
+			for name, values in zip(names, matrices.reshape(-1, 4, 4)):
+				armature.edit_bones[name].matrix = mathutils.Matrix(values.T.tolist())
+		finally:
+			bpy.ops.object.mode_set(mode='OBJECT')
+
+
+def mark():
+	# Position in the journal that can be restored later with restore(position)
+	return len(entries)
+
+
+def discard():
+	# Forget the recorded changes without reverting them, when the datablocks they refer to
+	# no longer exist (a file was loaded)
+	global entries
+	entries = []
+
+
+def restore(position=0):
+	# Revert in reverse order. Keep going on errors so a single failure doesn't leave
+	# the rest of the scene modified. When a position is given only the changes made
+	# after it are reverted.
+	while len(entries) > position:
+		function, args = entries.pop()
+		try:
+			function(*args)
+		except Exception as e:
+			logger.error("Couldn't restore scene change: %s", e)
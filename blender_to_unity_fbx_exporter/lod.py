@@ -0,0 +1,133 @@
+import bpy
+import mathutils
+import re
+
+from . import instrumentation
+from . import journal
+from .instrumentation import logger
+
+# LOD chains.
+# Each exported mesh object is replaced with an empty taking its name, place and children,
+# with the object renamed to Name_LOD0 and decimated copies Name_LOD1, Name_LOD2... as
+# siblings. Unity creates a LOD Group in the empty when importing the FBX file.
+# The decimated meshes are generated once per mesh, so every user of a shared mesh gets the
+# same chain.
+
+LOD_NAME_PATTERN = re.compile(r"_LOD\d+$")
+
+
+def parse_ratios(text):
+	# "0.5, 0.25" -> [0.5, 0.25]. Ratios outside (0, 1) are ignored.
+	ratios = []
+	for item in text.replace(";", ",").split(","):
+		try:
+			ratio = float(item)
+		except ValueError:
+			continue
+		if 0 < ratio < 1:
+			ratios.append(ratio)
+	return ratios
+
+
+def uses_armature_modifier(ob):
+	return any(mod.type == 'ARMATURE' for mod in ob.modifiers)
+
+
+def get_lod_objects(objects):
+	# Static meshes without authored LODs. Animated objects are skipped, as their transform
+	# would have to move to the group empty.
+	return [ob for ob in objects
+		if ob.type == 'MESH'
+		and len(ob.data.polygons)
+		and not LOD_NAME_PATTERN.search(ob.name)
+		and not uses_armature_modifier(ob)
+		and not (ob.animation_data and ob.animation_data.action)]
+
+
+def decimate_meshes(meshes, ratios):
+	# Returns the decimated mesh for each (mesh, ratio). All meshes are decimated in a single
+	# depsgraph evaluation through temporary objects with a Decimate modifier.
+	collection = bpy.context.scene.collection
+	temp_objects = dict()
+	try:
+		for mesh in meshes:
+			for level, ratio in enumerate(ratios, 1):
+				ob = bpy.data.objects.new("%s_LOD%d" % (mesh.name, level), mesh)
+				collection.objects.link(ob)
+				ob.modifiers.new("Decimate", 'DECIMATE').ratio = ratio
+				temp_objects[(mesh, ratio)] = ob
+
+		depsgraph = bpy.context.evaluated_depsgraph_get()
+		lod_meshes = dict()
+		for key, ob in temp_objects.items():
+			lod_mesh = bpy.data.meshes.new_from_object(ob.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+			lod_mesh.name = ob.name
+			lod_meshes[key] = journal.add_created(lod_mesh)
+		return lod_meshes
+	finally:
+		bpy.data.batch_remove(list(temp_objects.values()))
+
+
+def create_lod_object(ob, name, mesh, parent):
+	lod_ob = bpy.data.objects.new(name, mesh)
+	for col in ob.users_collection:
+		col.objects.link(lod_ob)
+	lod_ob.parent = parent
+	lod_ob.hide_viewport = ob.hide_viewport
+
+	for slot, lod_slot in zip(ob.material_slots, lod_ob.material_slots):
+		if slot.link == 'OBJECT':
+			lod_slot.link = 'OBJECT'
+			lod_slot.material = slot.material
+
+	return lod_ob
+
+
+def generate_lods(objects, ratios):
+	# Returns the objects added for each object: its LOD group empty and the LOD objects.
+	lod_objects = get_lod_objects(objects)
+	if not lod_objects or not ratios:
+		return dict()
+
+	lod_meshes = decimate_meshes(set(ob.data for ob in lod_objects), ratios)
+	added = dict()
+
+	for ob in lod_objects:
+		name = ob.name
+		journal.rename(ob, name + "_LOD0")
+
+		# The group empty takes the object's place in the hierarchy
+		group = journal.add_created(bpy.data.objects.new(name, None))
+		for col in ob.users_collection:
+			col.objects.link(group)
+		group.parent = ob.parent
+		group.parent_type = ob.parent_type
+		group.parent_bone = ob.parent_bone
+		group.matrix_parent_inverse = ob.matrix_parent_inverse
+		group.matrix_basis = ob.matrix_basis
+		group.hide_viewport = ob.hide_viewport
+
+		for child in ob.children:
+			# The group empty has no vertices, so vertex-parented children become object
+			# children keeping their current placement (the empty is placed like the object)
+			vertex_parented = child.parent_type in {'VERTEX', 'VERTEX_3'}
+			if vertex_parented:
+				matrix_parent_inverse = ob.matrix_world.inverted_safe() @ child.matrix_world @ child.matrix_basis.inverted_safe()
+			journal.set_attribute(child, "parent", group)
+			if vertex_parented:
+				journal.set_attribute(child, "parent_type", 'OBJECT')
+				journal.set_attribute(child, "matrix_parent_inverse", matrix_parent_inverse)
+
+		journal.set_attribute(ob, "parent", group)
+		journal.set_attribute(ob, "parent_type", 'OBJECT')
+		journal.set_attribute(ob, "matrix_parent_inverse", mathutils.Matrix.Identity(4))
+		journal.set_attribute(ob, "matrix_basis", mathutils.Matrix.Identity(4))
+
+		added[ob] = [group]
+		for level, ratio in enumerate(ratios, 1):
+			lod_ob = journal.add_created(create_lod_object(ob, "%s_LOD%d" % (name, level), lod_meshes[(ob.data, ratio)], group))
+			added[ob].append(lod_ob)
+
+	instrumentation.count("lod_objects", len(lod_objects) * len(ratios))
+	logger.info("Generated %d LOD levels for %d objects (%d meshes)", len(ratios), len(lod_objects), len(lod_meshes) // len(ratios))
+	return added
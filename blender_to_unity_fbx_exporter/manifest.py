@@ -0,0 +1,250 @@
+import bpy
+import hashlib
+import json
+import os
+import numpy as np
+
+from . import mesh_optimization
+
+# Incremental export.
+# Each exported file is fingerprinted out of everything that affects its contents: mesh
+# buffers and attributes, object matrices, materials, modifier stacks and the objects they
+# reference, armatures, actions and the export options.
+# Fingerprints are stored in a manifest file in the output folder, so files whose
+# fingerprint didn't change can be skipped entirely, even across Blender sessions.
+
+MANIFEST_FILENAME = ".unity_fbx_manifest.json"
+MANIFEST_VERSION = 1
+
+# Property holding the values of each attribute data type: (name, values per element, dtype)
+ATTRIBUTE_VALUES = {
+	'FLOAT': ("value", 1, np.float32),
+	'INT': ("value", 1, np.int32),
+	'INT8': ("value", 1, np.int32),
+	'BOOLEAN': ("value", 1, bool),
+	'FLOAT2': ("vector", 2, np.float32),
+	'INT32_2D': ("value", 2, np.int32),
+	'FLOAT_VECTOR': ("vector", 3, np.float32),
+	'FLOAT_COLOR': ("color", 4, np.float32),
+	'BYTE_COLOR': ("color", 4, np.float32),
+	'QUATERNION': ("value", 4, np.float32),
+	'FLOAT4X4': ("value", 16, np.float32),
+}
+
+# Node properties that only affect the node editor
+NODE_UI_PROPERTIES = {"location", "width", "height", "dimensions", "select", "hide", "show_options", "show_preview", "show_texture", "label", "color", "use_custom_color"}
+
+# Result of the last incremental export, available to scripts
+last_result = dict(written=[], skipped=[])
+
+
+def load(directory):
+	path = os.path.join(directory, MANIFEST_FILENAME)
+	try:
+		with open(path, "r", encoding="utf-8") as f:
+			manifest = json.load(f)
+	except (OSError, ValueError):
+		return dict()
+
+	if manifest.get("version") != MANIFEST_VERSION:
+		return dict()
+	return manifest.get("files", dict())
+
+
+def save(directory, files):
+	path = os.path.join(directory, MANIFEST_FILENAME)
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump(dict(version=MANIFEST_VERSION, files=files), f, indent=1, sort_keys=True)
+
+
+def hash_collection(digest, collection, attribute, count, dtype=np.float32):
+	# Read a whole property of a bpy collection in bulk
+	values = np.empty(len(collection) * count, dtype=dtype)
+	collection.foreach_get(attribute, values)
+	digest.update(values.tobytes())
+
+
+def hash_rna(digest, struct, skip=()):
+	# Hash every property value of a struct (modifier, constraint...). Datablocks are
+	# referenced by name.
+	for prop in struct.bl_rna.properties:
+		if prop.identifier == "rna_type" or prop.type == 'COLLECTION' or prop.identifier in skip:
+			continue
+		value = getattr(struct, prop.identifier)
+		if prop.type == 'POINTER':
+			value = getattr(value, "name", None)
+		elif getattr(prop, "is_array", False):
+			value = tuple(value)
+		digest.update(repr((prop.identifier, value)).encode())
+
+
+def hash_vertex_weights(digest, mesh):
+	# Blender has no bulk access to the vertex group weights, so they are read in a
+	# single pass over the vertices
+	weights = np.fromiter((value for vertex in mesh.vertices for group in vertex.groups for value in (vertex.index, group.group, group.weight)), dtype=np.float64)
+	digest.update(weights.tobytes())
+
+
+def hash_material(digest, material):
+	# Material settings and node values: the FBX writer exports the shader inputs and the
+	# image textures
+	hash_rna(digest, material)
+	for tree in sorted(mesh_optimization.get_node_trees([material]), key=lambda tree: tree.name):
+		digest.update(tree.name.encode())
+		for node in tree.nodes:
+			hash_rna(digest, node, NODE_UI_PROPERTIES)
+			for socket in node.inputs:
+				value = getattr(socket, "default_value", None)
+				digest.update(repr((socket.identifier, tuple(value) if hasattr(value, "__len__") and not isinstance(value, str) else value)).encode())
+			image = getattr(node, "image", None)
+			if image:
+				digest.update(repr((image.name, image.filepath, image.source, image.size[:])).encode())
+		digest.update(repr(sorted((link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier) for link in tree.links)).encode())
+
+
+def hash_mesh(digest, mesh, vertex_groups):
+	hash_collection(digest, mesh.vertices, "co", 3)
+	hash_collection(digest, mesh.loops, "vertex_index", 1, np.int32)
+	hash_collection(digest, mesh.polygons, "loop_total", 1, np.int32)
+	hash_collection(digest, mesh.polygons, "material_index", 1, np.int32)
+	hash_collection(digest, mesh.polygons, "use_smooth", 1, bool)
+	hash_collection(digest, mesh.edges, "use_edge_sharp", 1, bool)
+	for uv_layer in mesh.uv_layers:
+		digest.update(uv_layer.name.encode())
+		hash_collection(digest, uv_layer.data, "uv", 2)
+	for attribute in mesh.attributes:
+		digest.update(repr((attribute.name, attribute.domain, attribute.data_type)).encode())
+		if attribute.data_type in ATTRIBUTE_VALUES:
+			name, count, dtype = ATTRIBUTE_VALUES[attribute.data_type]
+			hash_collection(digest, attribute.data, name, count, dtype)
+	if mesh.has_custom_normals:
+		hash_collection(digest, mesh.loops, "normal", 3)
+	if vertex_groups:
+		hash_vertex_weights(digest, mesh)
+	if mesh.shape_keys:
+		for key_block in mesh.shape_keys.key_blocks:
+			digest.update(key_block.name.encode())
+			hash_collection(digest, key_block.data, "co", 3)
+	digest.update(repr([material.name if material else None for material in mesh.materials]).encode())
+
+
+def hash_curve(digest, curve):
+	hash_rna(digest, curve)
+	for spline in curve.splines:
+		digest.update(repr((spline.type, spline.use_cyclic_u, spline.resolution_u)).encode())
+		hash_collection(digest, spline.points, "co", 4)
+		hash_collection(digest, spline.bezier_points, "co", 3)
+		hash_collection(digest, spline.bezier_points, "handle_left", 3)
+		hash_collection(digest, spline.bezier_points, "handle_right", 3)
+
+
+def hash_armature(digest, armature):
+	digest.update(repr([(bone.name, bone.parent.name if bone.parent else None, bone.use_deform) for bone in armature.bones]).encode())
+	hash_collection(digest, armature.bones, "head_local", 3)
+	hash_collection(digest, armature.bones, "tail_local", 3)
+	hash_collection(digest, armature.bones, "matrix_local", 16)
+
+
+def hash_action(digest, action):
+	digest.update(action.name.encode())
+	for fcurve in action.fcurves:
+		digest.update(repr((fcurve.data_path, fcurve.array_index)).encode())
+		hash_collection(digest, fcurve.keyframe_points, "co", 2)
+		hash_collection(digest, fcurve.keyframe_points, "handle_left", 2)
+		hash_collection(digest, fcurve.keyframe_points, "handle_right", 2)
+		hash_collection(digest, fcurve.keyframe_points, "interpolation", 1, np.int32)
+
+
+def hash_object(digest, ob, hashed_data):
+	digest.update(repr((ob.name, ob.type, ob.parent.name if ob.parent else None, ob.parent_type, ob.parent_bone)).encode())
+	digest.update(repr(ob.hide_viewport).encode())
+	digest.update(repr((ob.instance_type, ob.instance_collection.name if ob.instance_collection else None)).encode())
+	if ob.instance_collection:
+		digest.update(np.array(ob.instance_collection.instance_offset, dtype=np.float32).tobytes())
+	digest.update(np.array(ob.matrix_world, dtype=np.float32).tobytes())
+	digest.update(repr([(key, str(ob[key])) for key in ob.keys()]).encode())
+	digest.update(repr([(slot.link, slot.material.name if slot.material else None) for slot in ob.material_slots]).encode())
+	digest.update(repr([group.name for group in ob.vertex_groups]).encode())
+
+	for slot in ob.material_slots:
+		if slot.material and slot.material not in hashed_data:
+			hashed_data.add(slot.material)
+			hash_material(digest, slot.material)
+
+	for mod in ob.modifiers:
+		hash_rna(digest, mod)
+
+	if ob.pose:
+		for bone in ob.pose.bones:
+			digest.update(repr((bone.name, tuple(bone.location), tuple(bone.rotation_quaternion), tuple(bone.rotation_euler), tuple(bone.scale))).encode())
+
+	if ob.animation_data:
+		actions = [ob.animation_data.action] + [strip.action for track in ob.animation_data.nla_tracks for strip in track.strips]
+		for action in actions:
+			if action:
+				hash_action(digest, action)
+
+	# Datablocks shared by several objects are hashed only once. Their name is enough
+	# the next time they're found.
+	data = ob.data
+	if data is None:
+		return
+	digest.update(repr((type(data).__name__, data.name)).encode())
+	if data in hashed_data:
+		return
+	hashed_data.add(data)
+
+	if isinstance(data, bpy.types.Mesh):
+		hash_mesh(digest, data, len(ob.vertex_groups) > 0)
+	elif isinstance(data, bpy.types.Curve):
+		hash_curve(digest, data)
+	elif isinstance(data, bpy.types.Armature):
+		hash_armature(digest, data)
+
+
+def get_dependencies(ob):
+	# Objects the export of an object depends on: the contents of its instanced collection
+	# and the objects referenced by its modifiers
+	if ob.instance_type == 'COLLECTION' and ob.instance_collection:
+		yield from ob.instance_collection.all_objects
+	yield from get_modifier_objects(ob)
+
+
+def get_modifier_objects(ob):
+	# Objects referenced by the modifiers of an object: armatures, mirror and array
+	# targets, boolean operands...
+	for mod in ob.modifiers:
+		for prop in mod.bl_rna.properties:
+			if prop.type != 'POINTER':
+				continue
+			value = getattr(mod, prop.identifier)
+			if isinstance(value, bpy.types.Object):
+				yield value
+			elif isinstance(value, bpy.types.Collection):
+				yield from value.all_objects
+
+
+def with_dependencies(objects):
+	# The objects plus everything they depend on, recursively
+	objects = set(objects)
+	pending = list(objects)
+	while pending:
+		for dependency in get_dependencies(pending.pop()):
+			if dependency not in objects:
+				objects.add(dependency)
+				pending.append(dependency)
+	return objects
+
+
+def get_fingerprint(objects, options):
+	# Objects instanced or used by modifiers are part of the fingerprint even if not exported
+	objects = with_dependencies(objects)
+
+	digest = hashlib.sha1()
+	digest.update(repr(options).encode())
+
+	hashed_data = set()
+	for ob in sorted(objects, key=lambda ob: ob.name):
+		hash_object(digest, ob, hashed_data)
+
+	return digest.hexdigest()
@@ -0,0 +1,201 @@
+import bpy
+import bmesh
+import numpy as np
+
+from . import collections_as_empties
+from . import instrumentation
+from . import journal
+from . import lod
+from .instrumentation import logger
+
+# Static mesh merging.
+# After the rotation fix, static meshes in the same collection are merged into a single mesh
+# object, optionally one per material, so Unity imports fewer nodes and renderers. Merged
+# objects are linked to the collection and have the converted identity transform (X+90):
+# the members' geometry is moved to where they were in the scene. Members are unlinked from
+# the scene until it's restored.
+# bmesh doesn't keep custom split normals (nor the auto smooth normals of Blender 4.0): when
+# a member has them, the normals of every member are carried in a corner attribute and set
+# as the custom normals of the merged mesh.
+
+# Temporary corner attribute holding the members' normals
+NORMAL_LAYER = "unity_merge_normal"
+
+
+def is_mergeable(ob, exclude_property):
+	# Objects with children, animation, shape keys or instances are kept separate, along with
+	# skinned meshes, LODs and the objects tagged with the exclusion property.
+	if ob.type != 'MESH' or ob.children or ob.instance_type != 'NONE' or ob.data.shape_keys:
+		return False
+	if any(mod.type == 'ARMATURE' for mod in ob.modifiers) or lod.LOD_NAME_PATTERN.search(ob.name):
+		return False
+
+	parent = ob
+	while parent:
+		if (exclude_property and parent.get(exclude_property)) or (parent.animation_data and parent.animation_data.action):
+			return False
+		parent = parent.parent
+	return True
+
+
+def get_merge_groups(context, objects, split_by_material, vertex_cap, exclude_property, partition):
+	# Returns the lists of (object, material indices) merged together, keyed by
+	# (partition, collection, material, chunk index). Without splitting by material all the
+	# faces of an object are merged (material indices None).
+	scene_collection = context.scene.collection
+	collections = set(collections_as_empties.get_collection_parents(context.view_layer.layer_collection))
+	collections.add(scene_collection)
+
+	groups = dict()
+	for ob in objects:
+		if not is_mergeable(ob, exclude_property):
+			continue
+		collection = next((col for col in ob.users_collection if col in collections), None)
+		if collection is None:
+			continue
+
+		if split_by_material:
+			materials = dict()
+			for i, slot in enumerate(ob.material_slots):
+				materials.setdefault(slot.material, set()).add(i)
+			for material, indices in (materials.items() if materials else ((None, None),)):
+				groups.setdefault((partition.get(ob), collection, material), []).append((ob, indices))
+		else:
+			groups.setdefault((partition.get(ob), collection, None), []).append((ob, None))
+
+	# Split the groups to keep each merged mesh under the vertex cap
+	chunks = dict()
+	for key, members in groups.items():
+		index = 0
+		vertex_count = 0
+		for ob, indices in members:
+			if vertex_count and vertex_count + len(ob.data.vertices) > vertex_cap:
+				index += 1
+				vertex_count = 0
+			vertex_count += len(ob.data.vertices)
+			chunks.setdefault(key + (index,), []).append((ob, indices))
+
+	# Nothing to merge in single object groups, unless the object is merged in other groups
+	# (split by material): its remaining faces still need a merged object.
+	merged_objects = set(ob for members in chunks.values() if len(members) > 1 for ob, indices in members)
+	return {key: members for key, members in chunks.items() if len(members) > 1 or members[0][0] in merged_objects}
+
+
+def has_split_normals(mesh):
+	# Custom normals, or auto smooth (Blender 4.0, removed in 4.1)
+	return mesh.has_custom_normals or getattr(mesh, "use_auto_smooth", False)
+
+
+def get_corner_normals(mesh, matrix):
+	# Normals of the corners of the mesh transformed by the matrix, as an N x 3 array
+	normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+	if hasattr(mesh, "corner_normals"):
+		mesh.corner_normals.foreach_get("vector", normals)
+	else:
+		mesh.calc_normals_split()
+		mesh.loops.foreach_get("normal", normals)
+
+	normal_matrix = np.array(matrix.to_3x3().inverted_safe().transposed())
+	normals = normals.reshape(-1, 3) @ normal_matrix.T
+	lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+	return normals / np.where(lengths > 0, lengths, 1)
+
+
+def set_custom_normals(mesh):
+	# Custom normals of the merged mesh from the temporary corner attribute
+	attribute = mesh.attributes[NORMAL_LAYER]
+	normals = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+	attribute.data.foreach_get("vector", normals)
+	mesh.attributes.remove(attribute)
+
+	if hasattr(mesh, "use_auto_smooth"):
+		mesh.use_auto_smooth = True
+	mesh.normals_split_custom_set(normals.reshape(-1, 3))
+
+
+def merge_members(name, members, matrix):
+	# Joins the faces of the members into a new mesh, transformed from their world space
+	# into the space of the merged object.
+	bm = bmesh.new()
+	materials = []
+	normal_layer = None
+	if any(has_split_normals(ob.data) for ob, indices in members):
+		normal_layer = bm.loops.layers.float_vector.new(NORMAL_LAYER)
+
+	for ob, indices in members:
+		vertex_start = len(bm.verts)
+		face_start = len(bm.faces)
+		bm.from_mesh(ob.data)
+		bm.verts.ensure_lookup_table()
+		bm.faces.ensure_lookup_table()
+		verts = bm.verts[vertex_start:]
+		faces = bm.faces[face_start:]
+
+		world = matrix @ ob.matrix_world
+		if normal_layer is not None:
+			# Faces and their corners are added in the order of the mesh
+			normals = get_corner_normals(ob.data, world)
+			for face, polygon in zip(faces, ob.data.polygons):
+				for loop, index in zip(face.loops, polygon.loop_indices):
+					loop[normal_layer] = normals[index]
+
+		bmesh.ops.transform(bm, matrix=world, verts=verts)
+		if world.determinant() < 0:
+			bmesh.ops.reverse_faces(bm, faces=faces)
+
+		# Material indices of the member point to the merged material list
+		slots = [slot.material for slot in ob.material_slots] or [None]
+		remap = []
+		for material in slots:
+			if material not in materials:
+				materials.append(material)
+			remap.append(materials.index(material))
+
+		removed = []
+		for face in faces:
+			if indices is not None and face.material_index not in indices:
+				removed.append(face)
+			else:
+				face.material_index = remap[min(face.material_index, len(remap) - 1)]
+		if removed:
+			bmesh.ops.delete(bm, geom=removed, context='FACES')
+
+	mesh = journal.add_created(bpy.data.meshes.new(name))
+	bm.to_mesh(mesh)
+	bm.free()
+	if normal_layer is not None:
+		set_custom_normals(mesh)
+	for material in materials:
+		mesh.materials.append(material)
+	return mesh
+
+
+def merge_static_meshes(context, objects, matrix, split_by_material, vertex_cap, exclude_property, partition=None):
+	# Merge the mergeable objects given. Returns the merged objects of each member (several
+	# when split by material).
+	groups = get_merge_groups(context, objects, split_by_material, vertex_cap, exclude_property, partition or dict())
+	merged = dict()
+
+	for (part, collection, material, index), members in groups.items():
+		name = collection.name + "_Merged"
+		if material:
+			name += "_" + material.name
+		if index:
+			name += "_%d" % index
+
+		merged_ob = journal.add_created(bpy.data.objects.new(name, merge_members(name, members, matrix.inverted())))
+		collection.objects.link(merged_ob)
+		merged_ob.matrix_basis = matrix
+
+		for ob, indices in members:
+			merged.setdefault(ob, []).append(merged_ob)
+
+	# Members are unlinked once all the groups are merged, as they may be in several groups
+	for ob in merged:
+		for col in list(ob.users_collection):
+			journal.unlink_object(col, ob)
+
+	instrumentation.count("merged_objects", len(merged))
+	instrumentation.count("merged_meshes", len(groups))
+	logger.info("Merged %d static objects into %d meshes", len(merged), len(groups))
+	return merged
@@ -0,0 +1,183 @@
+import bpy
+import bmesh
+import math
+
+from . import instrumentation
+from . import journal
+from . import vertex_cache
+from .instrumentation import logger
+
+# Mesh optimization.
+# Meshes of the exported objects are optimized before writing the FBX file:
+# - Vertices closer than the weld distance are merged. Edges that were open borders before
+#   merging are marked sharp, so the normals look the same as before. Before Blender 4.1,
+#   sharp edges only split the normals with auto smooth: it's enabled with a 180 degree
+#   angle, so the other edges stay smooth.
+# - UV maps and color attributes not used by the materials are removed. Unity reads some of
+#   them without Blender materials referencing them, so they're always kept: the first UV
+#   map (default UVs and tangents), the second one (lightmap UVs) and the render color
+#   attribute (vertex colors read by the shaders).
+# - When triangulating, triangles are reordered for the post-transform vertex cache (Tipsify,
+#   see vertex_cache.py) and vertices are sorted in the order they're first used.
+# Meshes that were part of the scene are replaced with optimized copies. Meshes created by
+# the export itself are optimized in place.
+
+# Bytes written to the FBX file per vertex position, per UV coordinate and per color
+VERTEX_BYTES = 24
+UV_BYTES = 16
+COLOR_BYTES = 32
+
+# Result of the last optimization, available to scripts
+last_result = dict()
+
+
+def get_node_trees(materials):
+	# Node trees of the materials, including the node groups they use
+	trees = [material.node_tree for material in materials if material and material.use_nodes and material.node_tree]
+	visited = set()
+	while trees:
+		tree = trees.pop()
+		if tree in visited:
+			continue
+		visited.add(tree)
+		for node in tree.nodes:
+			if node.type == 'GROUP' and node.node_tree:
+				trees.append(node.node_tree)
+	return visited
+
+
+def get_referenced_attributes(materials):
+	# Returns the UV map and color attribute names used by the materials. An empty name
+	# means the default (render) layer.
+	uv_maps = set()
+	colors = set()
+	for tree in get_node_trees(materials):
+		for node in tree.nodes:
+			if node.type in {'UVMAP', 'NORMAL_MAP', 'TANGENT'}:
+				uv_maps.add(node.uv_map)
+			elif node.type == 'TEX_IMAGE' and not node.inputs["Vector"].is_linked:
+				uv_maps.add("")
+			elif node.type == 'VERTEX_COLOR':
+				colors.add(node.layer_name)
+			elif node.type == 'ATTRIBUTE':
+				uv_maps.add(node.attribute_name)
+				colors.add(node.attribute_name)
+	return uv_maps, colors
+
+
+def remove_unused_attributes(mesh, materials):
+	# Returns the number of removed UV maps and color attributes
+	uv_maps, colors = get_referenced_attributes(materials)
+
+	removed_uv_maps = 0
+	render_uv = next((uv.name for uv in mesh.uv_layers if uv.active_render), None)
+	for i, uv in reversed(list(enumerate(mesh.uv_layers))):
+		if i <= 1 or uv.name in uv_maps or ("" in uv_maps and uv.name == render_uv):
+			continue
+		mesh.uv_layers.remove(uv)
+		removed_uv_maps += 1
+
+	removed_colors = 0
+	render_color = mesh.color_attributes[mesh.color_attributes.render_color_index].name if 0 <= mesh.color_attributes.render_color_index < len(mesh.color_attributes) else None
+	for attribute in list(mesh.color_attributes):
+		if attribute.name in colors or attribute.name == render_color:
+			continue
+		mesh.color_attributes.remove(attribute)
+		removed_colors += 1
+
+	return removed_uv_maps, removed_colors
+
+
+def optimize_geometry(mesh, weld_distance, triangulate):
+	bm = bmesh.new()
+	bm.from_mesh(mesh)
+
+	sharpened = False
+	if weld_distance > 0:
+		for edge in bm.edges:
+			if edge.is_boundary and edge.smooth:
+				edge.smooth = False
+				sharpened = True
+		bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=weld_distance)
+
+	if triangulate:
+		bmesh.ops.triangulate(bm, faces=bm.faces)
+		bm.verts.index_update()
+		bm.faces.ensure_lookup_table()
+
+		faces = list(bm.faces)
+		order = vertex_cache.get_tipsify_order([tuple(v.index for v in face.verts) for face in faces], len(bm.verts))
+		face_rank = {faces[t]: i for i, t in enumerate(order)}
+		bm.faces.sort(key=lambda face: face_rank[face])
+
+		# Vertices in the order they're first used by the triangles
+		vertex_rank = dict()
+		for face in bm.faces:
+			for v in face.verts:
+				vertex_rank.setdefault(v, len(vertex_rank))
+		bm.verts.sort(key=lambda v: vertex_rank.get(v, len(vertex_rank)))
+
+	bm.to_mesh(mesh)
+	bm.free()
+
+	# Blender 4.0 ignores sharp edges without auto smooth (removed in 4.1)
+	if sharpened and hasattr(mesh, "use_auto_smooth") and not mesh.use_auto_smooth:
+		mesh.use_auto_smooth = True
+		mesh.auto_smooth_angle = math.pi
+	mesh.update()
+
+
+def optimize_meshes(objects, weld_distance, triangulate):
+	# Optimize the meshes of the given objects. Shared meshes are optimized once.
+	global last_result
+
+	users = dict()
+	for ob in objects:
+		if ob.type == 'MESH':
+			users.setdefault(ob.data, []).append(ob)
+
+	created = journal.get_created()
+	vertices_before = 0
+	vertices_after = 0
+	removed_uv_loops = 0
+	removed_color_loops = 0
+	removed_uv_maps = 0
+	removed_colors = 0
+
+	for mesh, mesh_users in users.items():
+		# Meshes from the scene are replaced with a copy for the exported objects
+		if mesh not in created:
+			optimized = journal.add_created(mesh.copy())
+			for ob in mesh_users:
+				journal.set_attribute(ob, "data", optimized)
+			mesh = optimized
+
+		materials = list(mesh.materials) + [slot.material for ob in mesh_users for slot in ob.material_slots if slot.link == 'OBJECT']
+		uv_maps, colors = remove_unused_attributes(mesh, materials)
+		removed_uv_maps += uv_maps
+		removed_colors += colors
+		removed_uv_loops += uv_maps * len(mesh.loops)
+		removed_color_loops += colors * len(mesh.loops)
+
+		vertices_before += len(mesh.vertices)
+		# Merging or reordering would break shape keys and custom normals
+		if not mesh.shape_keys and not mesh.has_custom_normals:
+			optimize_geometry(mesh, weld_distance, triangulate)
+		vertices_after += len(mesh.vertices)
+
+	bytes_saved = (vertices_before - vertices_after) * VERTEX_BYTES + removed_uv_loops * UV_BYTES + removed_color_loops * COLOR_BYTES
+	last_result = dict(
+		meshes=len(users),
+		vertices_before=vertices_before,
+		vertices_after=vertices_after,
+		removed_uv_maps=removed_uv_maps,
+		removed_color_attributes=removed_colors,
+		estimated_bytes_saved=bytes_saved,
+	)
+
+	instrumentation.count("vertices_welded", vertices_before - vertices_after)
+	instrumentation.count("uv_maps_removed", removed_uv_maps)
+	instrumentation.count("color_attributes_removed", removed_colors)
+	instrumentation.count("estimated_bytes_saved", bytes_saved)
+	logger.info("Mesh optimization: %d meshes, %d -> %d vertices, %d UV maps and %d color attributes removed, about %d KB saved",
+		len(users), vertices_before, vertices_after, removed_uv_maps, removed_colors, bytes_saved // 1024)
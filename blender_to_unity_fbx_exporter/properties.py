@@ -1,9 +1,14 @@
 import bpy
+import time
+from bpy.app.handlers import persistent # type: ignore
 from bpy_extras.io_utils import ExportHelper  # type: ignore
-from bpy.props import StringProperty, BoolProperty, EnumProperty # type: ignore
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty # type: ignore
 from bpy.types import Operator # type: ignore
 
-from .export import export_unity_fbx
+from . import export
+from . import journal
+from . import textures
+from .direct_export import export_unity_fbx_direct
 
 class ExportUnityFbx(Operator, ExportHelper):
 	"""FBX exporter compatible with Unity's coordinate and scaling system"""
@@ -14,6 +19,11 @@ class ExportUnityFbx(Operator, ExportHelper):
 	# ExportHelper mixin class uses this
 	filename_ext = ".fbx"
 
+	# Not while a modal export is in progress
+	@classmethod
+	def poll(cls, context):
+		return not export.running
+
 	filter_glob: StringProperty(
 		default="*.fbx",
 		options={'HIDDEN'},
@@ -23,6 +33,16 @@ class ExportUnityFbx(Operator, ExportHelper):
 	# List of operator properties, the attributes will be assigned
 	# to the class instance from the operator settings before calling.
 
+	# ENGINE
+	export_engine: EnumProperty(
+		name="Engine",
+		description="How the Unity FBX file is produced",
+		items=(('SCENE', "Modify Scene", "Temporarily modify the scene and export it with Blender's FBX exporter. Supports all features"),
+				('DIRECT', "Non-Destructive", "Write the FBX file straight from the evaluated scene without modifying it. Supports static empties and meshes. Other exports, and options this engine doesn't implement (batches, chunks, incremental export, shared instances, mesh optimization, LODs, merging, keyframe reduction, textures), use Modify Scene"),
+		),
+		default='SCENE',
+	) # type: ignore
+
 	# SELECTION
 	active_collection: BoolProperty(
 		name="Active Collection Only",
@@ -35,6 +55,53 @@ class ExportUnityFbx(Operator, ExportHelper):
 		description="Export selected objects only. May be combined with Active Collection Only",
 		default=False,
 	) # type: ignore
+
+	# BATCH
+	batch_mode: EnumProperty(
+		name="Batch",
+		description="Write one FBX file per unit to the destination folder. The scene is prepared only once for all the files",
+		items=(('OFF', "Off", "Export a single FBX file"),
+				('COLLECTION', "By Collection", "One FBX file per top-level collection, named after the collection"),
+				('ROOT_OBJECT', "By Root Object", "One FBX file per root object and its children, named after the object"),
+				('PATTERN', "By Name Pattern", "One FBX file per group of root objects matching the name pattern"),
+		),
+		default='OFF',
+	) # type: ignore
+
+	batch_pattern: StringProperty(
+		name="Name Pattern",
+		description="Regular expression matched against root object names. Objects are grouped by the first captured group (or the whole match), which also names the file. Objects not matching aren't exported",
+		default=r"^([^._]+)",
+	) # type: ignore
+
+	incremental: BoolProperty(
+		name="Incremental",
+		description="Skip files whose contents didn't change since they were last exported. Fingerprints of the exported files are stored in a manifest file in the destination folder",
+		default=False,
+	) # type: ignore
+
+	write_if_changed: BoolProperty(
+		name="Keep Identical Files",
+		description="Write each FBX file to a temporary file first and replace the existing file only if they're different, ignoring timestamps and ids. Unchanged files keep their modification time, so Unity doesn't import them again",
+		default=False,
+	) # type: ignore
+
+	chunk_mode: EnumProperty(
+		name="Chunks",
+		description="Split large exports into several FBX files of limited size, named with a _chunk_N suffix. Each chunk is prepared, written and restored in turn to keep the memory usage low",
+		items=(('OFF', "No Chunks", "Don't split the export"),
+				('GRID', "Spatial Grid", "Chunks are cells of a grid over the scene, subdivided until they fit the vertex budget"),
+				('HIERARCHY', "Hierarchy", "Chunks are consecutive object hierarchies that fit the vertex budget"),
+		),
+		default='OFF',
+	) # type: ignore
+
+	chunk_vertex_budget: IntProperty(
+		name="Vertex Budget",
+		description="Maximum number of vertices per chunk, counted before applying modifiers. Hierarchies larger than the budget are split",
+		default=1000000,
+		min=1000,
+	) # type: ignore
  
 	# OBJECTS
  
@@ -44,6 +111,15 @@ class ExportUnityFbx(Operator, ExportHelper):
      default=False,
     ) # type: ignore
  
+	instanced_collections: EnumProperty(
+		name="Instanced Collections",
+		description="How objects instancing a collection are exported",
+		items=(('REALIZE', "Realize", "Export a copy of the collection's objects in each instance, keeping their hierarchy"),
+				('SHARED', "Shared", "Write the collection's objects once and reference them from every instance. Collections that can't be shared (armatures, non-mesh objects, nested instances, objects also exported on their own) are realized"),
+		),
+		default='REALIZE',
+	) # type: ignore
+ 
 	include_custom_properties: BoolProperty(
 		name="Include Custom Properties",
 		description="Exports custom object properties",
@@ -63,7 +139,124 @@ class ExportUnityFbx(Operator, ExportHelper):
 		description="Convert all faces to triangles. This is necessary for exporting tangents in meshes with N-gons. Otherwise Unity will show a warning when importing tangents in these meshes",
 		default=False,
 	) # type: ignore
+
+	keep_shared_data: BoolProperty(
+		name="Keep Shared Data",
+		description="Export multi-user meshes as shared geometry instead of making a copy for each object. Objects with modifiers still get their own mesh. Reduces memory usage and FBX size in scenes with many linked duplicates",
+		default=False,
+	) # type: ignore
+
+	optimize_meshes: BoolProperty(
+		name="Optimize Meshes",
+		description="Weld vertices closer than the weld distance and remove UV maps and color attributes not used by the materials. When triangulating, triangles are also reordered for the GPU vertex cache. Meshes with shape keys or custom normals are only stripped of unused attributes",
+		default=False,
+	) # type: ignore
+
+	weld_distance: FloatProperty(
+		name="Weld Distance",
+		description="Maximum distance between vertices to be merged. Zero disables welding",
+		default=0.0001,
+		min=0.0,
+		subtype='DISTANCE',
+	) # type: ignore
+
+	generate_lods: BoolProperty(
+		name="Generate LODs",
+		description="Export decimated copies of each static mesh as Name_LOD1, Name_LOD2... next to the original, renamed Name_LOD0, under an empty taking its name. Unity creates a LOD Group for them when importing. Meshes used by several objects share the same LODs",
+		default=False,
+	) # type: ignore
+
+	lod_ratios: StringProperty(
+		name="LOD Ratios",
+		description="Comma-separated decimation ratio of each LOD level, relative to the original mesh",
+		default="0.5, 0.25",
+	) # type: ignore
+
+	merge_meshes: BoolProperty(
+		name="Merge Static Meshes",
+		description="Merge the static meshes in each collection into a single mesh, so Unity imports fewer objects and renderers. Skinned, animated and parent objects, and objects with the exclusion property, are kept separate",
+		default=False,
+	) # type: ignore
+
+	merge_by_material: BoolProperty(
+		name="Split by Material",
+		description="Merge the faces of each material into their own mesh",
+		default=False,
+	) # type: ignore
+
+	merge_vertex_cap: IntProperty(
+		name="Vertex Cap",
+		description="Maximum number of vertices in each merged mesh. Meshes up to 65535 vertices use 16-bit indices in Unity",
+		default=65535,
+		min=1,
+	) # type: ignore
+
+	merge_exclude_property: StringProperty(
+		name="Exclusion Property",
+		description="Objects with this custom property set (or whose parents have it) are never merged",
+		default="unity_keep_separate",
+	) # type: ignore
+
+	# TEXTURES
+
+	export_textures: BoolProperty(
+		name="Export Textures",
+		description="Write the images used by the exported materials to a shared folder and reference them from the FBX files with relative paths. Identical images are written once, also across all the files of a batch",
+		default=False,
+	) # type: ignore
+
+	texture_folder: StringProperty(
+		name="Texture Folder",
+		description="Folder the textures are written to, relative to the folder of the FBX file",
+		default="Textures",
+	) # type: ignore
+
+	texture_max_size: IntProperty(
+		name="Max Size",
+		description="Images larger than this in either dimension are downscaled to fit. Zero keeps the original size",
+		default=2048,
+		min=0,
+	) # type: ignore
+
+	# REPORT
+
+	write_report: BoolProperty(
+		name="Write Report",
+		description="Save the time and peak memory of each export phase, plus object, datablock and vertex counts, to a JSON file next to the FBX file",
+		default=False,
+	) # type: ignore
  
+	# ANIMATION
+
+	reduce_keyframes: BoolProperty(
+		name="Reduce Keyframes",
+		description="Remove the keys of the exported actions that can be interpolated within the tolerances below. Reduces the size and import time of long animations like mocap clips",
+		default=False,
+	) # type: ignore
+
+	position_tolerance: FloatProperty(
+		name="Position Tolerance",
+		description="Maximum position error of the reduced animation",
+		default=0.001,
+		min=0.0,
+		subtype='DISTANCE',
+	) # type: ignore
+
+	rotation_tolerance: FloatProperty(
+		name="Rotation Tolerance",
+		description="Maximum rotation error of the reduced animation",
+		default=0.0017453,
+		min=0.0,
+		subtype='ANGLE',
+	) # type: ignore
+
+	scale_tolerance: FloatProperty(
+		name="Scale Tolerance",
+		description="Maximum scale error of the reduced animation",
+		default=0.001,
+		min=0.0,
+	) # type: ignore
+
 	# ARMATURES
 
 	deform_bones: BoolProperty(
@@ -115,6 +308,10 @@ class ExportUnityFbx(Operator, ExportHelper):
 	def draw(self, context):
 		layout = self.layout
 
+		layout.prop(self, "export_engine")
+
+		layout.separator()
+
 		# Selection Box
 		box = layout.box()
 		box.label(text="Selection", icon='OBJECT_DATA')
@@ -123,10 +320,27 @@ class ExportUnityFbx(Operator, ExportHelper):
 
 		layout.separator()
 
+		# Batch Box
+		box = layout.box()
+		box.label(text="Batch", icon='FILE_FOLDER')
+		box.prop(self, "batch_mode", text="")
+		if self.batch_mode == 'PATTERN':
+			box.prop(self, "batch_pattern", text="Pattern")
+		box.prop(self, "chunk_mode", text="")
+		if self.chunk_mode != 'OFF':
+			box.prop(self, "chunk_vertex_budget", text="Vertex Budget")
+		box.prop(self, "incremental", text="Skip Unchanged Files", icon='FILE_REFRESH')
+		box.prop(self, "write_if_changed", text="Keep Identical Files", icon='FILE_TICK')
+
+		layout.separator()
+
 		# Objects Box
 		box = layout.box()
 		box.label(text="Objects", icon='OUTLINER_OB_MESH')
 		box.prop(self, "export_collections_as_empties", text="Export Collections", icon='EMPTY_AXIS')
+		row = box.row()
+		row.label(text="Instances", icon='OUTLINER_OB_GROUP_INSTANCE')
+		row.prop(self, "instanced_collections", text="")
 		box.prop(self, "include_custom_properties", text="Custom Properties", icon='SCRIPT')
 
 		layout.separator()
@@ -136,6 +350,28 @@ class ExportUnityFbx(Operator, ExportHelper):
 		box.label(text="Meshes", icon='MESH_DATA')
 		box.prop(self, "tangent_space", text="Use Tangent Space", icon='NORMALS_VERTEX')
 		box.prop(self, "triangulate_faces", text="Triangulate Faces", icon='MESH_ICOSPHERE')
+		box.prop(self, "keep_shared_data", text="Keep Shared Data", icon='LINKED')
+		box.prop(self, "optimize_meshes", text="Optimize Meshes", icon='MOD_DECIM')
+		if self.optimize_meshes:
+			box.prop(self, "weld_distance", text="Weld Distance")
+		box.prop(self, "generate_lods", text="Generate LODs", icon='MOD_DECIM')
+		if self.generate_lods:
+			box.prop(self, "lod_ratios", text="Ratios")
+		box.prop(self, "merge_meshes", text="Merge Static Meshes", icon='AUTOMERGE_ON')
+		if self.merge_meshes:
+			box.prop(self, "merge_by_material", text="Split by Material")
+			box.prop(self, "merge_vertex_cap", text="Vertex Cap")
+			box.prop(self, "merge_exclude_property", text="Exclude")
+
+		layout.separator()
+
+		# Textures Box
+		box = layout.box()
+		box.label(text="Textures", icon='TEXTURE')
+		box.prop(self, "export_textures", text="Export Textures", icon='IMAGE_DATA')
+		if self.export_textures:
+			box.prop(self, "texture_folder", text="Folder")
+			box.prop(self, "texture_max_size", text="Max Size")
 
 		layout.separator()
 
@@ -147,6 +383,17 @@ class ExportUnityFbx(Operator, ExportHelper):
 
 		layout.separator()
 
+		# Animation Box
+		box = layout.box()
+		box.label(text="Animation", icon='ACTION')
+		box.prop(self, "reduce_keyframes", text="Reduce Keyframes", icon='IPO_LINEAR')
+		if self.reduce_keyframes:
+			box.prop(self, "position_tolerance", text="Position")
+			box.prop(self, "rotation_tolerance", text="Rotation")
+			box.prop(self, "scale_tolerance", text="Scale")
+
+		layout.separator()
+
 		# Bone Axes Box
 		box = layout.box()
 		box.label(text="Bone Axes", icon='BONE_DATA')
@@ -159,10 +406,47 @@ class ExportUnityFbx(Operator, ExportHelper):
 		row.label(text="Secondary", icon='AXIS_SIDE')
 		row.prop(self, "secondary_bone_axis", text="")
 
+		layout.separator()
+
+		layout.prop(self, "write_report", text="Write Report", icon='TEXT')
+
 
 
 	def execute(self, context):
-		return export_unity_fbx(context,
+		result = self.export_direct(context)
+		if result is not None:
+			return result
+
+		return self.report_result(export.run_steps(self.get_export_steps(context)))
+
+	def export_direct(self, context):
+		# Returns None when the export must use the default engine
+		if self.export_engine != 'DIRECT':
+			return None
+
+		reason = export.get_direct_fallback_reason({name: getattr(self, name) for name in export.DIRECT_UNSUPPORTED_OPTIONS})
+		if reason:
+			self.report({'WARNING'}, "Non-destructive export %s. Using Modify Scene." % reason)
+			return None
+
+		result = export_unity_fbx_direct(context,
+                                    self.filepath,
+                                    self.active_collection,
+                                    self.selected_objects,
+                                    self.export_collections_as_empties,
+                                    self.include_custom_properties,
+                                    self.tangent_space,
+                                    self.triangulate_faces,
+                                    write_report=self.write_report,
+                                    write_if_changed=self.write_if_changed
+				)
+		if result is not None:
+			return self.report_result(result)
+		return None
+
+	def get_export_steps(self, context):
+		# Export with the default engine, step by step (see export.export_unity_fbx_steps)
+		return export.export_unity_fbx_steps(context,
                           self.filepath,
                           self.active_collection,
                           self.selected_objects,
@@ -173,19 +457,134 @@ class ExportUnityFbx(Operator, ExportHelper):
                           self.deform_bones,
                           self.leaf_bones,
                           self.primary_bone_axis,
-                          self.secondary_bone_axis
+                          self.secondary_bone_axis,
+                          keep_shared_data=self.keep_shared_data,
+                          batch_mode=self.batch_mode,
+                          batch_pattern=self.batch_pattern,
+                          incremental=self.incremental,
+                          write_report=self.write_report,
+                          instanced_collections=self.instanced_collections,
+                          chunk_mode=self.chunk_mode,
+                          chunk_vertex_budget=self.chunk_vertex_budget,
+                          reduce_keyframes=self.reduce_keyframes,
+                          position_tolerance=self.position_tolerance,
+                          rotation_tolerance=self.rotation_tolerance,
+                          scale_tolerance=self.scale_tolerance,
+                          optimize_meshes=self.optimize_meshes,
+                          weld_distance=self.weld_distance,
+                          generate_lods=self.generate_lods,
+                          lod_ratios=self.lod_ratios,
+                          merge_meshes=self.merge_meshes,
+                          merge_by_material=self.merge_by_material,
+                          merge_vertex_cap=self.merge_vertex_cap,
+                          merge_exclude_property=self.merge_exclude_property,
+                          write_if_changed=self.write_if_changed,
+                          export_textures=self.export_textures,
+                          texture_folder=self.texture_folder,
+                          texture_max_size=self.texture_max_size
 					)
-  
+
+	def report_result(self, result):
+		# Exports always finish so undo is handled properly. Errors are reported instead.
+		if export.last_error:
+			self.report({'ERROR'}, "File not saved: " + export.last_error)
+		elif self.export_textures and textures.last_result:
+			self.report({'INFO'}, "Textures: %d unique files, %d KB saved" % (textures.last_result["unique"], textures.last_result["bytes_saved"] // 1024))
+		return result
+
+class ExportUnityFbxModal(ExportUnityFbx):
+	"""FBX exporter compatible with Unity's coordinate and scaling system. Runs in steps keeping Blender responsive, press Esc to cancel"""
+	bl_idname = "export_scene.unity_fbx_modal"
+	bl_label = "Export Unity FBX (Modal)"
+
+	# Seconds between steps, and seconds of work done in each step
+	TIMER_INTERVAL = 0.01
+	TIME_SLICE = 0.1
+
+	# Events passed to Blender while exporting: viewport navigation and window updates.
+	# Everything else (editing, undo, mode switches, file operations, clicks) is consumed,
+	# as the scene is half-prepared and the journal holds references to its datablocks.
+	PASS_THROUGH_EVENTS = {
+		'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'MIDDLEMOUSE',
+		'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEROTATE', 'MOUSESMARTZOOM', 'NDOF_MOTION',
+		'WINDOW_DEACTIVATE', 'TIMER_JOBS', 'TIMER_REPORT', 'TIMERREGION',
+	}
+
+	def execute(self, context):
+		result = self.export_direct(context)
+		if result is not None:
+			return result
+
+		self.steps = self.get_export_steps(context)
+		self.step = "Starting"
+		self.start = time.perf_counter()
+		self.timer = context.window_manager.event_timer_add(self.TIMER_INTERVAL, window=context.window)
+		context.window_manager.modal_handler_add(self)
+		self.update_status(context)
+		return {'RUNNING_MODAL'}
+
+	def modal(self, context, event):
+		# Cancelling restores the scene through the journal. Files already written are kept.
+		if event.type == 'ESC' and event.value == 'PRESS':
+			self.steps.close()
+			self.finish(context)
+			self.report({'WARNING'}, "Export cancelled")
+			return {'CANCELLED'}
+
+		if event.type != 'TIMER':
+			return {'PASS_THROUGH'} if event.type in self.PASS_THROUGH_EVENTS else {'RUNNING_MODAL'}
+
+		# Run steps for a time slice, then give control back to Blender
+		deadline = time.perf_counter() + self.TIME_SLICE
+		try:
+			while time.perf_counter() < deadline:
+				self.step = next(self.steps)
+		except StopIteration as result:
+			self.finish(context)
+			return self.report_result(result.value)
+		except Exception:
+			self.finish(context)
+			raise
+
+		self.update_status(context)
+		return {'RUNNING_MODAL'}
+
+	def cancel(self, context):
+		# The operator was ended by Blender (loading a file, closing the window...). When a
+		# file was loaded the journal has already been discarded, so nothing is restored.
+		self.steps.close()
+		self.finish(context)
+
+	def update_status(self, context):
+		context.workspace.status_text_set("Exporting Unity FBX: %s (%ds). Press Esc to cancel" % (self.step, time.perf_counter() - self.start))
+
+	def finish(self, context):
+		context.window_manager.event_timer_remove(self.timer)
+		context.workspace.status_text_set(None)
+
+@persistent
+def on_load_pre(filepath):
+	# Loading a file frees the datablocks of a modal export in progress before cancelling it
+	if export.running:
+		journal.discard()
+
 def menu_func_export(self, context):
 	self.layout.operator(ExportUnityFbx.bl_idname, text="Unity FBX (.fbx)")
+	self.layout.operator(ExportUnityFbxModal.bl_idname, text="Unity FBX, Modal (.fbx)")
   
 def register():
 	bpy.utils.register_class(ExportUnityFbx)
+	bpy.utils.register_class(ExportUnityFbxModal)
 	bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+	bpy.app.handlers.load_pre.append(on_load_pre)
 
 def unregister():
+	bpy.utils.unregister_class(ExportUnityFbxModal)
 	bpy.utils.unregister_class(ExportUnityFbx)
 	bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+	if on_load_pre in bpy.app.handlers.load_pre:
+		bpy.app.handlers.load_pre.remove(on_load_pre)
  
 def reload():
     bpy.utils.register_class(ExportUnityFbx)
+    bpy.utils.register_class(ExportUnityFbxModal)
@@ -0,0 +1,16 @@
+import hashlib
+
+# Texture file identity and size.
+# Images are written once per content and output size. Doesn't depend on bpy.
+
+
+def get_output_size(width, height, max_size):
+	# Size after applying the resolution cap, keeping the aspect ratio (0 for no cap)
+	scale = min(1.0, max_size / max(width, height)) if max_size else 1.0
+	return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_file_key(data, size):
+	# Images with the same file contents (or pixels) and output size share a file.
+	# Returns (content hash, size).
+	return hashlib.sha1(data).hexdigest(), tuple(size)
@@ -0,0 +1,143 @@
+import bpy
+import numpy as np
+import os
+
+from . import instrumentation
+from . import journal
+from . import mesh_optimization
+from . import texture_files
+from .instrumentation import logger
+
+# Texture export.
+# Images used by the materials of the exported objects are written once to a shared folder,
+# and the FBX files reference them there with relative paths. Images are identified by their
+# content, so copies of the same texture in different files, or packed in the .blend file,
+# are written only once, also across all the files of a batch. Images larger than the
+# resolution cap are downscaled.
+# File names include the content hash, so files already in the folder are kept as they are
+# and Unity doesn't import them again.
+# Images linked from libraries can't be pointed to the folder: they're skipped and keep
+# their original path.
+
+# Extension of the formats downscaled images can be saved in
+FILE_EXTENSIONS = {'PNG': ".png", 'JPEG': ".jpg", 'TARGA': ".tga", 'TIFF': ".tif", 'OPEN_EXR': ".exr", 'BMP': ".bmp", 'HDR': ".hdr"}
+
+# Texture files written in the current export, by (content hash, size)
+written = dict()
+
+# Result of the last texture export, available to scripts
+last_result = dict()
+
+
+def begin():
+	global written
+	global last_result
+
+	written = dict()
+	last_result = dict(images=0, unique=0, downscaled=0, linked=0, bytes_referenced=0, bytes_written=0, bytes_saved=0)
+
+
+def get_images(objects):
+	materials = set(slot.material for ob in objects for slot in ob.material_slots if slot.material)
+	images = set()
+	for tree in mesh_optimization.get_node_trees(materials):
+		for node in tree.nodes:
+			if node.type in {'TEX_IMAGE', 'TEX_ENVIRONMENT'} and node.image and node.image.source in {'FILE', 'GENERATED'}:
+				images.add(node.image)
+	return images
+
+
+def get_file_data(image):
+	# Contents of the image file, packed or on disk. None for generated images and images
+	# with unsaved changes (texture painting), whose pixels are exported instead.
+	if image.is_dirty:
+		return None
+	if image.packed_file:
+		return bytes(image.packed_file.data)
+	path = bpy.path.abspath(image.filepath, library=image.library)
+	if image.source == 'FILE' and os.path.isfile(path):
+		with open(path, "rb") as f:
+			return f.read()
+	return None
+
+
+def get_pixels(image):
+	pixels = np.empty(len(image.pixels), dtype=np.float32)
+	image.pixels.foreach_get(pixels)
+	return pixels
+
+
+def save_image(image, filepath, file_format, width, height):
+	# Save the pixels of the image at the given size. The pixels, including unsaved changes,
+	# are copied to a new image, so packed images can be saved too and no color management
+	# is applied.
+	output = bpy.data.images.new(os.path.basename(filepath), image.size[0], image.size[1], alpha=True, float_buffer=image.is_float)
+	try:
+		# Changing the color space frees the pixels of generated images, so it's set first
+		output.colorspace_settings.name = image.colorspace_settings.name
+		output.pixels.foreach_set(get_pixels(image))
+		if tuple(output.size) != (width, height):
+			output.scale(width, height)
+		output.filepath_raw = filepath
+		output.file_format = file_format
+		output.save()
+	finally:
+		bpy.data.images.remove(output)
+
+
+def export_textures(objects, directory, max_size):
+	# Write the images of the given objects to the directory and point them there
+	images = get_images(objects)
+	os.makedirs(directory, exist_ok=True)
+	bytes_saved = last_result["bytes_saved"]
+
+	for image in images:
+		if image.library:
+			logger.warning("Image %s is linked from %s, not exported", image.name, image.library.filepath)
+			last_result["linked"] += 1
+			continue
+
+		data = get_file_data(image)
+		width, height = image.size
+		if not width or not height:
+			logger.warning("Image %s has no data, not exported", image.name)
+			continue
+
+		size = texture_files.get_output_size(width, height, max_size)
+		downscaled = size != (width, height)
+		key = texture_files.get_file_key(data if data is not None else get_pixels(image).tobytes(), size)
+		digest = key[0]
+
+		filepath = written.get(key)
+		if filepath is None:
+			name = bpy.path.clean_name(os.path.splitext(image.name)[0])
+			if data is not None and not downscaled:
+				# Original file as it is
+				extension = os.path.splitext(image.filepath)[1].lower() or FILE_EXTENSIONS.get(image.file_format, ".png")
+				filepath = os.path.join(directory, "%s_%s%s" % (name, digest[:8], extension))
+				if not os.path.exists(filepath):
+					with open(filepath, "wb") as f:
+						f.write(data)
+			else:
+				file_format = image.file_format if image.file_format in FILE_EXTENSIONS else 'PNG'
+				filepath = os.path.join(directory, "%s_%s_%dx%d%s" % (name, digest[:8], size[0], size[1], FILE_EXTENSIONS[file_format]))
+				if not os.path.exists(filepath):
+					save_image(image, filepath, file_format, *size)
+				if downscaled:
+					last_result["downscaled"] += 1
+
+			written[key] = filepath
+			last_result["unique"] += 1
+			last_result["bytes_written"] += os.path.getsize(filepath)
+
+		last_result["images"] += 1
+		last_result["bytes_referenced"] += len(data) if data is not None else os.path.getsize(filepath)
+		# filepath_raw doesn't reload the image, so unsaved pixels are kept
+		journal.set_attribute(image, "filepath_raw", filepath)
+
+	last_result["bytes_saved"] = last_result["bytes_referenced"] - last_result["bytes_written"]
+
+	instrumentation.count("textures", len(images))
+	instrumentation.count("texture_bytes_saved", last_result["bytes_saved"] - bytes_saved)
+	logger.info("Textures: %d images, %d unique files (%d downscaled), %d KB saved",
+		last_result["images"], last_result["unique"], last_result["downscaled"], last_result["bytes_saved"] // 1024)
@@ -0,0 +1,64 @@
+# Triangle order for the post-transform vertex cache.
+# Triangles are given as tuples of vertex indices. Doesn't depend on bpy.
+
+VERTEX_CACHE_SIZE = 16
+
+
+def get_tipsify_order(triangles, vertex_count, cache_size=VERTEX_CACHE_SIZE):
+	# Tipsify (Sander, Nehab and Barczak, 2007): triangles are emitted fanning around vertices
+	# that are still in the simulated cache. Returns the new order of the triangles.
+	if not triangles:
+		return []
+
+	adjacency = [[] for i in range(vertex_count)]
+	for t, triangle in enumerate(triangles):
+		for v in triangle:
+			adjacency[v].append(t)
+
+	live = [len(faces) for faces in adjacency]
+	cache_time = [0] * vertex_count
+	emitted = [False] * len(triangles)
+	dead_end = []
+	order = []
+	time = cache_size + 1
+	cursor = 0
+	fanning = 0
+
+	while fanning >= 0:
+		candidates = []
+		for t in adjacency[fanning]:
+			if emitted[t]:
+				continue
+			for v in triangles[t]:
+				dead_end.append(v)
+				candidates.append(v)
+				live[v] -= 1
+				if time - cache_time[v] > cache_size:
+					cache_time[v] = time
+					time += 1
+			emitted[t] = True
+			order.append(t)
+
+		# Next fanning vertex: the candidate staying longest in the cache after its fan
+		fanning = -1
+		best = -1
+		for v in candidates:
+			if live[v]:
+				priority = time - cache_time[v] if time - cache_time[v] + 2 * live[v] <= cache_size else 0
+				if priority > best:
+					best = priority
+					fanning = v
+
+		if fanning < 0:
+			# Dead end: recently used vertices first, then any vertex with triangles left
+			while dead_end:
+				v = dead_end.pop()
+				if live[v]:
+					fanning = v
+					break
+			while fanning < 0 and cursor < vertex_count:
+				if live[cursor]:
+					fanning = cursor
+				cursor += 1
+
+	return order
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Client for the warm export server (export_server.py).
+#
+#   python export_client.py jobs.json --start 4 --report report.json
+#
+# The jobs file is a JSON list of {"file": ..., "output": ..., "options": {...}} objects.
+# Jobs are distributed among the servers listening on the given ports, which are launched
+# first with --start. Jobs on the same .blend file go to the same server one after another,
+# so the file is loaded only once.
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "export_server.py")
+
+class Connection:
+    def __init__(self, host, port, timeout=None):
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.socket.makefile("rwb")
+
+    def request(self, request):
+        self.file.write((json.dumps(request) + "\n").encode())
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the export server")
+        return json.loads(line)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+def start_servers(blender, host, ports, timeout):
+    processes = [subprocess.Popen([blender, "--background", "--factory-startup", "--python", SERVER_SCRIPT, "--", "--host", host, "--port", str(port)],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for port in ports]
+
+    # Wait until every server answers
+    deadline = time.monotonic() + timeout
+    for port, process in zip(ports, processes):
+        while True:
+            try:
+                connection = Connection(host, port, timeout=5)
+                connection.request(dict(command="ping"))
+                connection.close()
+                break
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError("Export server on port %d exited with code %s" % (port, process.returncode))
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Export server on port %d didn't start" % port)
+                time.sleep(0.2)
+    return processes
+
+def distribute_jobs(jobs, count):
+    # Group the jobs by file and give each server about the same number of jobs
+    groups = dict()
+    for job in jobs:
+        groups.setdefault(os.path.realpath(job["file"]), []).append(job)
+
+    queues = [[] for i in range(count)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(queues, key=len).extend(group)
+    return queues
+
+def run_queue(host, port, jobs):
+    results = []
+    try:
+        connection = Connection(host, port)
+    except OSError as e:
+        return [dict(file=job["file"], filepath=job["output"], status="failed", error=str(e)) for job in jobs]
+
+    try:
+        for job in jobs:
+            try:
+                result = connection.request(dict(job, command="export"))
+            except (OSError, ValueError) as e:
+                result = dict(file=job["file"], filepath=job["output"], status="failed", error=str(e))
+            result["port"] = port
+            results.append(result)
+            print(f"[{result['status']}] {job['file']} -> {job['output']} ({result.get('job_seconds', 0):.2f}s{', cached' if result.get('cached') else ''})" + (f": {result['error']}" if result.get("error") else ""))
+    finally:
+        connection.close()
+    return results
+
+def load_jobs(path):
+    if path == "-":
+        return json.load(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def main(args):
+    ports = args.port or [8765]
+    if args.start:
+        ports = list(range(ports[0], ports[0] + args.start))
+
+    processes = []
+    if args.start:
+        processes = start_servers(args.blender, args.host, ports, args.startup_timeout)
+
+    try:
+        jobs = load_jobs(args.jobs) if args.jobs else []
+        start = time.perf_counter()
+
+        results = []
+        if jobs:
+            queues = distribute_jobs(jobs, len(ports))
+            with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+                for queue_results in executor.map(run_queue, [args.host] * len(ports), ports, queues):
+                    results.extend(queue_results)
+
+        failed = [result for result in results if result["status"] != "ok"]
+        report = dict(
+            jobs=len(results),
+            failed=len(failed),
+            servers=len(ports),
+            seconds=time.perf_counter() - start,
+            results=results,
+        )
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=1)
+
+        if jobs:
+            print(f"Exported {len(results) - len(failed)} of {len(results)} jobs in {report['seconds']:.2f}s")
+    finally:
+        # Servers started here are always stopped. Others only when asked to.
+        if args.start or args.shutdown:
+            for port in ports:
+                try:
+                    connection = Connection(args.host, port, timeout=5)
+                    connection.request(dict(command="shutdown"))
+                    connection.close()
+                except OSError:
+                    pass
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return 1 if failed else 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Submit Unity FBX export jobs to warm export servers.")
+    parser.add_argument("jobs", nargs="?", help="JSON file with the list of jobs, or - for stdin")
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the export servers")
+    parser.add_argument("--port", type=int, action="append", help="Port of an export server (can be repeated). Default: 8765")
+    parser.add_argument("--start", type=int, default=0, help="Start this many export servers on consecutive ports and stop them when done")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable for --start")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="Maximum seconds to wait for the servers to start")
+    parser.add_argument("--report", help="Write the per-job results and timings to this JSON file")
+    parser.add_argument("--shutdown", action="store_true", help="Stop the servers after the jobs")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args(sys.argv[1:])))
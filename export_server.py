@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import time
+
+# Warm export server.
+#
+# Runs inside Blender and exports .blend files on request, so Blender startup and add-on
+# loading are paid only once for many exports:
+#
+#   blender --background --factory-startup --python export_server.py -- --port 8765
+#
+# Listens on localhost for newline-delimited JSON requests, one response line per request:
+#
+#   {"file": "props/crate.blend", "output": "exported/crate.fbx", "options": {...}}
+#   {"command": "ping"} / {"command": "stats"} / {"command": "shutdown"}
+#
+# Options use the names of the Export Unity FBX operator properties (see
+# blender_to_unity_fbx_exporter/headless.py). The loaded file is kept between jobs: the
+# export restores the scene, so consecutive jobs on the same unmodified file skip loading it.
+# See export_client.py for submitting jobs.
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+
+import bpy
+from blender_to_unity_fbx_exporter import headless
+
+loaded_file = dict(path=None, mtime=None)
+stats = dict(jobs=0, failed=0, loads=0, cache_hits=0, started=time.time())
+running = True
+
+def load_file(path):
+    # Returns True when the file was already loaded
+    path = os.path.realpath(path)
+    mtime = os.path.getmtime(path)
+    if loaded_file["path"] == path and loaded_file["mtime"] == mtime:
+        stats["cache_hits"] += 1
+        return True
+
+    # Forget the file first, so it's loaded again if loading fails halfway
+    loaded_file.update(path=None, mtime=None)
+    bpy.ops.wm.open_mainfile(filepath=path, load_ui=False)
+    loaded_file.update(path=path, mtime=mtime)
+    stats["loads"] += 1
+    return False
+
+def run_job(job):
+    start = time.perf_counter()
+    result = dict(file=job.get("file"), filepath=job.get("output"), status="failed", error=None)
+
+    try:
+        cached = load_file(job["file"])
+        load_seconds = time.perf_counter() - start
+
+        output = os.path.realpath(job["output"])
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        result.update(headless.export_file(output, job.get("options")))
+        result.update(cached=cached, load_seconds=load_seconds)
+
+        # A failed export may leave the scene partially restored. Load it again next time.
+        if result["status"] != "ok":
+            loaded_file.update(path=None, mtime=None)
+    except Exception as e:
+        result["error"] = str(e)
+        loaded_file.update(path=None, mtime=None)
+
+    result["job_seconds"] = time.perf_counter() - start
+    stats["jobs"] += 1
+    if result["status"] != "ok":
+        stats["failed"] += 1
+    return result
+
+def handle_request(request):
+    global running
+
+    command = request.get("command", "export")
+    if command == "export":
+        return run_job(request)
+    if command == "ping":
+        return dict(status="ok", blender_version=bpy.app.version_string)
+    if command == "stats":
+        return dict(status="ok", loaded_file=loaded_file["path"], uptime_seconds=time.time() - stats["started"], **{key: value for key, value in stats.items() if key != "started"})
+    if command == "shutdown":
+        running = False
+        return dict(status="ok")
+    return dict(status="failed", error="Unknown command: %s" % command)
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    # A connection may send any number of requests. Connections are served one at a time:
+    # bpy must be used from the main thread.
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = handle_request(json.loads(line))
+            except ValueError as e:
+                response = dict(status="failed", error="Invalid request: %s" % e)
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+            if not running:
+                break
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Serve Unity FBX export jobs from a running Blender process.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    # Inside Blender the script arguments come after "--"
+    args = parse_args(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer((args.host, args.port), RequestHandler) as server:
+        print(f"Export server listening on {args.host}:{args.port}", flush=True)
+        while running:
+            server.handle_request()
@@ -0,0 +1,23 @@
+import bpy
+import os
+import sys
+
+# Run inside Blender by test_direct_export.py:
+#
+#   blender --background --factory-startup file.blend --python tests/export_engines.py -- output/
+#
+# Exports the loaded file with the default engine and with the non-destructive engine, to
+# output/<name>.scene.fbx and output/<name>.direct.fbx.
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from blender_to_unity_fbx_exporter import headless
+
+output = sys.argv[sys.argv.index("--") + 1]
+name = os.path.splitext(os.path.basename(bpy.data.filepath))[0]
+
+for engine in ('SCENE', 'DIRECT'):
+    result = headless.export_file(os.path.join(output, "%s.%s.fbx" % (name, engine.lower())), dict(export_engine=engine))
+    if result["error"]:
+        print("%s export failed: %s" % (engine, result["error"]))
+        sys.exit(1)
@@ -0,0 +1,62 @@
+import glob
+import math
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from blender_to_unity_fbx_exporter import fbx_reader
+
+# Output parity of the non-destructive engine with the default engine on the .blend
+# fixtures. Needs Blender: set BLENDER or add it to the path.
+
+TESTS = os.path.dirname(os.path.realpath(__file__))
+BLENDER = os.environ.get("BLENDER") or shutil.which("blender")
+FIXTURES = sorted(glob.glob(os.path.join(TESTS, "*.blend")))
+
+pytestmark = pytest.mark.skipif(not BLENDER, reason="Blender not found")
+
+
+def euler_matrix(degrees):
+    # FBX Lcl Rotation, XYZ order
+    x, y, z = (math.radians(angle) for angle in degrees)
+    rx = np.array([[1, 0, 0], [0, math.cos(x), -math.sin(x)], [0, math.sin(x), math.cos(x)]])
+    ry = np.array([[math.cos(y), 0, math.sin(y)], [0, 1, 0], [-math.sin(y), 0, math.cos(y)]])
+    rz = np.array([[math.cos(z), -math.sin(z), 0], [math.sin(z), math.cos(z), 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+def sorted_vertices(vertices):
+    # Vertex order doesn't have to match, only the positions
+    return vertices[np.lexsort(vertices.T[::-1])]
+
+
+@pytest.mark.parametrize("fixture", FIXTURES, ids=os.path.basename)
+def test_direct_export_matches_default(fixture, tmp_path):
+    subprocess.run([BLENDER, "--background", "--factory-startup", fixture,
+                    "--python", os.path.join(TESTS, "export_engines.py"), "--", str(tmp_path)],
+                   check=True, timeout=600, stdout=subprocess.DEVNULL)
+
+    name = os.path.splitext(os.path.basename(fixture))[0]
+    version, scene_nodes = fbx_reader.read(str(tmp_path / (name + ".scene.fbx")))
+    version, direct_nodes = fbx_reader.read(str(tmp_path / (name + ".direct.fbx")))
+
+    scene_models = fbx_reader.get_models(scene_nodes)
+    direct_models = fbx_reader.get_models(direct_nodes)
+    assert set(direct_models) == set(scene_models)
+    for model, scene in scene_models.items():
+        direct = direct_models[model]
+        np.testing.assert_allclose(direct.get("Lcl Translation", (0, 0, 0)), scene.get("Lcl Translation", (0, 0, 0)), atol=1e-4, err_msg=model)
+        np.testing.assert_allclose(euler_matrix(direct.get("Lcl Rotation", (0, 0, 0))), euler_matrix(scene.get("Lcl Rotation", (0, 0, 0))), atol=1e-4, err_msg=model)
+        np.testing.assert_allclose(direct.get("Lcl Scaling", (1, 1, 1)), scene.get("Lcl Scaling", (1, 1, 1)), atol=1e-4, err_msg=model)
+
+    scene_geometry = sorted((sorted_vertices(v) for v in fbx_reader.get_geometry_vertices(scene_nodes).values()), key=lambda v: (len(v), v.sum()))
+    direct_geometry = sorted((sorted_vertices(v) for v in fbx_reader.get_geometry_vertices(direct_nodes).values()), key=lambda v: (len(v), v.sum()))
+    assert len(direct_geometry) == len(scene_geometry)
+    for direct, scene in zip(direct_geometry, scene_geometry):
+        np.testing.assert_allclose(direct, scene, atol=1e-4)
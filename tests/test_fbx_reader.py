@@ -0,0 +1,72 @@
+import os
+import struct
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from blender_to_unity_fbx_exporter import fbx_reader
+
+FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "export collections.fbx")
+
+
+def write_modified(tmp_path, name, old, new):
+    # Copy of the fixture with a value replaced by another of the same size, so every
+    # node offset stays valid
+    with open(FIXTURE, "rb") as f:
+        data = f.read()
+    assert len(old) == len(new) and data.count(old) == 1
+    path = tmp_path / name
+    path.write_bytes(data.replace(old, new))
+    return str(path)
+
+
+def test_read_fixture():
+    version, nodes = fbx_reader.read(FIXTURE)
+    assert version == 7400
+    assert [node.name for node in nodes][-3:] == ["Objects", "Connections", "Takes"]
+
+    vertices = fbx_reader.get_geometry_vertices(nodes)
+    assert set(vertices) == {"Cube.002", "Cube.003"}
+    assert all(v.shape == (8, 3) for v in vertices.values())
+
+
+def test_rotation_fix():
+    # Objects without rotation in Blender are written without rotation, so Unity doesn't
+    # import them with the -89.98 X rotation
+    version, nodes = fbx_reader.read(FIXTURE)
+    models = fbx_reader.get_models(nodes)
+    assert set(models) == {"Cube.002", "Cube.003"}
+    for name in ("Cube.002", "Cube.003"):
+        np.testing.assert_allclose(models[name]["Lcl Rotation"], (0.0, 0.0, 0.0), atol=1e-3)
+    np.testing.assert_allclose(models["Cube.002"]["Lcl Translation"], (11.164954, 0.0, 0.0), atol=1e-5)
+
+
+def test_not_fbx():
+    with pytest.raises(ValueError):
+        fbx_reader.parse(b"; FBX 7.4.0 project file")
+
+
+def test_files_equal_itself():
+    assert fbx_reader.files_equal(FIXTURE, FIXTURE)
+
+
+def test_files_equal_creation_time(tmp_path):
+    path = write_modified(tmp_path, "time.fbx", b"1970-01-01 10:00:00:000", b"2024-05-06 11:22:33:444")
+    assert fbx_reader.files_equal(FIXTURE, path)
+
+
+def test_files_different_translation(tmp_path):
+    version, nodes = fbx_reader.read(FIXTURE)
+    x = fbx_reader.get_models(nodes)["Cube.002"]["Lcl Translation"][0]
+    path = write_modified(tmp_path, "translation.fbx", struct.pack("<d", x), struct.pack("<d", x + 1.0))
+    assert not fbx_reader.files_equal(FIXTURE, path)
+
+
+def test_files_different_unreadable(tmp_path):
+    path = tmp_path / "broken.fbx"
+    path.write_bytes(b"not an fbx file")
+    assert not fbx_reader.files_equal(FIXTURE, str(path))
+    assert not fbx_reader.files_equal(FIXTURE, str(tmp_path / "missing.fbx"))
@@ -0,0 +1,179 @@
+import math
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from blender_to_unity_fbx_exporter import hierarchy
+
+# X+90 rotation received by the converted objects (see export.MATRIX_X_PLUS_90)
+X_PLUS_90 = np.array([
+    [1.0, 0.0, 0.0, 0.0],
+    [0.0, math.cos(math.pi / 2), -math.sin(math.pi / 2), 0.0],
+    [0.0, math.sin(math.pi / 2), math.cos(math.pi / 2), 0.0],
+    [0.0, 0.0, 0.0, 1.0],
+])
+
+
+def random_hierarchy(rng, count):
+    # Parents are random objects (or none), in any order, without cycles
+    order = rng.permutation(count)
+    parents = np.full(count, -1)
+    for i in range(1, count):
+        if rng.random() < 0.8:
+            parents[order[i]] = order[rng.integers(0, i)]
+    return parents
+
+
+def random_world_matrices(rng, count):
+    # Rotation, non-uniform scale and translation
+    q, r = np.linalg.qr(rng.normal(size=(count, 3, 3)))
+    world = np.broadcast_to(np.identity(4), (count, 4, 4)).copy()
+    world[:, :3, :3] = q * rng.uniform(0.5, 2.0, size=(count, 1, 3))
+    world[:, :3, 3] = rng.uniform(-10.0, 10.0, size=(count, 3))
+    return world
+
+
+def test_flat_round_trip():
+    rng = np.random.default_rng(0)
+    matrices = random_world_matrices(rng, 5)
+    flat = hierarchy.to_flat(matrices, np.float64)
+    np.testing.assert_array_equal(hierarchy.from_flat(flat), matrices)
+    # Column-major, like foreach_get: the translation is the last column
+    np.testing.assert_array_equal(flat.reshape(-1, 4, 4)[:, 3, :3], matrices[:, :3, 3])
+
+
+def test_local_matrices():
+    rng = np.random.default_rng(1)
+    world = random_world_matrices(rng, 20)
+    parents = random_hierarchy(rng, 20)
+    local = hierarchy.get_local_matrices(world, parents)
+    for i, parent in enumerate(parents):
+        parent_world = world[parent] if parent >= 0 else np.identity(4)
+        np.testing.assert_allclose(parent_world @ local[i], world[i], atol=1e-9)
+
+
+X_MINUS_90 = np.linalg.inv(X_PLUS_90)
+
+
+class ReferenceScene:
+    # The per-object conversion the exporter did before the bulk version, simulated with
+    # NumPy: world = parent world @ parent inverse @ basis
+
+    def __init__(self, parents, parent_inverse, basis):
+        self.parents = parents
+        self.parent_inverse = parent_inverse.copy()
+        self.basis = basis.copy()
+        self.data = np.broadcast_to(np.identity(4), basis.shape).copy()
+
+    def world(self, i):
+        parent = self.parents[i]
+        if parent < 0:
+            return self.basis[i]
+        return self.world(parent) @ self.parent_inverse[i] @ self.basis[i]
+
+    def local(self, i):
+        return self.parent_inverse[i] @ self.basis[i] if self.parents[i] >= 0 else self.basis[i]
+
+    def set_local(self, i, matrix):
+        self.basis[i] = np.linalg.inv(self.parent_inverse[i]) @ matrix if self.parents[i] >= 0 else matrix
+
+    def children(self, i):
+        return [j for j in range(len(self.parents)) if self.parents[j] == i]
+
+    def reset_parent_inverse(self, i):
+        if self.parents[i] >= 0:
+            world = self.world(i)
+            self.parent_inverse[i] = np.identity(4)
+            self.basis[i] = np.linalg.inv(self.world(self.parents[i])) @ world
+
+    def apply_rotation(self, i):
+        # transform_apply on a basis that is a pure rotation: the rotation goes to the data
+        # and the children keep their world matrix (their basis becomes their world matrix,
+        # and their parent inverse the inverse of the new parent world matrix)
+        children = {j: self.world(j) for j in self.children(i)}
+        self.data[i] = self.basis[i] @ self.data[i]
+        self.basis[i] = np.identity(4)
+        for j, world in children.items():
+            self.basis[j] = world
+            self.parent_inverse[j] = np.linalg.inv(self.world(i))
+
+    def fix_object(self, i, converted):
+        if converted[i]:
+            self.reset_parent_inverse(i)
+            original = self.local(i).copy()
+            self.set_local(i, X_MINUS_90)
+            self.apply_rotation(i)
+            self.set_local(i, original @ X_PLUS_90)
+        for j in self.children(i):
+            self.fix_object(j, converted)
+
+
+def test_converted_matrices():
+    # Bulk conversion against the per-object reference, with parent inverses
+    rng = np.random.default_rng(2)
+    for count in (1, 2, 10, 60):
+        parents = random_hierarchy(rng, count)
+        parent_inverse = random_world_matrices(rng, count)
+        basis = random_world_matrices(rng, count)
+        converted = rng.random(count) < 0.7
+
+        scene = ReferenceScene(parents, parent_inverse, basis)
+        world = np.array([scene.world(i) for i in range(count)])
+        for i in range(count):
+            if parents[i] < 0:
+                scene.fix_object(i, converted)
+
+        local = hierarchy.get_converted_matrices(world, parents, converted, X_PLUS_90)
+
+        for i in range(count):
+            np.testing.assert_allclose(local[i], scene.local(i), atol=1e-8)
+            # The data received X-90 and the object keeps its visual pose
+            np.testing.assert_allclose(scene.data[i], X_MINUS_90 if converted[i] else np.identity(4), atol=1e-9)
+            np.testing.assert_allclose(scene.world(i) @ scene.data[i], world[i], atol=1e-8)
+
+
+def test_converted_world_pose():
+    # The converted objects keep their visual pose once their geometry receives X-90
+    rng = np.random.default_rng(3)
+    world = random_world_matrices(rng, 30)
+    parents = random_hierarchy(rng, 30)
+    converted = np.ones(30, dtype=bool)
+
+    local = hierarchy.get_converted_matrices(world, parents, converted, X_PLUS_90)
+
+    converted_world = [None] * 30
+    pending = [i for i in range(30) if parents[i] < 0]
+    while pending:
+        i = pending.pop()
+        parent = parents[i]
+        converted_world[i] = (converted_world[parent] if parent >= 0 else np.identity(4)) @ local[i]
+        pending.extend(j for j in range(30) if parents[j] == i)
+
+    for i in range(30):
+        np.testing.assert_allclose(converted_world[i] @ np.linalg.inv(X_PLUS_90), world[i], atol=1e-9)
+
+
+def test_bone_parented_matrices():
+    # Child parented to a bone of a converted armature: world = armature @ bone @ parent
+    # inverse @ basis. The armature receives X+90 and its bones X-90, so the bone frame
+    # keeps its world matrix and the child must still end up at world @ X+90.
+    rng = np.random.default_rng(4)
+    armature, bone, parent_inverse, basis = random_world_matrices(rng, 4)
+    world = np.array([armature, armature @ bone @ parent_inverse @ basis])
+    parents = np.array([-1, 0])
+    converted = np.array([True, True])
+
+    framed = np.array([False, True])
+    frames = np.empty_like(world)
+    frames[framed] = hierarchy.get_parent_frames(world[framed], parent_inverse[None], basis[None])
+    np.testing.assert_allclose(frames[1], armature @ bone, atol=1e-9)
+
+    local = hierarchy.get_converted_matrices(world, parents, converted, X_PLUS_90, frames, framed)
+
+    converted_armature = local[0]
+    converted_bone = np.linalg.inv(X_PLUS_90) @ bone
+    np.testing.assert_allclose(converted_armature, armature @ X_PLUS_90, atol=1e-9)
+    np.testing.assert_allclose(converted_armature @ converted_bone @ local[1], world[1] @ X_PLUS_90, atol=1e-9)
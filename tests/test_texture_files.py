@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from blender_to_unity_fbx_exporter import texture_files
+
+
+def test_output_size_without_cap():
+    assert texture_files.get_output_size(4096, 2048, 0) == (4096, 2048)
+    assert texture_files.get_output_size(300, 200, 512) == (300, 200)
+    assert texture_files.get_output_size(512, 512, 512) == (512, 512)
+
+
+def test_output_size_downscaled():
+    # The largest side is clamped and the aspect ratio kept
+    assert texture_files.get_output_size(4096, 2048, 1024) == (1024, 512)
+    assert texture_files.get_output_size(1000, 3000, 1024) == (341, 1024)
+    assert texture_files.get_output_size(1025, 1025, 1024) == (1024, 1024)
+
+
+def test_output_size_thin():
+    # Sides never go below one pixel
+    assert texture_files.get_output_size(8192, 1, 64) == (64, 1)
+    assert texture_files.get_output_size(2, 4096, 16) == (1, 16)
+
+
+def test_same_content_same_key():
+    # Copies of a file, or the same pixels, share a file whatever the image is called
+    data = bytes(range(256)) * 16
+    assert texture_files.get_file_key(data, (64, 64)) == texture_files.get_file_key(bytes(data), [64, 64])
+
+    pixels = np.linspace(0.0, 1.0, 4 * 8 * 8, dtype=np.float32)
+    assert texture_files.get_file_key(pixels.tobytes(), (8, 8)) == texture_files.get_file_key(pixels.copy().tobytes(), (8, 8))
+
+
+def test_different_key():
+    data = bytes(range(256))
+    key = texture_files.get_file_key(data, (64, 64))
+    # Different contents, or the same contents at another size
+    assert texture_files.get_file_key(data[::-1], (64, 64)) != key
+    assert texture_files.get_file_key(data, (32, 32)) != key
+    assert texture_files.get_file_key(data, (64, 64))[0] == key[0]
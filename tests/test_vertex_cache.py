@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from blender_to_unity_fbx_exporter import vertex_cache
+
+
+def grid_triangles(columns, rows):
+    # Two triangles per quad of a columns x rows grid, row by row
+    triangles = []
+    for y in range(rows):
+        for x in range(columns):
+            v = y * (columns + 1) + x
+            triangles.append((v, v + 1, v + columns + 2))
+            triangles.append((v, v + columns + 2, v + columns + 1))
+    return triangles, (columns + 1) * (rows + 1)
+
+
+def cache_misses(triangles, cache_size):
+    # FIFO post-transform cache, like the GPU's
+    cache = []
+    misses = 0
+    for triangle in triangles:
+        for v in triangle:
+            if v not in cache:
+                misses += 1
+                cache.append(v)
+                if len(cache) > cache_size:
+                    cache.pop(0)
+    return misses
+
+
+def test_empty():
+    assert vertex_cache.get_tipsify_order([], 0) == []
+    assert vertex_cache.get_tipsify_order([], 4) == []
+
+
+def test_single_triangle():
+    assert vertex_cache.get_tipsify_order([(0, 1, 2)], 3) == [0]
+
+
+def test_fan():
+    # Every triangle uses vertex 0, so Tipsify emits them all around it
+    triangles = [(0, 1, 2), (0, 2, 3), (0, 3, 4), (0, 4, 1)]
+    assert sorted(vertex_cache.get_tipsify_order(triangles, 5)) == [0, 1, 2, 3]
+
+
+def test_unused_vertices():
+    # Loose vertices and separate islands
+    triangles = [(5, 6, 7), (1, 2, 3), (7, 6, 8)]
+    assert sorted(vertex_cache.get_tipsify_order(triangles, 10)) == [0, 1, 2]
+
+
+def test_grid_order():
+    triangles, vertex_count = grid_triangles(40, 40)
+    order = vertex_cache.get_tipsify_order(triangles, vertex_count, cache_size=8)
+    assert sorted(order) == list(range(len(triangles)))
+
+    # Row by row, each row of vertices leaves the cache before it's used again
+    reordered = [triangles[t] for t in order]
+    assert cache_misses(reordered, 8) < cache_misses(triangles, 8)
@@ -10,12 +10,42 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 import blender_to_unity_fbx_exporter.properties as properties
 import blender_to_unity_fbx_exporter.export as export
 import blender_to_unity_fbx_exporter.collections_as_empties as collections_as_empties
+import blender_to_unity_fbx_exporter.instrumentation as instrumentation
+import blender_to_unity_fbx_exporter.animation as animation
+import blender_to_unity_fbx_exporter.hierarchy as hierarchy
+import blender_to_unity_fbx_exporter.journal as journal
+import blender_to_unity_fbx_exporter.manifest as manifest
+import blender_to_unity_fbx_exporter.fbx_reader as fbx_reader
+import blender_to_unity_fbx_exporter.vertex_cache as vertex_cache
+import blender_to_unity_fbx_exporter.mesh_optimization as mesh_optimization
+import blender_to_unity_fbx_exporter.lod as lod
+import blender_to_unity_fbx_exporter.merge as merge
+import blender_to_unity_fbx_exporter.texture_files as texture_files
+import blender_to_unity_fbx_exporter.textures as textures
+import blender_to_unity_fbx_exporter.direct_export as direct_export
+import blender_to_unity_fbx_exporter.headless as headless
+import blender_to_unity_fbx_exporter.auto_export as auto_export
 
 # Reload the modules (useful for debugging)
 
+importlib.reload(instrumentation)
+importlib.reload(hierarchy)
+importlib.reload(journal)
+importlib.reload(animation)
+importlib.reload(manifest)
+importlib.reload(fbx_reader)
+importlib.reload(vertex_cache)
+importlib.reload(mesh_optimization)
+importlib.reload(lod)
+importlib.reload(merge)
+importlib.reload(texture_files)
+importlib.reload(textures)
 importlib.reload(collections_as_empties)
 importlib.reload(properties)
 importlib.reload(export)
+importlib.reload(direct_export)
+importlib.reload(headless)
+importlib.reload(auto_export)
 
 # Register the add-on
 